@@ -38,9 +38,33 @@ FILE_DOWNLOAD_CHUNK_SIZE = 32768
 # Size of the chunks when downloading over http
 HTTP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Number of times an interrupted http download is resumed
+HTTP_DOWNLOAD_RESUMES = 5
+
 # Size of the chunks when downloading over scp
 SCP_DOWNLOAD_CHUNK_SIZE = 32768
 
+# Default size of the download cache: 10GB
+DOWNLOAD_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Default size of the extracted rootfs cache: 20GB
+ROOTFS_CACHE_SIZE = 20 * 1024 * 1024 * 1024
+
+# Default size of the git mirrors cache: 5GB
+GIT_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+# Console broker: sockets directory, size of the buffer kept for each device
+# and delay before restarting an exited connection command (in seconds)
+CONSOLE_BROKER_PATH = "/run/lava-dispatcher/console"
+CONSOLE_BUFFER_SIZE = 1024 * 1024
+CONSOLE_RECONNECT_DELAY = 5
+
+# udev event broker: socket, number of events kept in the history and maximum
+# age of these events (in seconds)
+UDEV_BROKER_SOCKET = "/run/lava-dispatcher/udev.sock"
+UDEV_HISTORY_SIZE = 1024
+UDEV_HISTORY_AGE = 300
+
 # dispatcher temporary directory
 # This is distinct from the TFTP daemon directory
 # Files here are for download using the Apache /tmp alias.
@@ -126,6 +150,9 @@ DEFAULT_TESTDEF_NAME_CLASS = r"^[\w\d\_\-]+$"
 # Limit repetitive messages
 METADATA_MESSAGE_LIMIT = 8192
 
+# Maximum length of the console lines in the logs, longer lines are split
+CONSOLE_LINE_MAX_LENGTH = 10000
+
 # Versatile Express autorun interrupt character
 VEXPRESS_AUTORUN_INTERRUPT_CHARACTER = " "
 
@@ -20,7 +20,10 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import functools
 import importlib
+import multiprocessing
+import yaml
 
 from voluptuous import (
     All,
@@ -39,6 +42,11 @@ from voluptuous import (
 
 from lava_common.timeout import Timeout
 
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
 
 CONTEXT_VARIABLES = [
     # qemu variables
@@ -86,18 +94,28 @@ CONTEXT_VARIABLES = [
 
 
 def validate_action(name, index, data, strict=True):
-    # Import the module
     try:
-        module = importlib.import_module("lava_common.schemas." + name)
-        Schema(module.schema(), extra=not strict)(data)
+        _action_schema(name, strict)(data)
     except ImportError:
         raise Invalid("unknown action type", path=["actions"] + name.split("."))
     except MultipleInvalid as exc:
         raise Invalid(exc.msg, path=["actions[%d]" % index] + name.split(".")) from exc
 
 
+@functools.lru_cache(maxsize=None)
+def _action_schema(name, strict):
+    # Import the module and compile the schema only once
+    module = importlib.import_module("lava_common.schemas." + name)
+    return Schema(module.schema(), extra=not strict)
+
+
+@functools.lru_cache(maxsize=None)
+def _job_schema(strict, extra_context_variables):
+    return Schema(job(list(extra_context_variables)), extra=not strict)
+
+
 def validate(data, strict=True, extra_context_variables=[]):
-    schema = Schema(job(extra_context_variables), extra=not strict)
+    schema = _job_schema(strict, tuple(extra_context_variables))
     schema(data)
     for index, action in enumerate(data["actions"]):
         # The job schema does already check the we have only one key
@@ -123,6 +141,39 @@ def validate(data, strict=True, extra_context_variables=[]):
         validate_action(cls, index, data, strict=strict)
 
 
+def _validate_definition(strict, extra_context_variables, item):
+    (key, definition) = item
+    try:
+        validate(yaml.load(definition, Loader=Loader), strict, extra_context_variables)
+    except yaml.YAMLError as exc:
+        return (key, [], "invalid yaml: %s" % str(exc))
+    except Invalid as exc:
+        # The voluptuous markers are not picklable
+        path = [p if isinstance(p, (int, str)) else str(p) for p in exc.path]
+        return (key, path, exc.msg)
+    return (key, None, None)
+
+
+def validate_many(definitions, strict=True, extra_context_variables=[], processes=None):
+    """
+    Validate the job definitions given as (key, yaml string) tuples, using a
+    pool of processes (one per cpu by default).
+    Yield (key, exc) in the same order, exc being None for valid definitions
+    or the Invalid exception.
+    """
+    func = functools.partial(
+        _validate_definition, strict, tuple(extra_context_variables)
+    )
+    if processes == 1:
+        for (key, path, msg) in map(func, definitions):
+            yield (key, None if msg is None else Invalid(msg, path=path))
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for (key, path, msg) in pool.imap(func, definitions, chunksize=32):
+            yield (key, None if msg is None else Invalid(msg, path=path))
+
+
 def timeout():
     return Any(
         {Required("days"): Range(min=1), Optional("skip"): bool},
@@ -348,6 +399,8 @@ def job(extra_context_variables=[]):
             },
             Optional("notify"): notify(),
             Optional("reboot_to_fastboot"): bool,
+            Optional("log_rate_limit"): Range(min=1),
+            Optional("profile"): Any(bool, "cprofile"),
             Required("actions"): [{Any("boot", "command", "deploy", "test"): dict}],
         },
         extra_checks,
@@ -42,7 +42,11 @@ def schema():
         Optional("dtb"): resource,
         Optional("modules"): resource,
         Optional("preseed"): resource,
-        Optional("ramdisk"): {**resource_ext, Optional("header"): "u-boot"},
+        Optional("ramdisk"): {
+            **resource_ext,
+            Optional("header"): "u-boot",
+            Optional("append_overlay"): bool,
+        },
         Exclusive("nfsrootfs", "nfs"): {**resource_ext, Optional("prefix"): str},
         Exclusive("persistent_nfs", "nfs"): {
             Required("address"): str,
@@ -33,6 +33,7 @@ def schema():
                 **deploy.url(),
                 Optional("format"): "qcow2",
                 Optional("image_arg"): str,  # TODO: is this optional?
+                Optional("backing_file"): bool,
             }
         },
         Optional("type"): "monitor",
@@ -21,6 +21,7 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import contextlib
+import functools
 
 from voluptuous import All, Any, Invalid, Length, Optional, Required, Schema
 
@@ -98,6 +99,10 @@ def extra_checks(data):
                     )
 
 
+@functools.lru_cache(maxsize=None)
+def _device_schema():
+    return Schema(All(device(), extra_checks), extra=True)
+
+
 def validate(data):
-    schema = Schema(All(device(), extra_checks), extra=True)
-    schema(data)
+    _device_schema()(data)
@@ -0,0 +1,79 @@
+import pytest
+import voluptuous
+import yaml
+
+from lava_common import schemas
+
+JOB = """
+device_type: qemu
+job_name: kvm
+timeouts:
+  job:
+    minutes: 10
+visibility: public
+actions:
+- deploy:
+    to: tmpfs
+    images:
+      rootfs:
+        url: http://example.com/rootfs.img.gz
+- boot:
+    method: qemu
+    media: tmpfs
+"""
+
+
+def test_compiled_schemas():
+    assert schemas._job_schema(True, ()) is schemas._job_schema(True, ())  # nosec
+    assert schemas._job_schema(True, ()) is not schemas._job_schema(False, ())  # nosec
+    assert schemas._job_schema(True, ("foo",)) is not schemas._job_schema(  # nosec
+        True, ()
+    )
+    assert schemas._action_schema("boot.qemu", True) is schemas._action_schema(  # nosec
+        "boot.qemu", True
+    )
+
+    # extra context variables are part of the key
+    data = {
+        "job_name": "kvm",
+        "device_type": "qemu",
+        "timeouts": {"job": {"minutes": 10}},
+        "visibility": "public",
+        "context": {"foo": "bar"},
+        "actions": [],
+    }
+    with pytest.raises(voluptuous.Invalid):
+        schemas.validate(data)
+    schemas.validate(data, extra_context_variables=["foo"])
+    with pytest.raises(voluptuous.Invalid):
+        schemas.validate(data)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_validate_many(processes):
+    definitions = [
+        (1, JOB),
+        (2, JOB.replace("method: qemu", "method: unknown")),
+        (3, JOB.replace("visibility: public", "")),
+        (4, "actions: ["),
+        (5, JOB),
+    ]
+    results = list(schemas.validate_many(definitions, processes=processes))
+    assert [key for (key, _) in results] == [1, 2, 3, 4, 5]  # nosec
+    assert results[0][1] is None  # nosec
+    assert results[1][1].msg == "unknown action type"  # nosec
+    assert results[1][1].path == ["actions", "boot", "unknown"]  # nosec
+    assert results[2][1].msg == "required key not provided"  # nosec
+    assert results[2][1].path == ["visibility"]  # nosec
+    assert results[3][1].msg.startswith("invalid yaml: ")  # nosec
+    assert results[4][1] is None  # nosec
+
+
+def test_profile():
+    data = yaml.safe_load(JOB)
+    for value in [True, False, "cprofile"]:
+        data["profile"] = value
+        schemas.validate(data)
+    data["profile"] = "perf"
+    with pytest.raises(voluptuous.Invalid):
+        schemas.validate(data)
@@ -19,7 +19,6 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import logging
-import copy
 from functools import reduce
 import time
 import types
@@ -219,6 +218,7 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         return None
 
     def run_actions(self, connection, max_end_time):
+        profiler = self.job.profiler if self.job is not None else None
         for action in self.actions:
             failed = False
             namespace = action.parameters.get("namespace", "common")
@@ -240,7 +240,11 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
                     else:
                         action.logger.debug(msg)
 
-                    new_connection = action.run(connection, action_max_end_time)
+                    if profiler is None:
+                        new_connection = action.run(connection, action_max_end_time)
+                    else:
+                        with profiler.measure(action, top_level=self.parent is None):
+                            new_connection = action.run(connection, action_max_end_time)
             except LAVATimeoutError as exc:
                 action.logger.exception(str(exc))
                 # allows retries without setting errors, which make the job incomplete.
@@ -889,7 +893,7 @@ class Action:  # pylint: disable=too-many-instance-attributes,too-many-public-me
         )  # pylint: disable=no-member
         if value is None:
             return None
-        return copy.deepcopy(value) if deepcopy else value
+        return self.job.__context__.copy(value) if deepcopy else value
 
     def set_namespace_data(self, action, label, key, value, parameters=None):
         """
@@ -20,6 +20,7 @@
 
 import os
 import re
+import time
 from lava_dispatcher.action import Action, Pipeline
 from lava_common.timeout import Timeout
 from lava_common.exceptions import (
@@ -920,8 +921,11 @@ class BootloaderCommandsAction(Action):
                 connection.prompt_str = [connection.prompt_str]
             connection.prompt_str = connection.prompt_str + error_messages
 
+        send_duration = 0
         for (index, line) in enumerate(commands):
+            start = time.time()
             connection.sendline(line, delay=self.character_delay)
+            send_duration += time.time() - start
             if index + 1 == len(commands):
                 continue
             res = self.wait(connection, max_end_time)
@@ -932,6 +936,14 @@ class BootloaderCommandsAction(Action):
                 )
                 raise InfrastructureError(msg)
 
+        self.logger.debug(
+            "%d bootloader commands sent in %.02f seconds", len(commands), send_duration
+        )
+        self.results = {
+            "commands": len(commands),
+            "send_duration": "%.02f" % send_duration,
+        }
+
         if final_message and self.expect_final:
             connection.prompt_str = final_message
             self.wait(connection, max_end_time)
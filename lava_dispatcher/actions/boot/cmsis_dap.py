@@ -19,6 +19,7 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import shutil
+import time
 
 from lava_common.exceptions import InfrastructureError
 from lava_dispatcher.action import Pipeline, Action
@@ -145,6 +146,10 @@ class FlashCMSISAction(Action):
             action="shared", label="shared", key="connection", deepcopy=False
         )
         connection = super().run(connection, max_end_time)
+        # The board resets once flashed
+        self.set_namespace_data(
+            action="shared", label="shared", key="udev-since", value=time.time()
+        )
         dstdir = mkdtemp()
         mount_command = "mount -t vfat %s %s" % (self.usb_mass_device, dstdir)
         self.run_command(mount_command.split(" "), allow_silent=True)
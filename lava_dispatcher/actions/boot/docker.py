@@ -131,7 +131,12 @@ class CallDockerAction(Action):
         cmd += " %s %s" % (docker_image, self.parameters["command"])
 
         self.logger.debug("Boot command: %s", cmd)
-        shell = ShellCommand(cmd, self.timeout, logger=self.logger)
+        shell = ShellCommand(
+            cmd,
+            self.timeout,
+            logger=self.logger,
+            rate_limit=self.job.parameters.get("log_rate_limit"),
+        )
         self.cleanup_required = True
 
         shell_connection = ShellSession(self.job, shell)
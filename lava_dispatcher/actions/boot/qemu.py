@@ -113,6 +113,8 @@ class CallQemuAction(Action):
     def __init__(self):
         super().__init__()
         self.sub_command = []
+        # qemu binary and options, without the downloaded files
+        self.base_command = []
         self.substitutions = {}
         self.commands = []
         self.methods = None
@@ -121,6 +123,39 @@ class CallQemuAction(Action):
         self.session_class = QemuSession
         self.shell_class = ShellCommand
 
+    def _build_command(self):
+        """
+        Return the qemu command with the paths of the downloaded files.
+        The paths can change after the validation (like the qcow2 overlays
+        created on top of the cached files), so the command is built again
+        when running.
+        """
+        self.commands = []
+        for label in self.get_namespace_keys("download-action"):
+            if label in ["offset", "available_loops", "uefi", "nfsrootfs"]:
+                continue
+            image_arg = self.get_namespace_data(
+                action="download-action", label=label, key="image_arg"
+            )
+            action_arg = self.get_namespace_data(
+                action="download-action", label=label, key="file"
+            )
+            if not image_arg or not action_arg:
+                self.errors = "Missing image_arg for %s. " % label
+                continue
+            self.substitutions["{%s}" % label] = action_arg
+            self.commands.append(image_arg)
+        self.substitutions["{NFS_SERVER_IP}"] = dispatcher_ip(
+            self.job.parameters["dispatcher"]
+        )
+        command = self.base_command + substitute(self.commands, self.substitutions)
+        uefi_dir = self.get_namespace_data(
+            action="deployimages", label="image", key="uefi_dir"
+        )
+        if uefi_dir:
+            command.extend(["-L", uefi_dir, "-monitor", "none"])
+        return command
+
     def validate(self):
         super().validate()
 
@@ -190,31 +225,10 @@ class CallQemuAction(Action):
         except (KeyError, TypeError):
             self.errors = "Invalid parameters for %s" % self.name
 
-        for label in self.get_namespace_keys("download-action"):
-            if label in ["offset", "available_loops", "uefi", "nfsrootfs"]:
-                continue
-            image_arg = self.get_namespace_data(
-                action="download-action", label=label, key="image_arg"
-            )
-            action_arg = self.get_namespace_data(
-                action="download-action", label=label, key="file"
-            )
-            if not image_arg or not action_arg:
-                self.errors = "Missing image_arg for %s. " % label
-                continue
-            self.substitutions["{%s}" % label] = action_arg
-            self.commands.append(image_arg)
-        self.substitutions["{NFS_SERVER_IP}"] = dispatcher_ip(
-            self.job.parameters["dispatcher"]
-        )
-        self.sub_command.extend(substitute(self.commands, self.substitutions))
+        self.base_command = self.sub_command
+        self.sub_command = self._build_command()
         if not self.sub_command:
             self.errors = "No QEMU command to execute"
-        uefi_dir = self.get_namespace_data(
-            action="deployimages", label="image", key="uefi_dir"
-        )
-        if uefi_dir:
-            self.sub_command.extend(["-L", uefi_dir, "-monitor", "none"])
 
         # Check for enable-kvm command line option in device configuration.
         if method not in self.job.device["actions"]["boot"]["methods"]:
@@ -244,6 +258,7 @@ class CallQemuAction(Action):
             connection.finalise()
         # initialise the first Connection object, a command line shell into the running QEMU.
         self.results = self.qemu_data
+        self.sub_command = self._build_command()
         guest = self.get_namespace_data(
             action="apply-overlay-guest", label="guest", key="filename"
         )
@@ -301,7 +316,13 @@ class CallQemuAction(Action):
 
         self.logger.info("Boot command: %s", " ".join(self.sub_command))
         shell = self.shell_class(
-            " ".join(self.sub_command), self.timeout, logger=self.logger
+            " ".join(self.sub_command),
+            self.timeout,
+            logger=self.logger,
+            search_window=self.job.device.get_constant(
+                "spawn_searchwindowsize", missing_ok=True
+            ),
+            rate_limit=self.job.parameters.get("log_rate_limit"),
         )
         if shell.exitstatus:
             raise JobError(
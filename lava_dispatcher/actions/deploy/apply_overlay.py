@@ -37,6 +37,7 @@ from lava_dispatcher.utils.filesystem import (
     copy_overlay_to_sparse_fs,
 )
 from lava_dispatcher.utils.shell import which
+from lava_dispatcher.utils.cache import RootfsCache
 from lava_dispatcher.utils.compression import compress_file, decompress_file, untar_file
 from lava_dispatcher.utils.strings import substitute
 from lava_dispatcher.utils.network import dispatcher_ip
@@ -393,7 +394,21 @@ class ExtractRootfs(Action):  # pylint: disable=too-many-instance-attributes
             action="download-action", label=self.param_key, key="file"
         )
         root_dir = self.mkdtemp()
-        untar_file(root, root_dir)
+        cache = RootfsCache.from_config(self.job.parameters["dispatcher"])
+        sha256 = self.get_namespace_data(
+            action="download-action", label=self.param_key, key="sha256"
+        )
+        if cache is not None and sha256:
+            if cache.clone(sha256, root_dir):
+                self.logger.info("Using the cached %s", self.param_key)
+            else:
+                self.logger.info("Adding %s to the rootfs cache", self.param_key)
+                cache.store(sha256, root)
+                if not cache.clone(sha256, root_dir):
+                    # Already evicted by other jobs
+                    untar_file(root, root_dir)
+        else:
+            untar_file(root, root_dir)
         self.set_namespace_data(
             action="extract-rootfs", label="file", key=self.file_key, value=root_dir
         )
@@ -517,6 +532,9 @@ class ExtractRamdisk(Action):
     applies the overlay and then leaves the ramdisk open
     for other actions to modify. Needs CompressRamdisk to
     recreate the ramdisk with modifications.
+    With append_overlay, the ramdisk is not unpacked: the
+    other actions only fill an empty directory which
+    CompressRamdisk appends to the original ramdisk.
     """
 
     name = "extract-overlay-ramdisk"
@@ -574,6 +592,23 @@ class ExtractRamdisk(Action):
         else:
             # give the file a predictable name
             shutil.move(ramdisk, ramdisk_compressed_data)
+
+        if self.parameters["ramdisk"].get("append_overlay", False):
+            self.logger.info("Not extracting ramdisk, the overlay will be appended.")
+            self.set_namespace_data(
+                action=self.name,
+                label="extracted_ramdisk",
+                key="directory",
+                value=extracted_ramdisk,
+            )
+            self.set_namespace_data(
+                action=self.name,
+                label="ramdisk_file",
+                key="file",
+                value=ramdisk_compressed_data,
+            )
+            return connection
+
         ramdisk_data = decompress_file(ramdisk_compressed_data, compression)
 
         with chdir(extracted_ramdisk):
@@ -640,6 +675,41 @@ class CompressRamdisk(Action):
                 else:
                     self.errors = "ramdisk: add_header: unknown header type"
 
+    def create_cpio(self, directory, root, cpio_file):
+        with chdir(directory):
+            cmd = "find %s | cpio --create --format='newc' > %s" % (root, cpio_file)
+            try:
+                log = subprocess.check_output(  # nosec - safe to use shell=True here, no external arguments
+                    cmd, shell=True, stderr=subprocess.STDOUT
+                )
+                log = log.decode("utf-8", errors="replace")
+            except (OSError, subprocess.CalledProcessError) as exc:
+                raise InfrastructureError("Unable to create cpio filesystem: %s" % exc)
+            # lazy-logging would mean that the quoting of cmd causes invalid YAML
+            self.logger.debug("%s\n%s" % (cmd, log))  # pylint: disable=logging-not-lazy
+
+    def append_overlay(self, ramdisk_dir, ramdisk_file, compression):
+        """
+        Linux accepts concatenated (and individually compressed) cpio
+        archives: only the files added by LAVA are archived and appended to
+        the original ramdisk.
+        """
+        overlay_cpio = os.path.join(os.path.dirname(ramdisk_dir), "overlay.cpio")
+        self.logger.info(
+            "Appending %s to ramdisk %s", ramdisk_dir, os.path.basename(ramdisk_file)
+        )
+        # Skip "." to keep the mode of the root directory
+        self.create_cpio(ramdisk_dir, ". -mindepth 1", overlay_cpio)
+        overlay_file = compress_file(overlay_cpio, compression)
+        with open(ramdisk_file, "ab") as f_out:
+            # Uncompressed archives should start on a 4 bytes boundary and
+            # the kernel skips the zero padding.
+            f_out.write(b"\0" * (-f_out.tell() % 4))
+            with open(overlay_file, "rb") as f_in:
+                shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.unlink(overlay_file)
+        return ramdisk_file
+
     def run(self, connection, max_end_time):  # pylint: disable=too-many-locals
         if not self.parameters.get("ramdisk"):  # idempotency
             return connection
@@ -674,23 +744,15 @@ class CompressRamdisk(Action):
                     action=self.name, label="file", key="preseed_local", value=filename
                 )
 
-        with chdir(ramdisk_dir):
+        # we need to compress the ramdisk with the same method is was submitted with
+        compression = self.parameters["ramdisk"].get("compression")
+        if self.parameters["ramdisk"].get("append_overlay", False):
+            final_file = self.append_overlay(ramdisk_dir, ramdisk_data, compression)
+        else:
             self.logger.info(
                 "Building ramdisk %s containing %s", ramdisk_data, ramdisk_dir
             )
-            cmd = "find . | cpio --create --format='newc' > %s" % ramdisk_data
-            try:
-                log = subprocess.check_output(  # nosec - safe to use shell=True here, no external arguments
-                    cmd, shell=True, stderr=subprocess.STDOUT
-                )
-                log = log.decode("utf-8", errors="replace")
-            except OSError as exc:
-                raise InfrastructureError("Unable to create cpio filesystem: %s" % exc)
-            # lazy-logging would mean that the quoting of cmd causes invalid YAML
-            self.logger.debug("%s\n%s" % (cmd, log))  # pylint: disable=logging-not-lazy
-
-            # we need to compress the ramdisk with the same method is was submitted with
-            compression = self.parameters["ramdisk"].get("compression")
+            self.create_cpio(ramdisk_dir, ".", ramdisk_data)
             final_file = compress_file(ramdisk_data, compression)
 
         tftp_dir = os.path.dirname(
@@ -22,11 +22,13 @@
 # This class is used for all downloads, including images and individual files for tftp.
 # python2 only
 
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import errno
 import math
 import os
 import shutil
+import threading
 import time
 import hashlib
 import requests
@@ -36,18 +38,22 @@ from lava_dispatcher.protocols.lxc import LxcProtocol
 from lava_dispatcher.actions.deploy import DeployAction
 from lava_dispatcher.actions.deploy.overlay import OverlayAction
 from lava_dispatcher.connections.serial import ConnectDevice
-from lava_common.exceptions import InfrastructureError, JobError, LAVABug
+from lava_common.exceptions import InfrastructureError, JobError, LAVABug, LAVAError
 from lava_dispatcher.action import Action, Pipeline
 from lava_dispatcher.logical import Deployment, RetryAction
-from lava_dispatcher.utils.compression import untar_file
+from lava_dispatcher.utils.cache import DownloadCache
+from lava_dispatcher.utils.compression import StreamWriter, untar_file
 from lava_dispatcher.utils.filesystem import (
     copy_to_lxc,
     lava_lxc_home,
     copy_overlay_to_lxc,
 )
+from lava_dispatcher.utils.network import requests_session
+from lava_dispatcher.utils.shell import which
 from lava_common.constants import (
     FILE_DOWNLOAD_CHUNK_SIZE,
     HTTP_DOWNLOAD_CHUNK_SIZE,
+    HTTP_DOWNLOAD_RESUMES,
     SCP_DOWNLOAD_CHUNK_SIZE,
 )
 from lava_dispatcher.actions.boot.fastboot import EnterFastbootAction
@@ -58,6 +64,12 @@ from urllib.parse import urlparse
 # pylint: disable=logging-not-lazy
 
 
+def throughput(size, duration):
+    if duration <= 0:
+        return "-"
+    return "%0.2fMB/s" % (size / (1024 * 1024 * duration))
+
+
 class DownloaderAction(RetryAction):
     """
     The retry pipeline for downloads.
@@ -119,6 +131,8 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
     description = "download action"
     summary = "download-action"
     timeout_exception = InfrastructureError
+    # Should the downloaded files be stored in the download cache
+    cacheable = True
 
     def __init__(self, key, path, url, uniquify=True):
         super().__init__()
@@ -128,15 +142,34 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
         # path unique.
         self.path = os.path.join(path, key) if uniquify else path
         self.size = -1
-        self.decompress_command_map = {"xz": "unxz", "gz": "gunzip", "bz2": "bunzip2"}
+        # Used by the download cache to check that the remote file did not change
+        self.validators = {}
+        # (future, cancel event, start time) when downloading in the background
+        self.prefetch = None
+        # Use the cached file as the backing file of a qcow2 image
+        self.backing_file = False
+        # Prevent the eviction of the backing file
+        self.pinned = None
+        self.decompress_command_map = {
+            "xz": "unxz",
+            "gz": "gunzip",
+            "bz2": "bunzip2",
+            "zstd": "unzstd",
+        }
 
     def reader(self):  # pylint: disable=no-self-use
         raise LAVABug("'reader' function unimplemented")
 
     def cleanup(self, connection):
+        if self.prefetch is not None:
+            self.prefetch[1].set()
+            self.prefetch = None
         if os.path.exists(self.path):
             self.logger.debug("Cleaning up download directory: %s", self.path)
             shutil.rmtree(self.path)
+        if self.pinned is not None:
+            self.pinned.close()
+            self.pinned = None
         self.set_namespace_data(
             action="download-action", label=self.key, key="file", value=""
         )
@@ -162,6 +195,9 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
             image_name, _ = self._url_to_fname_suffix(self.path, compression)
             image_arg = image.get("image_arg")
             overlay = image.get("overlay", False)
+            self.backing_file = image.get("backing_file", False)
+            if self.backing_file:
+                which("qemu-img")
             self.set_namespace_data(
                 action="download-action", label=self.key, key="file", value=image_name
             )
@@ -200,11 +236,13 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
                 action="download-action", label=self.key, key="overlay", value=overlay
             )
         if compression:
-            if compression not in ["gz", "bz2", "xz", "zip"]:
+            if compression not in ["gz", "bz2", "xz", "zip", "zstd"]:
                 self.errors = "Unknown 'compression' format '%s'" % compression
         if archive:
             if archive not in ["tar"]:
                 self.errors = "Unknown 'archive' format '%s'" % archive
+            if self.backing_file:
+                self.errors = "'backing_file' cannot be used with 'archive'"
         # pass kernel type to boot Action
         if self.key == "kernel" and ("kernel" in self.parameters):
             self.set_namespace_data(
@@ -214,6 +252,198 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
                 value=self.parameters[self.key].get("type"),
             )
 
+    def _remote(self):
+        """
+        Return the remote parameters and the compression of the file
+        """
+        if "images" in self.parameters and self.key in self.parameters["images"]:
+            remote = self.parameters["images"][self.key]
+            return (remote, remote.get("compression", False))
+        remote = self.parameters[self.key]
+        # The ramdisk can be used compressed
+        if self.key == "ramdisk":
+            return (remote, False)
+        return (remote, remote.get("compression", False))
+
+    def _prepare(self, compression):
+        """
+        Create the download directory and return the path of the file
+        """
+        # Create a fresh directory if the old one has been removed by a previous cleanup
+        # (when retrying inside a RetryAction)
+        try:
+            os.makedirs(self.path, 0o755)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise InfrastructureError(
+                    "Unable to create %s: %s" % (self.path, str(exc))
+                )
+
+        fname, _ = self._url_to_fname_suffix(self.path, compression)
+        if os.path.isdir(fname):
+            raise JobError("Download '%s' is a directory, not a file" % fname)
+        if os.path.exists(fname):
+            os.remove(fname)
+        return fname
+
+    def _create_overlay(self, base, fname):
+        """
+        Create a thin qcow2 image on top of the cached file (or of the
+        downloaded file when the cache cannot be used)
+        """
+        image = self.parameters["images"][self.key]
+        base_format = "qcow2" if image.get("format") == "qcow2" else "raw"
+        overlay = fname + ".overlay.qcow2"
+        try:
+            subprocess.check_output(  # nosec - internal.
+                [
+                    "qemu-img",
+                    "create",
+                    "-f",
+                    "qcow2",
+                    "-F",
+                    base_format,
+                    "-b",
+                    base,
+                    overlay,
+                ],
+                stderr=subprocess.STDOUT,
+            )
+        except subprocess.CalledProcessError as exc:
+            raise InfrastructureError(
+                "Unable to create the qcow2 overlay: %s"
+                % exc.output.decode("utf-8", errors="replace")
+            )
+        self.logger.info("Using %s on top of %s", os.path.basename(overlay), base)
+        self.set_namespace_data(
+            action="download-action", label=self.key, key="backing_file", value=base
+        )
+        return overlay
+
+    def _lookup_cache(self, cache, decompress):
+        (remote, _) = self._remote()
+        return cache.lookup(
+            remote["url"],
+            decompress,
+            remote.get("md5sum"),
+            remote.get("sha256sum"),
+            self.validators,
+        )
+
+    def _next_handlers(self):
+        """
+        Return the download handlers following this one in the same pipeline
+        """
+
+        def walk(pipeline):
+            for (index, action) in enumerate(pipeline.actions):
+                if isinstance(action, DownloaderAction) and any(
+                    sub is self for sub in action.internal_pipeline.actions
+                ):
+                    return [
+                        sub.internal_pipeline.actions[0]
+                        for sub in pipeline.actions[index + 1 :]
+                        if isinstance(sub, DownloaderAction)
+                        and isinstance(
+                            sub.internal_pipeline.actions[0], DownloadHandler
+                        )
+                    ]
+                if action.internal_pipeline is not None:
+                    handlers = walk(action.internal_pipeline)
+                    if handlers is not None:
+                        return handlers
+            return None
+
+        if self.job is None or self.job.pipeline is None:
+            return []
+        return walk(self.job.pipeline) or []
+
+    def _start_parallel_downloads(self, cache):
+        """
+        Download the next files of the same deploy action in background
+        threads while this file is downloaded.
+        """
+        connections = self.job.parameters["dispatcher"].get("parallel_downloads", 1)
+        if connections <= 1:
+            return
+        handlers = [
+            handler for handler in self._next_handlers() if handler.prefetch is None
+        ]
+        if not handlers:
+            return
+
+        # The current download is using one connection
+        executor = ThreadPoolExecutor(max_workers=connections - 1)
+        for handler in handlers:
+            (remote, compression) = handler._remote()
+            decompress = (
+                compression if compression in handler.decompress_command_map else None
+            )
+            if (
+                cache is not None
+                and handler.cacheable
+                and handler._lookup_cache(cache, decompress) is not None
+            ):
+                continue
+            try:
+                fname = handler._prepare(compression)
+            except LAVAError:
+                # The error will be raised when running the handler
+                continue
+            self.logger.debug("Downloading %s in the background", remote["url"])
+            cancel = threading.Event()
+            future = executor.submit(handler.download, fname, decompress, None, cancel)
+            handler.prefetch = (future, cancel, time.time())
+        # Let the pending downloads run in the background
+        executor.shutdown(wait=False)
+
+    def download(self, fname, decompress, progress=None, cancel=None):
+        """
+        Download the file to fname, decompressing it on the fly.
+        Return the size, md5 and sha256 of the downloaded data and the time
+        spent in each stage.
+        This function is also called in background threads, so it should not
+        log anything.
+        """
+        md5 = hashlib.md5()  # nosec - not being used for cryptography.
+        sha256 = hashlib.sha256()
+        size = 0
+        stats = {"read": 0, "hash": 0, "write": 0}
+        reader = self.reader()
+        try:
+            with open(fname, "wb") as dwnld_file:
+                # The data is written (and decompressed) in the background
+                # while the next chunks are downloaded and hashed.
+                writer = StreamWriter(dwnld_file, decompress)
+                try:
+                    start = time.time()
+                    for buff in reader:
+                        now = time.time()
+                        stats["read"] += now - start
+                        if cancel is not None and cancel.is_set():
+                            raise InfrastructureError(
+                                "Download of '%s' canceled" % self.url.geturl()
+                            )
+                        size += len(buff)
+                        md5.update(buff)
+                        sha256.update(buff)
+                        stats["hash"] += time.time() - now
+                        if progress is not None:
+                            progress(size)
+                        writer.write(buff)
+                        start = time.time()
+                except BaseException:
+                    writer.abort()
+                    raise
+                writer.close()
+                stats["write"] = writer.duration
+                stats["tool"] = writer.tool
+        except OSError as exc:
+            raise InfrastructureError("Unable to write %s: %s" % (fname, str(exc)))
+        finally:
+            reader.close()
+        return (size, md5.hexdigest(), sha256.hexdigest(), stats)
+
     def run(
         self, connection, max_end_time
     ):  # pylint: disable=too-many-locals,too-many-branches,too-many-statements
@@ -242,47 +472,25 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
 
         connection = super().run(connection, max_end_time)
         # self.cookies = self.job.context.config.lava_cookies  # FIXME: work out how to restore
-        md5 = hashlib.md5()  # nosec - not being used for cryptography.
-        sha256 = hashlib.sha256()
-
-        # Create a fresh directory if the old one has been removed by a previous cleanup
-        # (when retrying inside a RetryAction)
-        try:
-            os.makedirs(self.path, 0o755)
-        except OSError as exc:
-            if exc.errno != errno.EEXIST:
-                raise InfrastructureError(
-                    "Unable to create %s: %s" % (self.path, str(exc))
-                )
 
-        if "images" in self.parameters and self.key in self.parameters["images"]:
-            remote = self.parameters["images"][self.key]
-            compression = self.parameters["images"][self.key].get("compression", False)
-
-        else:
-            remote = self.parameters[self.key]
-            if self.key == "ramdisk":
-                compression = False
-                self.logger.debug(
-                    "Not decompressing ramdisk as can be used compressed."
-                )
-            else:
-                compression = self.parameters[self.key].get("compression", False)
+        (remote, compression) = self._remote()
+        if self.key == "ramdisk" and not (
+            "images" in self.parameters and self.key in self.parameters["images"]
+        ):
+            self.logger.debug("Not decompressing ramdisk as can be used compressed.")
 
         md5sum = remote.get("md5sum")
         sha256sum = remote.get("sha256sum")
 
-        fname, _ = self._url_to_fname_suffix(self.path, compression)
-        if os.path.isdir(fname):
-            raise JobError("Download '%s' is a directory, not a file" % fname)
-        if os.path.exists(fname):
-            os.remove(fname)
+        # The file is already being downloaded in the background
+        if self.prefetch is None:
+            fname = self._prepare(compression)
+        else:
+            fname, _ = self._url_to_fname_suffix(self.path, compression)
 
         self.logger.info("downloading %s", remote["url"])
         self.logger.debug("saving as %s", fname)
 
-        downloaded_size = 0
-        beginning = time.time()
         # Choose the progress bar (is the size known?)
         if self.size == -1:
             self.logger.debug("total size: unknown")
@@ -295,13 +503,11 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
             last_value = -5
             progress = progress_known_total
 
-        decompress_command = None
+        decompress = None
         if compression:
             if compression in self.decompress_command_map:
-                decompress_command = self.decompress_command_map[compression]
-                self.logger.info(
-                    "Using %s to decompress %s", decompress_command, compression
-                )
+                decompress = compression
+                self.logger.info("Decompressing %s during the download", compression)
             else:
                 self.logger.info(
                     "Compression %s specified but not decompressing during download",
@@ -310,58 +516,95 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
         else:
             self.logger.debug("No compression specified")
 
-        def update_progress():
-            nonlocal downloaded_size, last_value, md5, sha256
-            downloaded_size += len(buff)
+        cache = None
+        entry = None
+        if self.cacheable:
+            cache = DownloadCache.from_config(self.job.parameters["dispatcher"])
+        if cache is not None and self.prefetch is None:
+            entry = self._lookup_cache(cache, decompress)
+            if entry is not None and self.backing_file:
+                self.pinned = cache.pin(entry["path"])
+                if self.pinned is None:
+                    entry = None
+
+        self._start_parallel_downloads(cache)
+
+        if entry is not None and not self.backing_file:
+            self.logger.info("Using the cached copy %s", entry["path"])
+            beginning = time.time()
+            reflinked = cache.fetch(entry, fname)
+            if reflinked is None:
+                self.logger.info("The cached copy was evicted, downloading the file")
+                entry = None
+
+        def update_progress(downloaded_size):
+            nonlocal last_value
             (printing, new_value, msg) = progress(downloaded_size, last_value)
             if printing:
                 last_value = new_value
                 self.logger.debug(msg)
-            md5.update(buff)
-            sha256.update(buff)
 
-        if compression and decompress_command:
-            try:
-                with open(fname, "wb") as dwnld_file:
-                    proc = subprocess.Popen(  # nosec - internal.
-                        [decompress_command], stdin=subprocess.PIPE, stdout=dwnld_file
-                    )
-            except OSError as exc:
-                msg = "Unable to open %s: %s" % (fname, exc.strerror)
-                self.logger.error(msg)
-                raise InfrastructureError(msg)
-
-            with proc.stdin as pipe:
-                for buff in self.reader():
-                    update_progress()
-                    try:
-                        pipe.write(buff)
-                    except BrokenPipeError as exc:
-                        error_message = str(exc)
-                        self.logger.exception(error_message)
-                        msg = (
-                            "Make sure the 'compression' is corresponding "
-                            "to the image file type."
-                        )
-                        self.logger.error(msg)
-                        raise JobError(error_message)
-            proc.wait()
+        if entry is not None and self.backing_file:
+            self.logger.info("Using the cached copy %s as backing file", entry["path"])
+            downloaded_size = entry["size"]
+            md5_hexdigest = entry["md5"]
+            sha256_hexdigest = entry["sha256"]
+        elif entry is not None:
+            ending = time.time()
+            downloaded_size = entry["size"]
+            md5_hexdigest = entry["md5"]
+            sha256_hexdigest = entry["sha256"]
+            self.logger.info(
+                "%dMB %s from the cache in %0.2fs"
+                % (
+                    downloaded_size / (1024 * 1024),
+                    "reflinked" if reflinked else "copied",
+                    round(ending - beginning, 2),
+                )
+            )
         else:
-            with open(fname, "wb") as dwnld_file:
-                for buff in self.reader():
-                    update_progress()
-                    dwnld_file.write(buff)
-
-        # Log the download speed
-        ending = time.time()
-        self.logger.info(
-            "%dMB downloaded in %0.2fs (%0.2fMB/s)"
-            % (
-                downloaded_size / (1024 * 1024),
-                round(ending - beginning, 2),
-                round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2),
+            if self.prefetch is not None:
+                (future, cancel, beginning) = self.prefetch
+                # On failure, the retry will download the file again
+                self.prefetch = None
+                self.logger.debug("Waiting for the background download")
+                try:
+                    (
+                        downloaded_size,
+                        md5_hexdigest,
+                        sha256_hexdigest,
+                        stats,
+                    ) = future.result()
+                finally:
+                    # Stop the download if the action timed out
+                    cancel.set()
+            else:
+                beginning = time.time()
+                (
+                    downloaded_size,
+                    md5_hexdigest,
+                    sha256_hexdigest,
+                    stats,
+                ) = self.download(fname, decompress, update_progress)
+
+            # Log the download speed
+            ending = time.time()
+            self.logger.info(
+                "%dMB downloaded in %0.2fs (%0.2fMB/s)"
+                % (
+                    downloaded_size / (1024 * 1024),
+                    round(ending - beginning, 2),
+                    round(downloaded_size / (1024 * 1024 * (ending - beginning)), 2),
+                )
+            )
+            self.logger.debug(
+                "throughput: read %s, hash %s, %s (%s) %s",
+                throughput(downloaded_size, stats["read"]),
+                throughput(downloaded_size, stats["hash"]),
+                "decompress" if decompress else "write",
+                stats["tool"],
+                throughput(downloaded_size, stats["write"]),
             )
-        )
 
         # If the remote server uses "Content-Encoding: gzip", this calculation will be wrong
         # because requests will decompress the file on the fly, creating a larger file than
@@ -378,13 +621,13 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
             action="download-action", label=self.key, key="file", value=fname
         )
         self.set_namespace_data(
-            action="download-action", label=self.key, key="md5", value=md5.hexdigest()
+            action="download-action", label=self.key, key="md5", value=md5_hexdigest
         )
         self.set_namespace_data(
             action="download-action",
             label=self.key,
             key="sha256",
-            value=sha256.hexdigest(),
+            value=sha256_hexdigest,
         )
 
         # handle archive files
@@ -453,6 +696,44 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
                 raise JobError("SHA256 checksum for '%s' does not match." % fname)
             self.results = {"success": {"sha256": sha256sum}}
 
+        # Only store the files that were checked
+        cache_hit = entry is not None
+        if cache is not None and entry is None:
+            try:
+                cache.store(
+                    remote["url"],
+                    decompress,
+                    fname,
+                    md5_hexdigest,
+                    sha256_hexdigest,
+                    downloaded_size,
+                    self.validators,
+                )
+            except OSError as exc:
+                self.logger.warning("Unable to store %s in the cache: %s", fname, exc)
+            else:
+                if self.backing_file:
+                    entry = cache.lookup(remote["url"], decompress, md5_hexdigest)
+                    if entry is not None:
+                        self.pinned = cache.pin(entry["path"])
+                        if self.pinned is None:
+                            entry = None
+                    if entry is not None:
+                        os.unlink(fname)
+
+        if self.backing_file:
+            # image_arg expects a qcow2 image: without the cache, the overlay
+            # is backed by the job's own copy
+            base = fname
+            if entry is None:
+                self.logger.warning("Unable to use the cache, using a full copy")
+            else:
+                base = entry["path"]
+            fname = self._create_overlay(base, fname)
+            self.set_namespace_data(
+                action="download-action", label=self.key, key="file", value=fname
+            )
+
         # certain deployments need prefixes set
         if self.parameters["to"] == "tftp" or self.parameters["to"] == "nbd":
             suffix = self.get_namespace_data(
@@ -500,6 +781,8 @@ class DownloadHandler(Action):  # pylint: disable=too-many-instance-attributes
                 )
             ),
         }
+        if cache is not None:
+            self.results = {"cache": "hit" if cache_hit else "miss"}
         return connection
 
 
@@ -511,6 +794,7 @@ class FileDownloadAction(DownloadHandler):
     name = "file-download"
     description = "copy a local file"
     summary = "local file copy"
+    cacheable = False
 
     def validate(self):
         super().validate()
@@ -551,10 +835,11 @@ class HttpDownloadAction(DownloadHandler):
     def validate(self):
         super().validate()
         res = None
+        session = requests_session()
         try:
             self.logger.debug("Validating that %s exists", self.url.geturl())
             # Force the non-use of Accept-Encoding: gzip, this will permit to know the final size
-            res = requests.head(
+            res = session.head(
                 self.url.geturl(), allow_redirects=True, headers={"Accept-Encoding": ""}
             )
             if res.status_code != requests.codes.OK:  # pylint: disable=no-member
@@ -562,7 +847,7 @@ class HttpDownloadAction(DownloadHandler):
                 self.logger.debug("Using GET because HEAD is not supported properly")
                 res.close()
                 # Like for HEAD, we need get a size, so disable gzip
-                res = requests.get(
+                res = session.get(
                     self.url.geturl(),
                     allow_redirects=True,
                     stream=True,
@@ -575,6 +860,11 @@ class HttpDownloadAction(DownloadHandler):
                     )
 
             self.size = int(res.headers.get("content-length", -1))
+            self.validators = {
+                key: res.headers[key]
+                for key in ["etag", "last-modified"]
+                if key in res.headers
+            }
         except requests.Timeout:
             self.logger.error("Request timed out")
             self.errors = "'%s' timed out" % (self.url.geturl())
@@ -586,19 +876,86 @@ class HttpDownloadAction(DownloadHandler):
                 res.close()
 
     def reader(self):
+        session = requests_session()
+        chunk_size = self.job.parameters["dispatcher"].get(
+            "http_download_chunk_size", HTTP_DOWNLOAD_CHUNK_SIZE
+        )
+        # Only resume the download if the remote file did not change.
+        # If-Range does only accept strong validators.
+        validator = self.validators.get("etag", "")
+        if not validator or validator.startswith("W/"):
+            validator = self.validators.get("last-modified")
+
         res = None
+        offset = 0
+        # Position in the remote file, behind the offset when restarting
+        start = 0
+        resumes = 0
         try:
-            # FIXME: When requests 3.0 is released, use the enforce_content_length
-            # parameter to raise an exception the file is not fully downloaded
-            res = requests.get(self.url.geturl(), allow_redirects=True, stream=True)
-            if res.status_code != requests.codes.OK:  # pylint: disable=no-member
-                # This is an Infrastructure error because the validate function
-                # checked that the file does exist.
-                raise InfrastructureError(
-                    "Unable to download '%s'" % (self.url.geturl())
+            while True:
+                headers = {}
+                if offset:
+                    headers = {"Range": "bytes=%d-" % start, "If-Range": validator}
+                # FIXME: When requests 3.0 is released, use the enforce_content_length
+                # parameter to raise an exception the file is not fully downloaded
+                res = session.get(
+                    self.url.geturl(),
+                    allow_redirects=True,
+                    stream=True,
+                    headers=headers,
                 )
-            for buff in res.iter_content(HTTP_DOWNLOAD_CHUNK_SIZE):
-                yield buff
+                if offset:
+                    if res.status_code != requests.codes.PARTIAL_CONTENT:
+                        raise InfrastructureError(
+                            "Unable to resume the download of '%s' (%d)"
+                            % (self.url.geturl(), res.status_code)
+                        )
+                    content_range = res.headers.get("content-range", "")
+                    if not content_range.startswith("bytes %d-" % start):
+                        if start == 0:
+                            raise InfrastructureError(
+                                "Unable to resume the download of '%s': "
+                                "invalid Content-Range '%s'"
+                                % (self.url.geturl(), content_range)
+                            )
+                        # Restart from the beginning and skip the data
+                        # already downloaded
+                        res.close()
+                        start = 0
+                        continue
+                elif res.status_code != requests.codes.OK:  # pylint: disable=no-member
+                    # This is an Infrastructure error because the validate function
+                    # checked that the file does exist.
+                    raise InfrastructureError(
+                        "Unable to download '%s'" % (self.url.geturl())
+                    )
+                try:
+                    for buff in res.iter_content(chunk_size):
+                        if start < offset:
+                            skip = min(offset - start, len(buff))
+                            start += skip
+                            buff = buff[skip:]
+                            if not buff:
+                                continue
+                        offset += len(buff)
+                        start = offset
+                        yield buff
+                    return
+                except (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ):
+                    # The offsets would not match the decoded content
+                    if (
+                        resumes >= HTTP_DOWNLOAD_RESUMES
+                        or not validator
+                        or res.headers.get("content-encoding")
+                    ):
+                        raise
+                    resumes += 1
+                    res.close()
+                    time.sleep(resumes)
         except requests.RequestException as exc:
             raise InfrastructureError(
                 "Unable to download '%s': %s" % (self.url.geturl(), str(exc))
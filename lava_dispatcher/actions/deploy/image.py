@@ -61,7 +61,9 @@ class DeployImagesAction(DeployAction):  # FIXME: Rename to DeployPosixImages
             # alternatively use the -bios option and standard image args
         for image in parameters["images"].keys():
             self.internal_pipeline.add_action(DownloaderAction(image, path))
-            if parameters["images"][image].get("format", "") == "qcow2":
+            params = parameters["images"][image]
+            # The thin qcow2 images on top of the cached files are used as-is
+            if params.get("format", "") == "qcow2" and not params.get("backing_file"):
                 self.internal_pipeline.add_action(QCowConversionAction(image))
         if self.test_needs_overlay(parameters):
             self.internal_pipeline.add_action(
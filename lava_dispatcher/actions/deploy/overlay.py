@@ -18,16 +18,20 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import hashlib
 import os
 import stat
 import glob
 import shutil
 import tarfile
+import time
 from lava_dispatcher.actions.deploy import DeployAction
 from lava_dispatcher.action import Action, Pipeline
 from lava_common.exceptions import InfrastructureError, LAVABug
 from lava_dispatcher.actions.deploy.testdef import TestDefinitionAction
 from lava_dispatcher.logical import Deployment
+from lava_dispatcher.utils.cache import DownloadCache
+from lava_dispatcher.utils.compression import StreamWriter
 from lava_dispatcher.utils.contextmanager import chdir
 from lava_dispatcher.utils.filesystem import check_ssh_identity_file
 from lava_dispatcher.utils.shell import which
@@ -184,6 +188,61 @@ class OverlayAction(DeployAction):
             self.logger.debug("- %s=%s", prefix, data)
             fout.write("export %s=%s\n" % (prefix, data))
 
+    def _write_scripts(self, bin_dir, shell):
+        for fname in self.scripts_to_copy:
+            with open(fname, "r") as fin:
+                foutname = os.path.basename(fname)
+                output_file = "%s/%s" % (bin_dir, foutname)
+                if "distro" in fname:
+                    distribution = os.path.basename(os.path.dirname(fname))
+                    self.logger.debug("Updating %s (%s)", output_file, distribution)
+                else:
+                    self.logger.debug("Creating %s", output_file)
+                with open(output_file, "w") as fout:
+                    fout.write("#!%s\n\n" % shell)
+                    if foutname == "lava-target-mac":
+                        fout.write("TARGET_DEVICE_MAC='%s'\n" % self.target_mac)
+                    if foutname == "lava-target-ip":
+                        fout.write("TARGET_DEVICE_IP='%s'\n" % self.target_ip)
+                    if foutname == "lava-probe-ip":
+                        fout.write("PROBE_DEVICE_IP='%s'\n" % self.probe_ip)
+                    if foutname == "lava-probe-channel":
+                        fout.write("PROBE_DEVICE_CHANNEL='%s'\n" % self.probe_channel)
+                    if foutname == "lava-target-storage":
+                        fout.write('LAVA_STORAGE="\n')
+                        for method in self.job.device.get("storage_info", [{}]):
+                            for key, value in method.items():
+                                self.logger.debug(
+                                    "storage methods:\t%s\t%s", key, value
+                                )
+                                fout.write(r"\t%s\t%s\n" % (key, value))
+                        fout.write('"\n')
+                    fout.write(fin.read())
+                    os.fchmod(fout.fileno(), self.xmod)
+
+    def _scripts_key(self, shell):
+        """
+        The lava_test_shell scripts only depend on the lava version, the
+        distro and the device. When the download cache is enabled, the
+        scripts are rendered once and kept in the cache, keyed by a hash of
+        all the inputs.
+        """
+        key = hashlib.sha256()
+        for value in [
+            shell,
+            self.target_mac,
+            self.target_ip,
+            self.probe_ip,
+            self.probe_channel,
+            str(self.job.device.get("storage_info", [{}])),
+        ]:
+            key.update(value.encode("utf-8") + b"\0")
+        for fname in self.scripts_to_copy:
+            key.update(os.path.relpath(fname, self.lava_test_dir).encode("utf-8"))
+            with open(fname, "rb") as fin:
+                key.update(hashlib.sha256(fin.read()).digest())
+        return key.hexdigest()
+
     def run(self, connection, max_end_time):  # pylint: disable=too-many-locals
         """
         Check if a lava-test-shell has been requested, implement the overlay
@@ -215,36 +274,25 @@ class OverlayAction(DeployAction):
             if not os.path.exists(path):
                 os.makedirs(path, 0o755)
                 self.logger.debug("makedir: %s", path)
-        for fname in self.scripts_to_copy:
-            with open(fname, "r") as fin:
-                foutname = os.path.basename(fname)
-                output_file = "%s/bin/%s" % (lava_path, foutname)
-                if "distro" in fname:
-                    distribution = os.path.basename(os.path.dirname(fname))
-                    self.logger.debug("Updating %s (%s)", output_file, distribution)
-                else:
-                    self.logger.debug("Creating %s", output_file)
-                with open(output_file, "w") as fout:
-                    fout.write("#!%s\n\n" % shell)
-                    if foutname == "lava-target-mac":
-                        fout.write("TARGET_DEVICE_MAC='%s'\n" % self.target_mac)
-                    if foutname == "lava-target-ip":
-                        fout.write("TARGET_DEVICE_IP='%s'\n" % self.target_ip)
-                    if foutname == "lava-probe-ip":
-                        fout.write("PROBE_DEVICE_IP='%s'\n" % self.probe_ip)
-                    if foutname == "lava-probe-channel":
-                        fout.write("PROBE_DEVICE_CHANNEL='%s'\n" % self.probe_channel)
-                    if foutname == "lava-target-storage":
-                        fout.write('LAVA_STORAGE="\n')
-                        for method in self.job.device.get("storage_info", [{}]):
-                            for key, value in method.items():
-                                self.logger.debug(
-                                    "storage methods:\t%s\t%s", key, value
-                                )
-                                fout.write(r"\t%s\t%s\n" % (key, value))
-                        fout.write('"\n')
-                    fout.write(fin.read())
-                    os.fchmod(fout.fileno(), self.xmod)
+        start = time.time()
+        bin_dir = os.path.join(lava_path, "bin")
+        cache = DownloadCache.from_config(self.job.parameters["dispatcher"])
+        if cache is None:
+            self._write_scripts(bin_dir, shell)
+        else:
+            with cache.overlay(
+                self._scripts_key(shell), lambda path: self._write_scripts(path, shell)
+            ) as base:
+                self.logger.debug(
+                    "Using the lava_test_shell scripts cached in %s", base
+                )
+                for name in sorted(os.listdir(base)):
+                    shutil.copy(os.path.join(base, name), bin_dir)
+        self.logger.debug(
+            "[%s] lava_test_shell scripts installed in %0.2fs",
+            namespace,
+            time.time() - start,
+        )
 
         # Generate environment file
         self.logger.debug("Creating %s/environment", lava_path)
@@ -552,17 +600,33 @@ class CompressOverlay(Action):
             self.logger.error(self.errors)
             return connection
         connection = super().run(connection, max_end_time)
-        with chdir(location):
+        start = time.time()
+        # The tarball is compressed in the background (or by pigz) while the
+        # files are read.
+        with chdir(location), open(output, "wb") as f_out:
+            writer = StreamWriter(f_out, "gz", decompress=False)
             try:
-                with tarfile.open(output, "w:gz") as tar:
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
                     tar.add(".%s" % lava_test_results_dir)
                     # ssh authorization support
                     if os.path.exists("./root/"):
                         tar.add(".%s" % "/root/")
             except tarfile.TarError as exc:
+                writer.abort()
                 raise InfrastructureError(
                     "Unable to create lava overlay tarball: %s" % exc
                 )
+            except BaseException:
+                writer.abort()
+                raise
+            writer.close()
+        self.logger.debug(
+            "Overlay tarball created in %0.2fs (%dkB, compressed with %s in %0.2fs)",
+            time.time() - start,
+            os.path.getsize(output) / 1024,
+            writer.tool,
+            writer.duration,
+        )
 
         self.set_namespace_data(
             action=self.name, label="output", key="file", value=output
@@ -31,6 +31,7 @@ from lava_common.exceptions import InfrastructureError, JobError, LAVABug, TestE
 from lava_dispatcher.action import Action, Pipeline
 from lava_dispatcher.actions.test import TestAction
 from lava_dispatcher.utils.strings import indices
+from lava_dispatcher.utils.cache import GitCache
 from lava_dispatcher.utils.vcs import BzrHelper, GitHelper
 from lava_common.constants import DEFAULT_TESTDEF_NAME_CLASS, DISPATCHER_DOWNLOAD_DIR
 
@@ -254,7 +255,10 @@ class GitRepoAction(RepoAction):  # pylint: disable=too-many-public-methods
             self.errors = "Path to YAML file not specified in the job definition"
         if not self.valid:
             return
-        self.vcs = GitHelper(self.parameters["repository"])
+        self.vcs = GitHelper(
+            self.parameters["repository"],
+            cache=GitCache.from_config(self.job.parameters["dispatcher"]),
+        )
         super().validate()
 
     @classmethod
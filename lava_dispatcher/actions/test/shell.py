@@ -48,6 +48,82 @@ def handle_testcase(params):
     return data
 
 
+class CombinedPatterns:
+    """
+    Match the test shell patterns with a single alternation regex.
+
+    pexpect tries each pattern of the list against the buffer in turn. The
+    alternation tries the branches in order at each position, so the match is
+    the same: the earliest one, and the first pattern of the list on a tie.
+    Each branch is a named group, giving the event to check. The pattern is
+    then matched again at the same position so the handlers get the groups of
+    their own pattern.
+    """
+
+    # Numbered back references would be broken by the extra groups and global
+    # inline flags would apply to every branch: such patterns are matched by
+    # pexpect as a list.
+    UNSUPPORTED = re.compile(r"\\[1-9]|\(\?\(\d|\(\?[aiLmsux]+\)")
+    FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s"}
+
+    def __init__(self, patterns):
+        self.items = list(patterns.items())
+        self.groups = {}
+        self.events = []
+        self.expect_list = []
+        branches = []
+        for (index, (event, pattern)) in enumerate(self.items):
+            if pattern is pexpect.EOF or pattern is pexpect.TIMEOUT:
+                self.events.append(event)
+                self.expect_list.append(pattern)
+                continue
+            if isinstance(pattern, str):
+                # Same flags as pexpect
+                pattern = re.compile(pattern, re.DOTALL)
+            flags = "".join(
+                char for (flag, char) in self.FLAGS.items() if pattern.flags & flag
+            )
+            if (
+                not isinstance(pattern.pattern, str)
+                or pattern.flags & ~(re.UNICODE | sum(self.FLAGS))
+                or self.UNSUPPORTED.search(pattern.pattern)
+            ):
+                branches = None
+                break
+            name = "_lava_event_%d" % index
+            self.groups[name] = (event, pattern)
+            branches.append("(?P<%s>(?%s:%s))" % (name, flags, pattern.pattern))
+
+        if branches:
+            try:
+                combined = re.compile("|".join(branches))
+            except re.error:
+                # Conflicting group names
+                combined = None
+            if combined is not None:
+                self.events.insert(0, None)
+                self.expect_list.insert(0, combined)
+                return
+        self.events = [item[0] for item in self.items]
+        self.expect_list = [item[1] for item in self.items]
+        self.groups = {}
+
+    def compatible(self, patterns):
+        return self.items == list(patterns.items())
+
+    def expect(self, test_connection, timeout):
+        """
+        Wait for one of the patterns and return the corresponding event.
+        """
+        index = test_connection.expect(self.expect_list, timeout=timeout)
+        event = self.events[index]
+        if event is None:
+            match = test_connection.match
+            (event, pattern) = self.groups[match.lastgroup]
+            test_connection.match = pattern.match(match.string, match.start())
+        return event
+
+
 class TestShell(LavaTest):
     """
     LavaTestShell Strategy object
@@ -168,6 +244,7 @@ class TestShellAction(TestAction):
         super().__init__()
         self.signal_director = self.SignalDirector(None)  # no default protocol
         self.patterns = {}
+        self.matcher = None
         self.signal_match = SignalMatch()
         self.definition = None
         self.testset_name = None
@@ -692,9 +769,10 @@ class TestShellAction(TestAction):
             self.logger.info(
                 "Test case result pattern: %r" % self.patterns["test_case_results"]
             )
-        retval = test_connection.expect(list(self.patterns.values()), timeout=timeout)
+        if self.matcher is None or not self.matcher.compatible(self.patterns):
+            self.matcher = CombinedPatterns(self.patterns)
         return self.check_patterns(
-            list(self.patterns.keys())[retval], test_connection, check_char
+            self.matcher.expect(test_connection, timeout), test_connection, check_char
         )
 
     class SignalDirector:
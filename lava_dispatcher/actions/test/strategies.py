@@ -19,7 +19,7 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 # List just the subclasses supported for this base strategy
-# imported by the parser to populate the list of subclasses.
+# imported when the registry cannot select the strategy.
 
 # pylint: disable=unused-import
 
@@ -22,6 +22,7 @@ import os
 import signal
 import decimal
 import logging
+from lava_dispatcher import registry
 from lava_dispatcher.action import InternalObject
 from lava_common.exceptions import LAVABug, TestError
 from lava_common.timeout import Timeout
@@ -31,6 +32,8 @@ from lava_common.timeout import Timeout
 
 
 RECOGNIZED_TAGS = ("telnet", "ssh")
+# Connections attached to the console broker
+CONSOLE_TAG = "console"
 
 
 class SignalMatch(InternalObject):  # pylint: disable=too-few-public-methods
@@ -141,11 +144,14 @@ class Connection:
         logger = logging.getLogger("dispatcher")
         if not self.tags or (
             self.name not in self.recognized_names
-            and not set(RECOGNIZED_TAGS) & set(self.tags)
+            and not set(RECOGNIZED_TAGS + (CONSOLE_TAG,)) & set(self.tags)
         ):
             raise LAVABug("'disconnect' not implemented")
         try:
-            if "telnet" in self.tags:
+            if CONSOLE_TAG in self.tags:
+                # Only stop the client, the broker keeps the console
+                logger.info("Detaching from the console broker: %s", reason)
+            elif "telnet" in self.tags:
                 logger.info("Disconnecting from telnet: %s", reason)
                 self.sendcontrol("]")
                 self.sendline("quit", disconnecting=True)
@@ -219,6 +225,9 @@ class Protocol:
         Multiple protocols can apply to the same job, each with their own parameters.
         Jobs may have zero or more protocols selected.
         """
+        for name in parameters.get("protocols", {}):
+            if registry.load(registry.PROTOCOLS, name) is None:
+                registry.load_all("protocols")
         candidates = cls.__subclasses__()  # pylint: disable=no-member
         return [(c, c.level) for c in candidates if c.accepts(parameters)]
 
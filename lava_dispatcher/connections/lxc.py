@@ -85,6 +85,10 @@ class ConnectLxc(Action):
             self.timeout,
             logger=self.logger,
             window=self.job.device.get_constant("spawn_maxread"),
+            search_window=self.job.device.get_constant(
+                "spawn_searchwindowsize", missing_ok=True
+            ),
+            rate_limit=self.job.parameters.get("log_rate_limit"),
         )
         if shell.exitstatus:
             raise JobError(
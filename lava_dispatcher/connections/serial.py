@@ -18,7 +18,12 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
-from lava_dispatcher.connection import RECOGNIZED_TAGS
+import os
+import time
+
+from lava_common.constants import CONSOLE_BROKER_PATH
+from lava_dispatcher.connection import CONSOLE_TAG, RECOGNIZED_TAGS
+from lava_dispatcher.console import console_running, console_socket
 from lava_dispatcher.utils.shell import which
 from lava_dispatcher.action import Action
 from lava_common.exceptions import JobError, InfrastructureError
@@ -60,6 +65,23 @@ class ConnectDevice(Action):
             self.errors = "Unable to parse the connection command %s" % self.command
         which(exe)
 
+    def _console_socket(self):
+        """
+        Socket of the console broker running the connection command or None
+        """
+        if not self.primary:
+            return None
+        broker = self.job.parameters.get("dispatcher", {}).get("console_broker")
+        if not broker:
+            return None
+        path = console_socket(broker.get("path", CONSOLE_BROKER_PATH), self.command)
+        if not os.path.exists(path):
+            return None
+        if not console_running(path):
+            self.logger.warning("The console broker is not running (%s)", path)
+            return None
+        return path
+
     def validate(self):
         super().validate()
         matched = False
@@ -149,12 +171,28 @@ class ConnectDevice(Action):
             self.message,
             self.command,
         )
+        command = self.command
+        console = self._console_socket()
+        if console:
+            since = self.get_namespace_data(
+                action="shared",
+                label="shared",
+                key="console-since",
+                parameters=parameters,
+            )
+            since = since or self.job.start_time or time.time()
+            self.logger.debug("Attaching to the console broker (%s)", console)
+            command = "lava-console attach --since %f %s" % (since, console)
         # ShellCommand executes the connection command
         shell = self.shell_class(
-            "%s\n" % self.command,
+            "%s\n" % command,
             self.timeout,
             logger=self.logger,
             window=self.job.device.get_constant("spawn_maxread"),
+            search_window=self.job.device.get_constant(
+                "spawn_searchwindowsize", missing_ok=True
+            ),
+            rate_limit=self.job.parameters.get("log_rate_limit"),
         )
         if shell.exitstatus:
             raise JobError(
@@ -166,6 +204,8 @@ class ConnectDevice(Action):
         connection.connected = True
         if self.hardware:
             connection.tags = self.tag_dict[self.hardware]
+        if console:
+            connection.tags = [CONSOLE_TAG] + connection.tags
         connection = super().run(connection, max_end_time)
         if not connection.prompt_str:
             connection.prompt_str = [
@@ -285,6 +325,15 @@ class DisconnectDevice(ConnectDevice):
 
         if connection:
             self.logger.debug("Stopping connection")
+            if CONSOLE_TAG in connection.tags:
+                # Replay the output received after the disconnection
+                self.set_namespace_data(
+                    action="shared",
+                    label="shared",
+                    key="console-since",
+                    value=time.time(),
+                    parameters=parameters,
+                )
             connection.disconnect()
             connection.connected = False
             self.set_namespace_data(
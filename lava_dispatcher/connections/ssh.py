@@ -199,7 +199,12 @@ class ConnectSsh(Action):
                 "Unable to identify host address. Primary? %s" % self.primary
             )
         command_str = " ".join(str(item) for item in command)
-        shell = ShellCommand("%s\n" % command_str, self.timeout, logger=self.logger)
+        shell = ShellCommand(
+            "%s\n" % command_str,
+            self.timeout,
+            logger=self.logger,
+            rate_limit=self.job.parameters.get("log_rate_limit"),
+        )
         if shell.exitstatus:
             raise JobError(
                 "%s command exited %d: %s"
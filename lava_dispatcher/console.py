@@ -0,0 +1,368 @@
+# Copyright (C) 2020 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+# Console broker
+#
+# The broker keeps the connection command of each device running (telnet,
+# ser2net client, ...) and records the console output with timestamps.
+# lava-run attaches to the broker through a Unix socket:
+# * the client sends the timestamp to replay from, followed by "\n"
+# * the broker sends the recorded output newer than this timestamp and then
+#   the live output
+# * the data sent by the client is written to the console
+
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import pty
+import selectors
+import shlex
+import signal
+import socket
+import subprocess  # nosec - internal use.
+import sys
+import termios
+import time
+import tty
+
+from lava_common.constants import CONSOLE_BUFFER_SIZE, CONSOLE_RECONNECT_DELAY
+
+READ_SIZE = 4096
+
+
+def console_socket(path, command):
+    """
+    Path to the socket of the console running this connection command
+    """
+    name = hashlib.sha256(command.strip().encode("utf-8")).hexdigest()[:32]
+    return os.path.join(path, name + ".sock")
+
+
+def console_running(path):
+    """
+    Check that a broker is listening on the console socket.
+    A stale socket (left by a broker that was killed) refuses the connection.
+    """
+    with contextlib.closing(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class RingBuffer:
+    """
+    Keep the last bytes of the console output with the time of reception
+    """
+
+    def __init__(self, size=CONSOLE_BUFFER_SIZE):
+        self.size = size
+        self.length = 0
+        self.chunks = collections.deque()
+
+    def append(self, data, timestamp=None):
+        if not data:
+            return
+        data = data[-self.size :]
+        self.chunks.append((time.time() if timestamp is None else timestamp, data))
+        self.length += len(data)
+        while self.length > self.size:
+            (old_ts, old) = self.chunks.popleft()
+            extra = self.length - self.size
+            if extra < len(old):
+                self.chunks.appendleft((old_ts, old[extra:]))
+                self.length -= extra
+            else:
+                self.length -= len(old)
+
+    def since(self, timestamp):
+        """
+        Return the data received at or after the given timestamp
+        """
+        return b"".join(data for (ts, data) in self.chunks if ts >= timestamp)
+
+
+class Client:
+    """
+    Process attached to the console through the Unix socket
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.header = b""
+        self.attached = False
+        self.pending = bytearray()
+
+
+class Console:
+    """
+    Run the connection command of a device and share the console with the
+    attached clients
+    """
+
+    def __init__(self, name, command, path, selector, buffer_size=CONSOLE_BUFFER_SIZE):
+        self.name = name
+        self.command = command
+        self.path = console_socket(path, command)
+        self.selector = selector
+        self.buffer = RingBuffer(buffer_size)
+        self.logger = logging.getLogger("lava-console")
+        self.proc = None
+        self.master = None
+        self.restart_at = 0
+        self.clients = []
+        self.server = None
+
+    def listen(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(5)
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, self.accept)
+        self.logger.info("[%s] listening on %s", self.name, self.path)
+
+    def start(self):
+        self.logger.info("[%s] running '%s'", self.name, self.command)
+        (self.master, slave) = pty.openpty()
+        try:
+            self.proc = subprocess.Popen(  # nosec - internal use.
+                shlex.split(self.command),
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                start_new_session=True,
+            )
+        except OSError as exc:
+            self.logger.error("[%s] unable to start: %s", self.name, str(exc))
+            os.close(self.master)
+            self.master = None
+            self.restart_at = time.time() + CONSOLE_RECONNECT_DELAY
+            return
+        finally:
+            os.close(slave)
+        self.selector.register(self.master, selectors.EVENT_READ, self.read)
+
+    def stop(self):
+        if self.master is not None:
+            self.selector.unregister(self.master)
+            os.close(self.master)
+            self.master = None
+        if self.proc is not None:
+            with contextlib.suppress(OSError):
+                os.killpg(self.proc.pid, signal.SIGTERM)
+            self.proc.wait()
+            self.proc = None
+        self.restart_at = time.time() + CONSOLE_RECONNECT_DELAY
+
+    def close(self):
+        self.stop()
+        for client in self.clients[:]:
+            self.drop(client)
+        if self.server is not None:
+            self.selector.unregister(self.server)
+            self.server.close()
+            self.server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    def check(self, now):
+        """
+        Restart the connection command when needed
+        """
+        if self.master is None and now >= self.restart_at:
+            self.start()
+
+    def read(self, mask):  # pylint: disable=unused-argument
+        try:
+            data = os.read(self.master, READ_SIZE)
+        except OSError:
+            # EIO when the command exited
+            data = b""
+        if not data:
+            self.logger.warning(
+                "[%s] '%s' exited, restarting in %ds",
+                self.name,
+                self.command,
+                CONSOLE_RECONNECT_DELAY,
+            )
+            self.stop()
+            return
+        self.buffer.append(data)
+        for client in self.clients[:]:
+            if client.attached:
+                self.send(client, data)
+
+    def write(self, data):
+        if self.master is None:
+            return
+        with contextlib.suppress(OSError):
+            os.write(self.master, data)
+
+    def accept(self, mask):  # pylint: disable=unused-argument
+        (sock, _) = self.server.accept()
+        sock.setblocking(False)
+        client = Client(sock)
+        self.clients.append(client)
+        self.selector.register(
+            sock, selectors.EVENT_READ, lambda mask: self.ready(client, mask)
+        )
+
+    def ready(self, client, mask):
+        if mask & selectors.EVENT_WRITE:
+            self.flush(client)
+        if mask & selectors.EVENT_READ and client in self.clients:
+            self.receive(client)
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(client)
+            return
+        if client.attached:
+            self.write(data)
+            return
+
+        # The first line is the timestamp to replay from
+        client.header += data
+        if b"\n" not in client.header:
+            if len(client.header) > 64:
+                self.drop(client)
+            return
+        (header, data) = client.header.split(b"\n", 1)
+        try:
+            since = float(header)
+        except ValueError:
+            self.drop(client)
+            return
+        client.attached = True
+        self.logger.info("[%s] client attached", self.name)
+        self.send(client, self.buffer.since(since))
+        self.write(data)
+
+    def send(self, client, data):
+        client.pending.extend(data)
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            sent = client.sock.send(client.pending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.drop(client)
+            return
+        del client.pending[:sent]
+        events = selectors.EVENT_READ
+        if client.pending:
+            # Drop the clients that are not reading the console
+            if len(client.pending) > self.buffer.size:
+                self.logger.warning("[%s] dropping a slow client", self.name)
+                self.drop(client)
+                return
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(client.sock, events, lambda mask: self.ready(client, mask))
+
+    def drop(self, client):
+        if client not in self.clients:
+            return
+        self.clients.remove(client)
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        if client.attached:
+            self.logger.info("[%s] client detached", self.name)
+
+
+class Broker:
+    """
+    Event loop of the console broker
+    """
+
+    def __init__(self, devices, path, buffer_size=CONSOLE_BUFFER_SIZE):
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        os.makedirs(path, exist_ok=True)
+        self.consoles = [
+            Console(name, command, path, self.selector, buffer_size)
+            for (name, command) in sorted(devices.items())
+        ]
+
+    def run(self):
+        self.running = True
+        for console in self.consoles:
+            console.listen()
+        try:
+            while self.running:
+                now = time.time()
+                for console in self.consoles:
+                    console.check(now)
+                for (key, mask) in self.selector.select(timeout=1):
+                    key.data(mask)
+        finally:
+            for console in self.consoles:
+                console.close()
+
+    def stop(self):
+        self.running = False
+
+
+def attach(path, since=0):
+    """
+    Bridge stdin and stdout to the console socket.
+    Used by lava-run as the connection command.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall(b"%f\n" % since)
+
+    stdin = sys.stdin.fileno()
+    stdout = sys.stdout.fileno()
+    attrs = None
+    if os.isatty(stdin):
+        # The device is echoing the characters
+        attrs = termios.tcgetattr(stdin)
+        tty.setraw(stdin)
+    selector = selectors.DefaultSelector()
+    selector.register(stdin, selectors.EVENT_READ)
+    selector.register(sock, selectors.EVENT_READ)
+    try:
+        while True:
+            for (key, _) in selector.select():
+                if key.fileobj == sock:
+                    data = sock.recv(READ_SIZE)
+                    if not data:
+                        return 1
+                    os.write(stdout, data)
+                else:
+                    data = os.read(stdin, READ_SIZE)
+                    if not data:
+                        return 0
+                    sock.sendall(data)
+    finally:
+        if attrs is not None:
+            termios.tcsetattr(stdin, termios.TCSADRAIN, attrs)
+        sock.close()
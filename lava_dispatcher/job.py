@@ -31,6 +31,7 @@ from lava_common.exceptions import LAVABug, LAVAError, JobError
 from lava_common.utils import debian_package_version
 from lava_dispatcher.logical import PipelineContext
 from lava_dispatcher.diagnostics import DiagnoseNetwork
+from lava_dispatcher.utils.profiling import Profiler
 from lava_dispatcher.protocols.multinode import (  # pylint: disable=unused-import
     MultinodeProtocol,
 )
@@ -86,7 +87,11 @@ class Job:  # pylint: disable=too-many-instance-attributes
         # override in use
         self.base_overrides = {}
         self.started = False
+        self.start_time = None
         self.test_info = {}
+        # Output directory of lava-run, for the profile dumps
+        self.output_dir = None
+        self.profiler = None
 
     @property
     def context(self):
@@ -238,6 +243,12 @@ class Job:  # pylint: disable=too-many-instance-attributes
         Run the pipeline under the run() wrapper that will catch the exceptions
         """
         self.started = True
+        self.start_time = time.time()
+        profile = self.parameters.get("profile")
+        if profile:
+            self.profiler = Profiler(
+                self.logger, self.output_dir, cprofile=profile == "cprofile"
+            )
 
         # Setup the protocols
         for protocol in self.protocols:
@@ -269,6 +280,8 @@ class Job:  # pylint: disable=too-many-instance-attributes
         try:
             self._run()
         finally:
+            if self.profiler is not None:
+                self.profiler.report()
             # Cleanup now
             self.cleanup(self.connection)
 
@@ -282,6 +295,11 @@ class Job:  # pylint: disable=too-many-instance-attributes
         # for us)
         self.logger.info("Cleaning after the job")
         self.pipeline.cleanup(connection)
+        self.logger.debug(
+            "Namespace data: %d copies in %.3f seconds",
+            self.__context__.copies,
+            self.__context__.copy_duration,
+        )
 
         for tmp_dir in self.base_overrides.values():
             self.logger.info("Override tmp directory removed at %s", tmp_dir)
@@ -18,7 +18,10 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import copy
 import time
+from collections import OrderedDict
+from lava_dispatcher import registry
 from lava_dispatcher.action import Action
 from lava_common.exceptions import (
     InfrastructureError,
@@ -134,6 +137,50 @@ class DiagnosticAction(Action):
         return connection
 
 
+def _accepting(candidates, device, parameters):
+    replies = {}
+    willing = []
+    for c in candidates:
+        res = c.accepts(device, parameters)
+        if not isinstance(res, tuple):
+            raise LAVABug(
+                "class %s accept function did not return a tuple" % c.__name__
+            )
+        if res[0]:
+            willing.append(c)
+        else:
+            class_name = c.name if hasattr(c, "name") else c.__name__
+            replies[class_name] = res[1]
+    return willing, replies
+
+
+def select_strategy(base, kind, candidates, device, parameters):
+    """
+    Return the strategy with the highest priority accepting the parameters.
+    Only the candidates registered for the parameters are imported and
+    checked. When none of them is accepting (or when nothing is registered),
+    every subclass of the base strategy is checked so the error gives the
+    reasons of all the strategies.
+    """
+    willing, replies = _accepting(candidates or [], device, parameters)
+    if not willing:
+        registry.load_all(base.action_type)
+        candidates = base.__subclasses__()
+        willing, replies = _accepting(candidates, device, parameters)
+
+    if not willing:
+        replies_string = ""
+        for name, reply in replies.items():
+            replies_string += "%s: %s\n" % (name, reply)
+        raise JobError(
+            "None of the %s strategies accepted your %s parameters, reasons given:\n%s"
+            % (kind, kind, replies_string)
+        )
+
+    willing.sort(key=lambda x: x.priority, reverse=True)
+    return willing[0]
+
+
 class Deployment:
     """
     Deployment is a strategy class which aggregates Actions
@@ -213,31 +260,8 @@ class Deployment:
     @classmethod
     def select(cls, device, parameters):
         cls.deploy_check(device, parameters)
-        candidates = cls.__subclasses__()  # pylint: disable=no-member
-        replies = {}
-        willing = []
-        for c in candidates:
-            res = c.accepts(device, parameters)
-            if not isinstance(res, tuple):
-                raise LAVABug(
-                    "class %s accept function did not return a tuple" % c.__name__
-                )
-            if res[0]:
-                willing.append(c)
-            else:
-                replies[c.name] = res[1]
-
-        if not willing:
-            replies_string = ""
-            for name, reply in replies.items():
-                replies_string += "%s: %s\n" % (name, reply)
-            raise JobError(
-                "None of the deployment strategies accepted your deployment parameters, reasons given:\n%s"
-                % replies_string
-            )
-
-        willing.sort(key=lambda x: x.priority, reverse=True)
-        return willing[0]
+        candidates = registry.load(registry.DEPLOY, parameters["to"])
+        return select_strategy(cls, "deployment", candidates, device, parameters)
 
 
 class Boot:
@@ -287,32 +311,8 @@ class Boot:
     @classmethod
     def select(cls, device, parameters):
         cls.boot_check(device, parameters)
-        candidates = cls.__subclasses__()  # pylint: disable=no-member
-        replies = {}
-        willing = []
-        for c in candidates:
-            res = c.accepts(device, parameters)
-            if not isinstance(res, tuple):
-                raise LAVABug(
-                    "class %s accept function did not return a tuple" % c.__name__
-                )
-            if res[0]:
-                willing.append(c)
-            else:
-                class_name = c.name if hasattr(c, "name") else c.__name__
-                replies[class_name] = res[1]
-
-        if not willing:
-            replies_string = ""
-            for name, reply in replies.items():
-                replies_string += "%s: %s\n" % (name, reply)
-            raise JobError(
-                "None of the boot strategies accepted your boot parameters, reasons given:\n%s"
-                % replies_string
-            )
-
-        willing.sort(key=lambda x: x.priority, reverse=True)
-        return willing[0]
+        candidates = registry.load(registry.BOOT, parameters["method"])
+        return select_strategy(cls, "boot", candidates, device, parameters)
 
 
 class LavaTest:
@@ -342,32 +342,12 @@ class LavaTest:
 
     @classmethod
     def select(cls, device, parameters):
-        candidates = cls.__subclasses__()  # pylint: disable=no-member
-        replies = {}
-        willing = []
-        for c in candidates:
-            res = c.accepts(device, parameters)
-            if not isinstance(res, tuple):
-                raise LAVABug(
-                    "class %s accept function did not return a tuple" % c.__name__
-                )
-            if res[0]:
-                willing.append(c)
-            else:
-                class_name = c.name if hasattr(c, "name") else c.__name__
-                replies[class_name] = res[1]
-
-        if not willing:
-            replies_string = ""
-            for name, reply in replies.items():
-                replies_string += "%s: %s\n" % (name, reply)
-            raise JobError(
-                "None of the test strategies accepted your test parameters, reasons given:\n%s"
-                % replies_string
-            )
-
-        willing.sort(key=lambda x: x.priority, reverse=True)
-        return willing[0]
+        candidates = None
+        for key in registry.TEST_KEYS:
+            if key in parameters:
+                candidates = registry.load(registry.TEST, key)
+                break
+        return select_strategy(cls, "test", candidates, device, parameters)
 
     @classmethod
     def needs_deployment_data(cls):
@@ -382,6 +362,31 @@ class LavaTest:
         return NotImplementedError("has_shell %s" % cls)
 
 
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def copy_data(value):
+    """
+    Return a deep copy of the namespace data value.
+
+    Most of the values are strings, or lists and dicts of strings: they are
+    copied directly instead of going through copy.deepcopy, which is much
+    slower. Other objects are still deep copied.
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+    value_type = type(value)
+    if value_type is list:
+        return [copy_data(item) for item in value]
+    if value_type is dict:
+        return {key: copy_data(item) for (key, item) in value.items()}
+    if value_type is OrderedDict:
+        return OrderedDict((key, copy_data(item)) for (key, item) in value.items())
+    if value_type is tuple:
+        return tuple(copy_data(item) for item in value)
+    return copy.deepcopy(value)
+
+
 class PipelineContext:  # pylint: disable=too-few-public-methods
     """
     Replacement for the LavaContext which only holds data for the device for the
@@ -407,3 +412,16 @@ class PipelineContext:  # pylint: disable=too-few-public-methods
     # FIXME: needs to pick up minimal general purpose config, e.g. proxy or cookies
     def __init__(self):
         self.pipeline_data = {}
+        # Number of copies of the namespace data and time spent copying
+        self.copies = 0
+        self.copy_duration = 0.0
+
+    def copy(self, value):
+        """
+        Copy a namespace data value, see copy_data.
+        """
+        start = time.time()
+        value = copy_data(value)
+        self.copy_duration += time.time() - start
+        self.copies += 1
+        return value
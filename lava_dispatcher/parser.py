@@ -27,13 +27,9 @@ from lava_dispatcher.deployment_data import get_deployment_data
 from lava_dispatcher.power import FinalizeAction
 from lava_dispatcher.connection import Protocol
 
-# Bring in the strategy subclass lists, ignore pylint warnings.
-# pylint: disable=unused-import,too-many-arguments,too-many-nested-blocks,too-many-branches
+# The strategy subclasses are imported by select() using the registry.
+# pylint: disable=too-many-arguments,too-many-nested-blocks,too-many-branches
 from lava_dispatcher.actions.commands import CommandAction
-import lava_dispatcher.actions.deploy.strategies
-import lava_dispatcher.actions.boot.strategies
-import lava_dispatcher.actions.test.strategies
-import lava_dispatcher.protocols.strategies
 
 
 def parse_action(job_data, name, device, pipeline, test_info, test_count):
@@ -80,6 +76,7 @@ class JobParser:
     Adding new behaviour is a two step process:
      - always add a new Action, usually with an internal pipeline, to implement the new behaviour
      - add a new Strategy class which creates a suitable pipeline to use that Action.
+       List it in the strategies module and register it in lava_dispatcher/registry.py.
 
     Re-use existing Action classes wherever these can be used without changes.
 
@@ -51,6 +51,13 @@ class ResetDevice(Action):
         else:
             self.internal_pipeline.add_action(SendRebootCommands())
 
+    def run(self, connection, max_end_time):
+        # The udev events of the device are expected after the reset
+        self.set_namespace_data(
+            action="shared", label="shared", key="udev-since", value=time.time()
+        )
+        return super().run(connection, max_end_time)
+
 
 class SendRebootCommands(Action):
     """
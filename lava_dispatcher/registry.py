@@ -0,0 +1,152 @@
+# Copyright (C) 2020 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+# Map the job parameters to the strategy classes able to handle them, so the
+# parser only imports the modules used by the job.
+#
+# The strategies are listed as "module:class". When a key lists more than one
+# class, the classes are kept in the order of the strategies modules as the
+# first of the strategies with the same priority is selected.
+# The strategies modules are still listing every subclass: they are imported
+# when the key is not registered or when none of the registered strategies is
+# accepting the parameters.
+
+import importlib
+
+# deploy: parameters["to"]
+DEPLOY = {
+    "docker": ["lava_dispatcher.actions.deploy.docker:Docker"],
+    "download": ["lava_dispatcher.actions.deploy.download:Download"],
+    "fastboot": ["lava_dispatcher.actions.deploy.fastboot:Fastboot"],
+    "flasher": ["lava_dispatcher.actions.deploy.flasher:Flasher"],
+    "iso-installer": ["lava_dispatcher.actions.deploy.iso:DeployIso"],
+    "lxc": ["lava_dispatcher.actions.deploy.lxc:Lxc"],
+    "mps": ["lava_dispatcher.actions.deploy.mps:Mps"],
+    "nbd": ["lava_dispatcher.actions.deploy.nbd:Nbd"],
+    "nfs": [
+        "lava_dispatcher.actions.deploy.image:DeployQemuNfs",
+        "lava_dispatcher.actions.deploy.nfs:Nfs",
+    ],
+    "overlay": ["lava_dispatcher.actions.deploy.overlay:Overlay"],
+    "recovery": ["lava_dispatcher.actions.deploy.recovery:RecoveryMode"],
+    "sata": ["lava_dispatcher.actions.deploy.removable:Removable"],
+    "sd": ["lava_dispatcher.actions.deploy.removable:Removable"],
+    "ssh": ["lava_dispatcher.actions.deploy.ssh:Ssh"],
+    "tftp": ["lava_dispatcher.actions.deploy.tftp:Tftp"],
+    "tmpfs": ["lava_dispatcher.actions.deploy.image:DeployImages"],
+    "u-boot-ums": ["lava_dispatcher.actions.deploy.uboot_ums:UBootUMS"],
+    "usb": ["lava_dispatcher.actions.deploy.removable:Removable"],
+    "vemsd": ["lava_dispatcher.actions.deploy.vemsd:VExpressMsd"],
+}
+
+# boot: parameters["method"]
+BOOT = {
+    "barebox": ["lava_dispatcher.actions.boot.barebox:Barebox"],
+    "bootloader": ["lava_dispatcher.actions.boot.bootloader:BootBootloader"],
+    "cmsis-dap": ["lava_dispatcher.actions.boot.cmsis_dap:CMSIS"],
+    "depthcharge": ["lava_dispatcher.actions.boot.depthcharge:Depthcharge"],
+    "dfu": ["lava_dispatcher.actions.boot.dfu:DFU"],
+    "docker": ["lava_dispatcher.actions.boot.docker:BootDocker"],
+    "fastboot": ["lava_dispatcher.actions.boot.fastboot:BootFastboot"],
+    "gdb": ["lava_dispatcher.actions.boot.gdb:GDB"],
+    "grub": [
+        "lava_dispatcher.actions.boot.grub:GrubSequence",
+        "lava_dispatcher.actions.boot.grub:Grub",
+    ],
+    "grub-efi": [
+        "lava_dispatcher.actions.boot.grub:GrubSequence",
+        "lava_dispatcher.actions.boot.grub:Grub",
+    ],
+    "ipxe": ["lava_dispatcher.actions.boot.ipxe:IPXE"],
+    "jlink": ["lava_dispatcher.actions.boot.jlink:JLink"],
+    "kexec": ["lava_dispatcher.actions.boot.kexec:BootKExec"],
+    "lxc": ["lava_dispatcher.actions.boot.lxc:BootLxc"],
+    "minimal": ["lava_dispatcher.actions.boot.minimal:Minimal"],
+    "monitor": ["lava_dispatcher.actions.boot.qemu:BootQEMU"],
+    "new_connection": ["lava_dispatcher.actions.boot:SecondaryShell"],
+    "openocd": ["lava_dispatcher.actions.boot.openocd:OpenOCD"],
+    "pyocd": ["lava_dispatcher.actions.boot.pyocd:PyOCD"],
+    "qemu": ["lava_dispatcher.actions.boot.qemu:BootQEMU"],
+    "qemu-iso": ["lava_dispatcher.actions.boot.iso:BootIsoInstaller"],
+    "qemu-nfs": ["lava_dispatcher.actions.boot.qemu:BootQEMU"],
+    "recovery": ["lava_dispatcher.actions.boot.recovery:RecoveryBoot"],
+    "schroot": ["lava_dispatcher.actions.boot.ssh:Schroot"],
+    "ssh": ["lava_dispatcher.actions.boot.ssh:SshLogin"],
+    "u-boot": ["lava_dispatcher.actions.boot.u_boot:UBoot"],
+    "uefi": ["lava_dispatcher.actions.boot.uefi:UefiShell"],
+    "uefi-menu": ["lava_dispatcher.actions.boot.uefi_menu:UefiMenu"],
+}
+
+# test: the first of these keys found in the parameters
+# MultinodeTestShell is accepting any test action of the multinode jobs.
+TEST_KEYS = ["definitions", "definition", "monitors", "interactive"]
+TEST = {
+    "definitions": [
+        "lava_dispatcher.actions.test.shell:TestShell",
+        "lava_dispatcher.actions.test.multinode:MultinodeTestShell",
+    ],
+    "definition": [
+        "lava_dispatcher.actions.test.shell:TestShell",
+        "lava_dispatcher.actions.test.multinode:MultinodeTestShell",
+    ],
+    "monitors": [
+        "lava_dispatcher.actions.test.multinode:MultinodeTestShell",
+        "lava_dispatcher.actions.test.monitor:TestMonitor",
+    ],
+    "interactive": [
+        "lava_dispatcher.actions.test.multinode:MultinodeTestShell",
+        "lava_dispatcher.actions.test.interactive:TestInteractive",
+    ],
+}
+
+# protocols: the keys of parameters["protocols"]
+PROTOCOLS = {
+    "lava-lxc": ["lava_dispatcher.protocols.lxc:LxcProtocol"],
+    "lava-multinode": ["lava_dispatcher.protocols.multinode:MultinodeProtocol"],
+    "lava-vland": ["lava_dispatcher.protocols.vland:VlandProtocol"],
+    "lava-xnbd": ["lava_dispatcher.protocols.xnbd:XnbdProtocol"],
+}
+
+# Modules listing every strategy, by action type
+STRATEGIES = {
+    "deploy": "lava_dispatcher.actions.deploy.strategies",
+    "boot": "lava_dispatcher.actions.boot.strategies",
+    "test": "lava_dispatcher.actions.test.strategies",
+    "protocols": "lava_dispatcher.protocols.strategies",
+}
+
+
+def load(registry, key):
+    """
+    Import and return the strategy classes registered for this key.
+    Return None when the key is not registered.
+    """
+    if not isinstance(key, str) or key not in registry:
+        return None
+    classes = []
+    for name in registry[key]:
+        module, cls_name = name.split(":")
+        classes.append(getattr(importlib.import_module(module), cls_name))
+    return classes
+
+
+def load_all(action_type):
+    """
+    Import every strategy of this action type
+    """
+    importlib.import_module(STRATEGIES[action_type])
@@ -21,6 +21,8 @@
 import contextlib
 import logging
 import pexpect
+import pexpect.expect
+import pexpect.spawnbase
 import sre_constants
 import sys
 import time
@@ -28,51 +30,137 @@ from lava_dispatcher.action import Action
 from lava_common.exceptions import InfrastructureError, JobError, LAVABug, TestError
 from lava_common.timeout import Timeout
 from lava_dispatcher.connection import Connection
-from lava_common.constants import LINE_SEPARATOR
+from lava_common.constants import CONSOLE_LINE_MAX_LENGTH, LINE_SEPARATOR
 from lava_dispatcher.utils.strings import seconds_to_str
 
+# Since pexpect 4.6, the data is kept in io buffers (spawn._buffer and
+# spawn._before) instead of strings. The bounded search and wait_echo() need
+# these buffers.
+PEXPECT_IO_BUFFERS = isinstance(
+    getattr(pexpect.spawnbase.SpawnBase, "buffer", None), property
+)
+
 
 class ShellLogger:
     """
     Builds a YAML log message out of the incremental output of the pexpect.spawn
     using the logfile support built into pexpect.
+
+    Lines longer than CONSOLE_LINE_MAX_LENGTH are split. When a rate limit is
+    set (in lines per second), the lines above the limit are only counted and
+    reported as suppressed. The pattern matching always gets the full data.
     """
 
-    def __init__(self, logger):
+    # remove carriage returns and escape control characters, escape double
+    # quotes for YAML syntax
+    TRANSLATION = str.maketrans({"\r": None, "\x1b": None, '"': '\\"'})
+
+    def __init__(self, logger, rate_limit=None):
         self.line = ""
         self.logger = logger
         self.is_feedback = False
+        self.rate_limit = rate_limit
+        self.period = 0
+        self.count = 0
+        self.suppressed = 0
 
     def write(self, new_line):
-        replacements = {
-            "\n\n": "\n",  # double lines to single
-            "\r": "",
-            '"': '\\"',  # escape double quotes for YAML syntax
-            "\x1b": "",  # remove escape control characters
-        }
-        for key, value in replacements.items():
-            new_line = new_line.replace(key, value)
-        lines = self.line + new_line
+        # double lines to single
+        new_line = new_line.replace("\n\n", "\n").translate(self.TRANSLATION)
 
         # Print one full line at a time. A partial line is kept in memory.
-        if "\n" in lines:
-            last_ret = lines.rindex("\n")
-            self.line = lines[last_ret + 1 :]
-            lines = lines[:last_ret]
-            for line in lines.split("\n"):
-                if self.is_feedback:
-                    self.logger.feedback(line)
-                else:
-                    self.logger.target(line)
+        lines = (self.line + new_line).split("\n")
+        self.line = lines.pop()
+        for line in lines:
+            self.log(line)
+        while len(self.line) > CONSOLE_LINE_MAX_LENGTH:
+            self.log(self.line[:CONSOLE_LINE_MAX_LENGTH])
+            self.line = self.line[CONSOLE_LINE_MAX_LENGTH:]
+
+    def log(self, line):
+        while len(line) > CONSOLE_LINE_MAX_LENGTH:
+            self.log(line[:CONSOLE_LINE_MAX_LENGTH])
+            line = line[CONSOLE_LINE_MAX_LENGTH:]
+        if self.rate_limit:
+            period = int(time.time())
+            if period != self.period:
+                self.report()
+                self.period = period
+                self.count = 0
+            self.count += 1
+            if self.count > self.rate_limit:
+                self.suppressed += 1
+                return
+        if self.is_feedback:
+            self.logger.feedback(line)
         else:
-            self.line = lines
-        return
+            self.logger.target(line)
+
+    def report(self):
+        if self.suppressed:
+            self.logger.warning(
+                "%d lines suppressed (more than %d lines per second)",
+                self.suppressed,
+                self.rate_limit,
+            )
+            self.suppressed = 0
 
-    def flush(self):  # pylint: disable=no-self-use
+    def flush(self):
+        # Report the end of a burst without waiting for the next line
+        if self.suppressed and int(time.time()) != self.period:
+            self.report()
         sys.stdout.flush()
         sys.stderr.flush()
 
 
+class BoundedSearcher(pexpect.expect.searcher_re):
+    """
+    The window is already bounded by the BoundedExpecter: search all of it,
+    including the fresh data.
+    """
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        return super().search(buffer, freshlen)
+
+
+class BoundedExpecter(pexpect.expect.Expecter):
+    """
+    Only search the newly received data and the end of the previous data.
+
+    Without a search window, pexpect searches the whole buffer for every read,
+    so the cost grows quadratically when the patterns are not matching.
+    The previous data is kept up to searchwindowsize characters, starting on a
+    line boundary, so patterns spanning a few lines (like the test shell
+    signals) are still matched.
+    """
+
+    def existing_data(self):
+        # The data received before the call has not been searched for these
+        # patterns yet.
+        spawn = self.spawn
+        window = spawn._before.getvalue()
+        spawn._buffer = spawn.buffer_type()
+        spawn._buffer.write(window)
+        return self.do_search(window, len(window))
+
+    def new_data(self, data):
+        spawn = self.spawn
+        spawn._before.write(data)
+        spawn._buffer.write(data)
+        return self.do_search(spawn._buffer.getvalue(), len(data))
+
+    def do_search(self, window, freshlen):
+        index = super().do_search(window, freshlen)
+        if index is None and len(window) > self.searchwindowsize:
+            overlap = window[-self.searchwindowsize :]
+            newline = overlap.find("\n")
+            if newline >= 0:
+                overlap = overlap[newline + 1 :]
+            self.spawn._buffer = self.spawn.buffer_type()
+            self.spawn._buffer.write(overlap)
+        return index
+
+
 class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
     """
     Run a command over a connection using pexpect instead of
@@ -83,11 +171,25 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
 
     Window size is managed to limit impact on performance.
     maxread is left at default to ensure the entire log is captured.
+    When search_window is set, each read is only matched against the new data
+    and the last search_window characters, see BoundedExpecter (only with
+    pexpect >= 4.6).
+    rate_limit is the maximum number of lines logged per second, see
+    ShellLogger.
 
     A ShellCommand is a raw_connection for a ShellConnection instance.
     """
 
-    def __init__(self, command, lava_timeout, logger=None, cwd=None, window=2000):
+    def __init__(
+        self,
+        command,
+        lava_timeout,
+        logger=None,
+        cwd=None,
+        window=2000,
+        search_window=None,
+        rate_limit=None,
+    ):
         if isinstance(window, str):
             # constants need to be stored as strings.
             try:
@@ -97,6 +199,14 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
                     "ShellCommand was passed an invalid window size of %s bytes."
                     % window
                 )
+        if isinstance(search_window, str):
+            try:
+                search_window = int(search_window)
+            except ValueError:
+                raise LAVABug(
+                    "ShellCommand was passed an invalid search window size of %s bytes."
+                    % search_window
+                )
         if not lava_timeout or not isinstance(lava_timeout, Timeout):
             raise LAVABug("ShellCommand needs a timeout set by the calling Action")
         if not logger:
@@ -106,10 +216,11 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
             command,
             timeout=lava_timeout.duration,
             cwd=cwd,
-            logfile=ShellLogger(logger),
+            logfile=ShellLogger(logger, rate_limit),
             encoding="utf-8",
             # Data before searchwindowsize point is preserved, but not searched.
-            searchwindowsize=None,  # pattern match the entire buffer
+            # None to pattern match the entire buffer
+            searchwindowsize=search_window or None,
             maxread=window,  # limit the size of the buffer. 1 to turn off buffering
             codec_errors="replace",
         )
@@ -143,6 +254,10 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
     def send(self, string, delay=0, send_char=True):  # pylint: disable=arguments-differ
         """
         Extends pexpect.send to support extra arguments, delay and send by character flags.
+
+        When sending by character with a delay, the next character is sent as
+        soon as the previous one is echoed: the delay is only the maximum
+        time to wait for the echo.
         """
         sent = 0
         if not string:
@@ -151,11 +266,50 @@ class ShellCommand(pexpect.spawn):  # pylint: disable=too-many-public-methods
         if send_char:
             for char in string:
                 sent += super().send(char)
-                time.sleep(delay)
+                if delay:
+                    self.wait_echo(char, delay)
         else:
             sent = super().send(string)
         return sent
 
+    def wait_echo(self, string, timeout):
+        """
+        Wait, at most timeout seconds, for the string to be echoed.
+        The data read is kept in the buffer for the next call to expect.
+        """
+        end = time.time() + timeout
+        echo = ""
+        while string not in echo:
+            remaining = end - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                data = self.read_nonblocking(self.maxread, remaining)
+            except (pexpect.TIMEOUT, pexpect.EOF):
+                # EOF will be raised again by the next call to expect
+                return False
+            if PEXPECT_IO_BUFFERS:
+                self._before.write(data)
+                self._buffer.write(data)
+            else:
+                self.buffer += data
+            echo += data
+        return True
+
+    def expect_list(
+        self, pattern_list, timeout=-1, searchwindowsize=-1, async_=False, **kw
+    ):
+        if searchwindowsize == -1:
+            searchwindowsize = self.searchwindowsize
+        if not searchwindowsize or async_ or kw or not PEXPECT_IO_BUFFERS:
+            return super().expect_list(
+                pattern_list, timeout, searchwindowsize, async_, **kw
+            )
+        if timeout == -1:
+            timeout = self.timeout
+        exp = BoundedExpecter(self, BoundedSearcher(pattern_list), searchwindowsize)
+        return exp.expect_loop(timeout)
+
     def expect(self, *args, **kw):  # pylint: disable=arguments-differ
         """
         No point doing explicit logging here, the SignalDirector can help
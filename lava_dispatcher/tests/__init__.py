@@ -7,8 +7,10 @@ from lava_dispatcher.tests.utils import DummyLogger
 logging.getLogger("requests").setLevel(logging.WARNING)
 
 
-def shellcommand_dummy_logger_init(self, command, lava_timeout, logger=None, cwd=None):
-    self.__old_init__(command, lava_timeout, DummyLogger(), cwd)
+def shellcommand_dummy_logger_init(
+    self, command, lava_timeout, logger=None, cwd=None, **kwargs
+):
+    self.__old_init__(command, lava_timeout, DummyLogger(), cwd, **kwargs)
 
 
 ShellCommand.__old_init__ = ShellCommand.__init__
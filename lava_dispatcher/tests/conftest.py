@@ -49,6 +49,13 @@ def no_network(monkeypatch, request):
     if not skip_tests & set(request.keywords.keys()):
         monkeypatch.setattr(requests, "head", head)
         monkeypatch.setattr(requests, "get", get)
+        # The downloads are using the session returned by requests_session()
+        monkeypatch.setattr(
+            requests.Session, "head", lambda session, url, **kwargs: head(url, **kwargs)
+        )
+        monkeypatch.setattr(
+            requests.Session, "get", lambda session, url, **kwargs: get(url, **kwargs)
+        )
 
     # Fake netifaces to always return the same results
     def gateways():
@@ -19,7 +19,9 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import os
+import subprocess  # nosec - unit test support.
 import sys
+import tempfile
 import time
 import jinja2
 import voluptuous
@@ -42,6 +44,7 @@ from lava_dispatcher.job import Job
 from lava_dispatcher.device import NewDevice
 from lava_dispatcher.actions.deploy.image import DeployImages
 from lava_dispatcher.tests.utils import DummyLogger
+from lava_common.timeout import Timeout
 
 # pylint: disable=invalid-name,C0330,no-self-use
 
@@ -528,6 +531,22 @@ class TestPipeline(StdoutTestCase):  # pylint: disable=too-many-public-methods
         self.assertNotEqual(
             test_action.get_namespace_data("common", "unknown", "simple"), 1
         )
+        # The values are copied, including the nested ones
+        copies = job.__context__.copies
+        value = test_action.get_namespace_data("common", "ns", "dict2")
+        value["key"]["nest"] = False
+        self.assertEqual(
+            test_action.get_namespace_data("common", "ns", "dict2"),
+            {"key": {"nest": True}},
+        )
+        self.assertEqual(job.__context__.copies, copies + 2)
+        # Unless asked for the reference
+        value = test_action.get_namespace_data("common", "ns", "dict2", deepcopy=False)
+        value["key"]["nest"] = False
+        self.assertEqual(
+            test_action.get_namespace_data("common", "ns", "dict2"),
+            {"key": {"nest": False}},
+        )
 
 
 class TestFakeActions(StdoutTestCase):  # pylint: disable=too-many-public-methods
@@ -583,6 +602,52 @@ class TestFakeActions(StdoutTestCase):  # pylint: disable=too-many-public-method
         conn = object()
         self.assertIsNot(conn, pipe.run_actions(conn, None))
 
+    def test_profile(self):
+        class RunCommand(Action):
+            name = "run-command"
+
+            def run(self, connection, max_end_time):
+                subprocess.check_call(["sleep", "0.2"])  # nosec - unit test
+                return connection
+
+        class Results(DummyLogger):
+            def __init__(self):
+                self.data = []
+
+            def results(self, data):  # pylint: disable=arguments-differ
+                self.data.append(data)
+
+        logger = Results()
+        job = Job(1234, {"profile": "cprofile"}, logger)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            job.output_dir = tmp_dir
+            job.pipeline = Pipeline(job=job)
+            job.pipeline.add_action(RunCommand())
+            job.pipeline.add_action(TestFakeActions.KeepConnection())
+            job.timeout = Timeout("job", 60)
+            job.cleaned = True
+            job.run()
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(tmp_dir, "profile"))),
+                ["1-run-command.pstats", "2-keep-connection.pstats"],
+            )
+
+        self.assertEqual(len(logger.data), 1)
+        self.assertEqual(logger.data[0]["case"], "profile")
+        self.assertEqual(logger.data[0]["level"], "0")
+        actions = logger.data[0]["extra"]["actions"]
+        self.assertEqual(
+            [(a["level"], a["name"]) for a in actions],
+            [("1", "run-command"), ("2", "keep-connection")],
+        )
+        self.assertGreaterEqual(actions[0]["wall"], 0.2)
+        self.assertGreater(actions[0]["lifetime_peak_rss"], 0)
+        self.assertGreaterEqual(actions[0]["peak_rss_increase"], 0)
+        self.assertLessEqual(
+            actions[1]["peak_rss_increase"], actions[1]["lifetime_peak_rss"]
+        )
+        self.assertLess(actions[0]["cpu"], actions[0]["wall"])
+
 
 class TestStrategySelector(StdoutTestCase):
     """
@@ -609,3 +674,33 @@ class TestStrategySelector(StdoutTestCase):
         ]
         willing.sort(key=lambda x: x.priority, reverse=True)
         self.assertIsInstance(willing[0], TestStrategySelector.Third)
+
+    def test_registry(self):
+        from lava_dispatcher import registry
+        from lava_dispatcher.connection import Protocol
+        from lava_dispatcher.logical import Boot, Deployment, LavaTest
+
+        for reg, base in [
+            (registry.DEPLOY, Deployment),
+            (registry.BOOT, Boot),
+            (registry.TEST, LavaTest),
+            (registry.PROTOCOLS, Protocol),
+        ]:
+            for key in reg:
+                for cls in registry.load(reg, key):
+                    self.assertTrue(issubclass(cls, base))
+        self.assertIsNone(registry.load(registry.BOOT, "unknown"))
+        self.assertIsNone(registry.load(registry.DEPLOY, None))
+
+        # every strategy is listed in the strategies modules
+        registered = {
+            name.split(":")[1]
+            for reg in [registry.DEPLOY, registry.BOOT, registry.TEST]
+            for names in reg.values()
+            for name in names
+        }
+        for action_type in ["deploy", "boot", "test"]:
+            registry.load_all(action_type)
+        for base in [Deployment, Boot, LavaTest]:
+            for cls in base.__subclasses__():
+                self.assertIn(cls.__name__, registered)
@@ -0,0 +1,187 @@
+# Copyright (C) 2019 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+
+from lava_dispatcher.tests.test_basic import StdoutTestCase
+from lava_dispatcher.utils.cache import DownloadCache, RootfsCache
+
+
+class TestDownloadCache(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = DownloadCache(os.path.join(self.tmpdir, "cache"), size=10)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def create(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as f_out:
+            f_out.write(data)
+        md5 = hashlib.md5(data).hexdigest()  # nosec - not used for cryptography
+        return (path, md5, hashlib.sha256(data).hexdigest())
+
+    def test_from_config(self):
+        self.assertIsNone(DownloadCache.from_config({}))
+        cache = DownloadCache.from_config(
+            {"download_cache": {"path": os.path.join(self.tmpdir, "c"), "size": 20}}
+        )
+        self.assertEqual(cache.size, 20)
+
+    def test_lookup(self):
+        url = "http://example.com/kernel"
+        (path, md5, sha256) = self.create("kernel", b"kernel")
+        self.assertIsNone(self.cache.lookup(url, None, md5, sha256))
+        self.cache.store(url, None, path, md5, sha256, 6, {"etag": "1234"})
+
+        # Using the checksums or the validators
+        self.assertEqual(self.cache.lookup(url, None, sha256sum=sha256)["size"], 6)
+        self.assertEqual(self.cache.lookup(url, None, md5sum=md5)["sha256"], sha256)
+        self.assertIsNone(self.cache.lookup(url, None, md5sum="0000"))
+        self.assertIsNotNone(self.cache.lookup(url, None, validators={"etag": "1234"}))
+        self.assertIsNone(self.cache.lookup(url, None, validators={"etag": "5678"}))
+        self.assertIsNone(self.cache.lookup(url, None))
+        self.assertIsNone(self.cache.lookup(url, "xz", sha256sum=sha256))
+
+        # Fetch the file
+        entry = self.cache.lookup(url, None, sha256sum=sha256)
+        dst = os.path.join(self.tmpdir, "dst")
+        self.cache.fetch(entry, dst)
+        with open(dst, "rb") as f_in:
+            self.assertEqual(f_in.read(), b"kernel")
+
+        # Evicted by another job between the lookup and the fetch
+        os.unlink(entry["path"])
+        self.assertIsNone(self.cache.fetch(entry, dst))
+
+    def test_evict(self):
+        (path, md5, sha256) = self.create("kernel", b"kernel")
+        self.cache.store("http://example.com/kernel", None, path, md5, sha256, 6)
+        os.utime(self.cache._object(sha256, None), (0, 0))
+        (path, md5, sha256_2) = self.create("dtb", b"dtb-file")
+        self.cache.store("http://example.com/dtb", None, path, md5, sha256_2, 8)
+
+        # The least recently used file was removed
+        self.assertIsNone(self.cache.lookup(None, None, sha256sum=sha256))
+        self.assertIsNotNone(self.cache.lookup(None, None, sha256sum=sha256_2))
+
+    def test_pin(self):
+        (path, md5, sha256) = self.create("kernel", b"kernel")
+        self.cache.store("http://example.com/kernel", None, path, md5, sha256, 6)
+        entry = self.cache.lookup(None, None, sha256sum=sha256)
+        f_pin = self.cache.pin(entry["path"])
+        (path, md5, sha256_2) = self.create("dtb", b"dtb-file")
+        self.cache.store("http://example.com/dtb", None, path, md5, sha256_2, 8)
+
+        # The pinned file is kept
+        self.assertIsNotNone(self.cache.lookup(None, None, sha256sum=sha256))
+        f_pin.close()
+        self.cache.store("http://example.com/dtb", None, path, md5, sha256_2, 8)
+        self.assertIsNone(self.cache.lookup(None, None, sha256sum=sha256))
+
+    def test_overlay(self):
+        calls = []
+
+        def render(path):
+            calls.append(path)
+            with open(os.path.join(path, "lava-test-runner"), "w") as f_out:
+                f_out.write("#!/bin/sh\n")
+
+        with self.cache.overlay("1234", render) as path:
+            self.assertEqual(os.listdir(path), ["lava-test-runner"])
+        # Only rendered once
+        with self.cache.overlay("1234", render) as path:
+            self.assertEqual(os.listdir(path), ["lava-test-runner"])
+        self.assertEqual(len(calls), 1)
+
+        # Nothing is kept on failure
+        with self.assertRaises(OSError):
+            with self.cache.overlay("5678", lambda path: open("/nonexistent/file")):
+                pass
+        self.assertEqual(os.listdir(self.cache.overlays), ["1234"])
+
+    def test_evict_overlay(self):
+        def render(path):
+            with open(os.path.join(path, "lava-test-runner"), "w") as f_out:
+                f_out.write("#!/bin/sh\n")
+
+        with self.cache.overlay("1234", render) as path:
+            pass
+        os.utime(path, (0, 0))
+        # The least recently used overlay was removed
+        with self.cache.overlay("5678", render):
+            pass
+        self.assertEqual(os.listdir(self.cache.overlays), ["5678"])
+
+        # Cached files and overlays are accounted together
+        os.utime(os.path.join(self.cache.overlays, "5678"), (0, 0))
+        (path, md5, sha256) = self.create("kernel", b"kernel")
+        self.cache.store("http://example.com/kernel", None, path, md5, sha256, 6)
+        self.assertEqual(os.listdir(self.cache.overlays), [])
+        self.assertIsNotNone(self.cache.lookup(None, None, sha256sum=sha256))
+
+
+class TestRootfsCache(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = RootfsCache(os.path.join(self.tmpdir, "cache"), size=30000)
+        os.makedirs(os.path.join(self.tmpdir, "rootfs", "etc"))
+        with open(
+            os.path.join(self.tmpdir, "rootfs", "etc", "hostname"), "wb"
+        ) as f_out:
+            f_out.write(b"x" * 10000)
+        self.archive = os.path.join(self.tmpdir, "rootfs.tar")
+        with tarfile.open(self.archive, "w") as tar:
+            tar.add(os.path.join(self.tmpdir, "rootfs"), arcname=".")
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def test_clone(self):
+        dst = tempfile.mkdtemp(dir=self.tmpdir)
+        self.assertFalse(self.cache.clone("1234", dst))
+        self.cache.store("1234", self.archive)
+        self.assertTrue(self.cache.clone("1234", dst))
+
+        # Modifying the clone does not modify the cached tree
+        with open(os.path.join(dst, "etc", "hostname"), "wb") as f_out:
+            f_out.write(b"lava")
+        dst = tempfile.mkdtemp(dir=self.tmpdir)
+        self.assertTrue(self.cache.clone("1234", dst))
+        with open(os.path.join(dst, "etc", "hostname"), "rb") as f_in:
+            self.assertEqual(f_in.read(), b"x" * 10000)
+
+    def test_evict(self):
+        self.cache.store("1234", self.archive)
+        os.utime(os.path.join(self.cache.trees, "1234.yaml"), (0, 0))
+        self.cache.store("5678", self.archive)
+        self.cache.store("9012", self.archive)
+
+        # The least recently used tree was removed
+        dst = tempfile.mkdtemp(dir=self.tmpdir)
+        self.assertFalse(self.cache.clone("1234", dst))
+        self.assertTrue(self.cache.clone("5678", dst))
@@ -19,7 +19,12 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 
+import time
+import unittest.mock
+
 from lava_common.exceptions import JobError
+from lava_dispatcher.actions.boot.cmsis_dap import FlashCMSISAction
+from lava_dispatcher.power import PDUReboot
 from lava_dispatcher.tests.test_basic import Factory, StdoutTestCase
 
 
@@ -80,3 +85,43 @@ class TestCMSISAction(StdoutTestCase):  # pylint: disable=too-many-public-method
         job.validate()
         description_ref = self.pipeline_reference("cmsis-with-power.yaml", job=job)
         self.assertEqual(description_ref, job.pipeline.describe(False))
+
+    def test_udev_since(self):
+        factory = Cmsis_Factory()
+        job = factory.create_k64f_job_with_power(
+            "sample_jobs/zephyr-frdm-k64f-cmsis-test-kernel-common.yaml"
+        )
+        boot = [
+            action for action in job.pipeline.actions if action.name == "boot-cmsis"
+        ][0]
+        retry = boot.internal_pipeline.actions[0]
+        (reset, wait_path, flash, wait_serial, _) = retry.internal_pipeline.actions
+        flash.usb_mass_device = "/dev/null"
+        wait_serial.validate()
+
+        waits = []
+
+        def wait(udev_filter, present, since):
+            waits.append((present, since))
+
+        with unittest.mock.patch(
+            "lava_dispatcher.utils.udev._wait_udev_event", wait
+        ), unittest.mock.patch.object(PDUReboot, "run_cmd"), unittest.mock.patch.object(
+            FlashCMSISAction, "run_command"
+        ):
+            # The device path is added after the reset
+            start = time.time()
+            end = start + 30
+            reset.run(None, end)
+            wait_path.run(None, end)
+            # The serial device is added after the flash
+            middle = time.time()
+            flash.run(None, end)
+            wait_serial.run(None, end)
+            # Nothing was reset since the last wait
+            wait_serial.run(None, end)
+        self.assertEqual(len(waits), 3)
+        self.assertFalse(any(present for (present, _) in waits))
+        self.assertTrue(start <= waits[0][1] <= middle)
+        self.assertTrue(middle <= waits[1][1] <= time.time())
+        self.assertIsNone(waits[2][1])
@@ -18,13 +18,20 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import bz2
 import copy
+import gzip
+import lzma
 import os
 import hashlib
-from lava_common.exceptions import InfrastructureError
+import tempfile
+import time
+import unittest.mock
+from lava_common.exceptions import InfrastructureError, JobError
 from lava_dispatcher.tests.test_basic import Factory, StdoutTestCase
 from lava_dispatcher.utils.compression import decompress_file
 from lava_dispatcher.utils.compression import decompress_command_map
+from lava_dispatcher.utils.compression import StreamWriter
 
 
 class TestDecompression(StdoutTestCase):
@@ -109,3 +116,58 @@ class TestDecompression(StdoutTestCase):
         with self.assertRaises(InfrastructureError):
             decompress_file("/tmp/test.xz", "zip")  # nosec - unit test only.
         self.assertEqual(copy_of_command_map, decompress_command_map)
+
+
+class TestStreamWriter(StdoutTestCase):
+    def test_stream_writer(self):
+        data = os.urandom(512 * 1024) * 4
+        codecs = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+        for (compression, compress) in codecs.items():
+            # Concatenated streams are decompressed like the command line tools
+            compressed = compress(data[:1024]) + compress(data[1024:])
+            with tempfile.TemporaryFile() as f_out:
+                writer = StreamWriter(f_out, compression)
+                for index in range(0, len(compressed), 4096):
+                    writer.write(compressed[index : index + 4096])
+                writer.close()
+                f_out.seek(0)
+                self.assertEqual(f_out.read(), data)
+
+            # Truncated data is an error
+            with tempfile.TemporaryFile() as f_out:
+                writer = StreamWriter(f_out, compression)
+                writer.write(compressed[: len(compressed) // 2])
+                with self.assertRaises(JobError):
+                    writer.close()
+
+    def test_stream_writer_error(self):
+        # Use the python codecs even if the tools are installed
+        with unittest.mock.patch.dict(
+            "lava_dispatcher.utils.compression.decompress_stream_tools", clear=True
+        ):
+            with tempfile.TemporaryFile() as f_out:
+                writer = StreamWriter(f_out, "gz")
+                self.assertEqual(writer.tool, "python")
+                writer.write(b"garbage" * 1024)
+                while writer.error is None:
+                    time.sleep(0.01)
+                self.assertIn("Unable to decompress", str(writer.error))
+                with self.assertRaises(JobError):
+                    writer.write(b"garbage")
+                writer.abort()
+                self.assertIsNone(writer.thread)
+
+            with tempfile.TemporaryFile() as f_out:
+                writer = StreamWriter(f_out, "gz")
+                writer.write(b"garbage" * 1024)
+                writer.write(b"garbage" * 1024)
+                with self.assertRaises(JobError):
+                    writer.close()
+                self.assertIsNone(writer.thread)
+
+            # Aborting without any error
+            with tempfile.TemporaryFile() as f_out:
+                writer = StreamWriter(f_out, "gz")
+                writer.write(gzip.compress(b"data"))
+                writer.abort()
+                self.assertIsNone(writer.thread)
@@ -19,10 +19,17 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 
+import contextlib
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import yaml
 import logging
 import unittest
+import unittest.mock
 from lava_common.exceptions import JobError, InfrastructureError
 from lava_common.timeout import Timeout
 from lava_dispatcher.actions.boot.ssh import SchrootAction
@@ -30,6 +37,9 @@ from lava_dispatcher.tests.test_basic import Factory, StdoutTestCase
 from lava_dispatcher.tests.utils import infrastructure_error
 from lava_dispatcher.utils.filesystem import check_ssh_identity_file
 from lava_dispatcher.protocols.multinode import MultinodeProtocol
+from lava_dispatcher.shell import ShellCommand, ShellLogger
+from lava_dispatcher.console import Broker, RingBuffer, console_socket
+from lava_dispatcher.connection import CONSOLE_TAG
 
 
 class ConnectionFactory(Factory):  # pylint: disable=too-few-public-methods
@@ -498,6 +508,223 @@ commands:
         self.assertEqual(["primary", "telnet"], connect.tag_dict[connect.hardware])
 
 
+class TestCharacterDelay(StdoutTestCase):
+    def test_echo(self):
+        # The terminal echoes each character immediately
+        shell = ShellCommand("cat", Timeout("fake", 30), logger=logging.getLogger())
+        start = time.time()
+        shell.send("setenv bootargs console=ttyS0\n", delay=500)
+        self.assertLess(time.time() - start, 5)
+        # The echo is kept for the next expect
+        self.assertEqual(shell.expect(["bootargs console=ttyS0"]), 0)
+        shell.close()
+
+    def test_echo_string_buffer(self):
+        # Older pexpect versions are keeping the data in a string
+        with unittest.mock.patch("lava_dispatcher.shell.PEXPECT_IO_BUFFERS", False):
+            self.test_echo()
+
+    def test_no_echo(self):
+        shell = ShellCommand(
+            "sh -c 'stty -echo && cat >/dev/null'",
+            Timeout("fake", 30),
+            logger=logging.getLogger(),
+        )
+        time.sleep(0.5)
+        start = time.time()
+        shell.send("boot", delay=100)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+        shell.close()
+
+
+class TestShellLogger(StdoutTestCase):
+    class RecordingLogger:
+        def __init__(self):
+            self.records = []
+
+        def target(self, message):
+            self.records.append(("target", message))
+
+        def feedback(self, message):
+            self.records.append(("feedback", message))
+
+        def warning(self, message, *args):
+            self.records.append(("warning", message % args))
+
+    def test_lines(self):
+        logger = self.RecordingLogger()
+        shell_logger = ShellLogger(logger)
+        shell_logger.write('U-Boot \x1b[0m"2019.01"\r\n\r\nboot')
+        shell_logger.write("ing...\n\n" + "x" * 25000)
+        self.assertEqual(
+            logger.records,
+            [
+                ("target", 'U-Boot [0m\\"2019.01\\"'),
+                ("target", ""),
+                ("target", "booting..."),
+                ("target", "x" * 10000),
+                ("target", "x" * 10000),
+            ],
+        )
+        self.assertEqual(shell_logger.line, "x" * 5000)
+
+    def test_rate_limit(self):
+        logger = self.RecordingLogger()
+        shell_logger = ShellLogger(logger, rate_limit=10)
+        shell_logger.period = int(time.time()) + 10
+        shell_logger.write("line\n" * 100)
+        self.assertEqual(logger.records, [("target", "line")] * 10)
+        self.assertEqual(shell_logger.suppressed, 90)
+        shell_logger.period = 0
+        shell_logger.write("last line\n")
+        self.assertEqual(
+            logger.records[10:],
+            [
+                ("warning", "90 lines suppressed (more than 10 lines per second)"),
+                ("target", "last line"),
+            ],
+        )
+
+
+class TestConsoleBroker(StdoutTestCase):
+    def test_ring_buffer(self):
+        buf = RingBuffer(10)
+        buf.append(b"12345", 1)
+        buf.append(b"67890", 2)
+        buf.append(b"abc", 3)
+        self.assertEqual(buf.length, 10)
+        self.assertEqual(buf.since(0), b"4567890abc")
+        self.assertEqual(buf.since(2), b"67890abc")
+        self.assertEqual(buf.since(4), b"")
+        buf.append(b"x" * 20, 4)
+        self.assertEqual(buf.since(0), b"x" * 10)
+
+    def read_until(self, sock, pattern):
+        data = b""
+        sock.settimeout(10)
+        while pattern not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def test_broker(self):
+        path = tempfile.mkdtemp()
+        command = "sh -c 'echo early boot; exec cat'"
+        broker = Broker({"dut": command}, path)
+        thread = threading.Thread(target=broker.run)
+        thread.start()
+        try:
+            console = broker.consoles[0]
+            for _ in range(100):
+                if console.buffer.length:
+                    break
+                time.sleep(0.1)
+
+            # Replay the output received before attaching
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(console_socket(path, command))
+            sock.sendall(b"0\nhello\n")
+            data = self.read_until(sock, b"hello")
+            self.assertIn(b"early boot", data)
+            self.assertIn(b"hello", data)
+            sock.close()
+
+            # Only the output received since the timestamp
+            since = time.time()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(console_socket(path, command))
+            sock.sendall(b"%f\nworld\n" % since)
+            data = self.read_until(sock, b"world")
+            self.assertNotIn(b"early boot", data)
+            self.assertIn(b"world", data)
+            sock.close()
+        finally:
+            broker.stop()
+            thread.join()
+            shutil.rmtree(path)
+        self.assertFalse(os.path.exists(console_socket(path, command)))
+
+
+class TestConsoleBrokerConnection(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = tempfile.mkdtemp()
+        self.job = ConnectionFactory().create_job(
+            "mps2plus-01.jinja2", "sample_jobs/mps2plus.yaml", validate=False
+        )
+        self.job.parameters.setdefault("dispatcher", {})["console_broker"] = {
+            "path": self.path
+        }
+        self.connect = self.find_action("minimal-boot", "connect-device")
+        with unittest.mock.patch("lava_dispatcher.connections.serial.which"):
+            self.connect.validate()
+        self.connect.shell_class = unittest.mock.MagicMock()
+        self.connect.shell_class.return_value.exitstatus = 0
+        self.connect.session_class = unittest.mock.MagicMock()
+        self.socket = console_socket(self.path, self.connect.command)
+
+    def find_action(self, parent, name):
+        parent = [
+            action for action in self.job.pipeline.actions if action.name == parent
+        ][0]
+        return [
+            action for action in parent.internal_pipeline.actions if action.name == name
+        ][0]
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.path)
+
+    def command(self):
+        self.connect.run(None, None)
+        return self.connect.shell_class.call_args[0][0]
+
+    def test_attach(self):
+        with contextlib.closing(
+            socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        ) as server:
+            server.bind(self.socket)
+            server.listen(1)
+            self.connect.set_namespace_data(
+                action="shared", label="shared", key="console-since", value=1234.5
+            )
+            self.assertEqual(
+                self.command(),
+                "lava-console attach --since 1234.500000 %s\n" % self.socket,
+            )
+        connection = self.connect.session_class.return_value
+        self.assertIn(CONSOLE_TAG, connection.tags)
+
+    def test_no_broker(self):
+        self.assertEqual(self.command(), "%s\n" % self.connect.command)
+
+    def test_stale_socket(self):
+        # The broker was killed without removing its socket
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket)
+        server.close()
+        self.assertTrue(os.path.exists(self.socket))
+        self.assertEqual(self.command(), "%s\n" % self.connect.command)
+
+    def test_disconnect(self):
+        disconnect = self.find_action("mps-deploy", "disconnect-device")
+        connection = unittest.mock.MagicMock()
+        connection.tags = [CONSOLE_TAG, "primary", "telnet"]
+        disconnect.set_namespace_data(
+            action="shared", label="shared", key="connection", value=connection
+        )
+        start = time.time()
+        disconnect.run(None, None)
+        connection.disconnect.assert_called_once_with()
+        since = disconnect.get_namespace_data(
+            action="shared", label="shared", key="console-since"
+        )
+        self.assertGreaterEqual(since, start)
+        self.assertLessEqual(since, time.time())
+
+
 class TestTimeouts(StdoutTestCase):
     """
     Test action and connection timeout parsing.
@@ -253,6 +253,25 @@ class TestDefinitionHandlers(StdoutTestCase):  # pylint: disable=too-many-public
             stat.S_IRWXU | stat.S_IXGRP | stat.S_IRGRP | stat.S_IXOTH | stat.S_IROTH,
         )
 
+    def test_overlay_scripts_key(self):
+        overlay = None
+        for action in self.job.pipeline.actions:
+            if isinstance(action, DeployAction):
+                for child in action.pipeline.actions:
+                    if isinstance(child, OverlayAction):
+                        overlay = child
+                        break
+        self.assertIsInstance(overlay, OverlayAction)
+        overlay.scripts_to_copy = sorted(
+            glob.glob(os.path.join(overlay.lava_test_dir, "lava-*"))
+        )
+        key = overlay._scripts_key("/bin/sh")
+        self.assertEqual(overlay._scripts_key("/bin/sh"), key)
+        # The rendered scripts depend on the shell and the device
+        self.assertNotEqual(overlay._scripts_key("/bin/bash"), key)
+        overlay.target_ip = "192.168.0.2"
+        self.assertNotEqual(overlay._scripts_key("/bin/sh"), key)
+
     def test_overlay_override(self):
         job = self.factory.create_job("qemu01.jinja2", "sample_jobs/kvm-context.yaml")
         deploy = [
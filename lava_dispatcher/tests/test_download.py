@@ -18,10 +18,23 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import hashlib
+import os
+import shutil
+import tempfile
+import types
 import unittest
-from lava_common.exceptions import JobError
+import unittest.mock
+from urllib.parse import urlparse
+
+import requests
+
+from lava_common.exceptions import InfrastructureError, JobError
 from lava_dispatcher.tests.test_basic import Factory, StdoutTestCase
+from lava_dispatcher.actions.boot.qemu import CallQemuAction
 from lava_dispatcher.actions.deploy import DeployAction
+from lava_dispatcher.actions.deploy.download import DownloaderAction, HttpDownloadAction
+from lava_dispatcher.job import Job
 from lava_dispatcher.tests.utils import infrastructure_error_multi_paths
 
 
@@ -60,3 +73,264 @@ class TestDownloadDeploy(StdoutTestCase):  # pylint: disable=too-many-public-met
         job = self.factory.create_job("bbb-01.jinja2", "sample_jobs/download_dir.yaml")
         with self.assertRaises(JobError):
             job.validate()
+
+    def test_next_handlers(self):
+        deploy = [
+            action
+            for action in self.job.pipeline.actions
+            if action.name == "download-deploy"
+        ][0]
+        handlers = [
+            action.internal_pipeline.actions[0]
+            for action in deploy.internal_pipeline.actions
+            if isinstance(action, DownloaderAction)
+        ]
+        self.assertTrue(len(handlers) > 1)
+        for (index, handler) in enumerate(handlers):
+            self.assertEqual(handler._next_handlers(), handlers[index + 1 :])
+
+
+class FakeResponse:
+    def __init__(self, status_code, chunks, headers=None, error=False):
+        self.status_code = status_code
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.error = error
+
+    def iter_content(self, chunk_size):  # pylint: disable=unused-argument
+        yield from self.chunks
+        if self.error:
+            raise requests.ConnectionError("connection reset")
+
+    def close(self):
+        pass
+
+
+class TestHttpResume(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.action = HttpDownloadAction(
+            "kernel", "/tmp", urlparse("http://example.com/kernel")
+        )
+        self.action.job = types.SimpleNamespace(parameters={"dispatcher": {}})
+        self.action.validators = {"etag": '"1234"'}
+
+    def read(self, responses):
+        session = unittest.mock.Mock()
+        session.get.side_effect = responses
+        with unittest.mock.patch(
+            "lava_dispatcher.actions.deploy.download.requests_session",
+            return_value=session,
+        ), unittest.mock.patch("time.sleep"):
+            data = b"".join(self.action.reader())
+        return (data, [call[1]["headers"] for call in session.get.call_args_list])
+
+    def test_resume(self):
+        (data, headers) = self.read(
+            [
+                FakeResponse(200, [b"hello ", b"wor"], error=True),
+                FakeResponse(206, [b"ld"], {"content-range": "bytes 9-10/11"}),
+            ]
+        )
+        self.assertEqual(data, b"hello world")
+        self.assertEqual(headers, [{}, {"Range": "bytes=9-", "If-Range": '"1234"'}])
+
+    def test_resume_invalid_range(self):
+        # The server does not start at the requested offset: restart from the
+        # beginning and skip the data already downloaded
+        (data, headers) = self.read(
+            [
+                FakeResponse(200, [b"hello ", b"wor"], error=True),
+                FakeResponse(206, [b"o world"], {"content-range": "bytes 4-10/11"}),
+                FakeResponse(
+                    206, [b"hel", b"lo wo", b"rld"], {"content-range": "bytes 0-10/11"}
+                ),
+            ]
+        )
+        self.assertEqual(data, b"hello world")
+        self.assertEqual(
+            headers,
+            [
+                {},
+                {"Range": "bytes=9-", "If-Range": '"1234"'},
+                {"Range": "bytes=0-", "If-Range": '"1234"'},
+            ],
+        )
+
+    def test_resume_changed(self):
+        with self.assertRaises(InfrastructureError):
+            self.read(
+                [
+                    FakeResponse(200, [b"hello ", b"wor"], error=True),
+                    FakeResponse(200, [b"hello world"]),
+                ]
+            )
+
+
+class TestBackingFile(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = b"disk image" * 1024
+        self.job = Job(
+            4212,
+            {
+                "dispatcher": {
+                    "dispatcher_ip": "192.168.0.1",
+                    "download_cache": {"path": os.path.join(self.tmpdir, "cache")},
+                }
+            },
+            None,
+        )
+        self.overlays = []
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def qemu_img(self, cmd, **kwargs):  # pylint: disable=unused-argument
+        self.overlays.append((cmd[cmd.index("-b") + 1], cmd[-1]))
+        with open(cmd[-1], "wb") as f_out:
+            f_out.write(b"qcow2")
+        return b""
+
+    def download(self, name):
+        action = HttpDownloadAction(
+            "disk",
+            os.path.join(self.tmpdir, name),
+            urlparse("http://example.com/disk.img"),
+        )
+        action.job = self.job
+        action.section = "deploy"
+        action.parameters = {
+            "namespace": "common",
+            "to": "tmpfs",
+            "images": {
+                "disk": {
+                    "url": "http://example.com/disk.img",
+                    "image_arg": "-drive format=qcow2,file={disk}",
+                    "backing_file": True,
+                    "sha256sum": hashlib.sha256(self.data).hexdigest(),
+                }
+            },
+        }
+        session = unittest.mock.Mock()
+        session.head.return_value = FakeResponse(
+            200, [], {"content-length": str(len(self.data)), "etag": '"1234"'}
+        )
+        session.get.side_effect = lambda *args, **kwargs: FakeResponse(200, [self.data])
+        with unittest.mock.patch(
+            "lava_dispatcher.actions.deploy.download.requests_session",
+            return_value=session,
+        ), unittest.mock.patch(
+            "lava_dispatcher.actions.deploy.download.which"
+        ), unittest.mock.patch(
+            "lava_dispatcher.actions.deploy.download.subprocess.check_output",
+            side_effect=self.qemu_img,
+        ):
+            action.validate()
+            self.assertEqual(action.errors, [])
+            action.run(None, None)
+        return (action, session)
+
+    def check(self, action, name):
+        fname = os.path.join(self.tmpdir, name, "disk", "disk.img")
+        overlay = fname + ".overlay.qcow2"
+        cached = os.path.join(
+            self.tmpdir, "cache", "objects", hashlib.sha256(self.data).hexdigest()
+        )
+        self.assertEqual(self.overlays[-1], (cached, overlay))
+        # Only the thin image is kept in the job directory
+        self.assertEqual(
+            os.listdir(os.path.dirname(fname)), [os.path.basename(overlay)]
+        )
+        self.assertEqual(
+            action.get_namespace_data(
+                action="download-action", label="disk", key="file"
+            ),
+            overlay,
+        )
+        self.assertIsNotNone(action.pinned)
+        self.check_qemu(overlay)
+
+    def check_full_copy(self, action, name):
+        fname = os.path.join(self.tmpdir, name, "disk", "disk.img")
+        overlay = fname + ".overlay.qcow2"
+        # The thin image is backed by the job's own copy
+        self.assertEqual(self.overlays, [(fname, overlay)])
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(fname))),
+            [os.path.basename(fname), os.path.basename(overlay)],
+        )
+        with open(fname, "rb") as f_in:
+            self.assertEqual(f_in.read(), self.data)
+        self.assertEqual(
+            action.get_namespace_data(
+                action="download-action", label="disk", key="file"
+            ),
+            overlay,
+        )
+        self.assertIsNone(action.pinned)
+        self.check_qemu(overlay)
+
+    def check_qemu(self, overlay):
+        # qemu is using the thin image
+        qemu = CallQemuAction()
+        qemu.job = self.job
+        qemu.parameters = {"namespace": "common"}
+        qemu.base_command = ["qemu-system-x86_64"]
+        self.assertEqual(
+            qemu._build_command(),
+            ["qemu-system-x86_64", "-drive format=qcow2,file=%s" % overlay],
+        )
+
+    def test_miss_and_hit(self):
+        (action, session) = self.download("job-1")
+        self.assertEqual(action.results["cache"], "miss")
+        self.assertEqual(session.get.call_count, 1)
+        self.check(action, "job-1")
+        action.cleanup(None)
+        self.assertIsNone(action.pinned)
+
+        (action, session) = self.download("job-2")
+        self.assertEqual(action.results["cache"], "hit")
+        session.get.assert_not_called()
+        self.check(action, "job-2")
+        action.cleanup(None)
+
+    def test_no_cache(self):
+        del self.job.parameters["dispatcher"]["download_cache"]
+        (action, _) = self.download("job-1")
+        self.assertNotIn("cache", action.results)
+        self.check_full_copy(action, "job-1")
+
+    def test_pin_failure(self):
+        with unittest.mock.patch(
+            "lava_dispatcher.utils.cache.DownloadCache.pin", return_value=None
+        ):
+            (action, _) = self.download("job-1")
+        self.assertEqual(action.results["cache"], "miss")
+        self.check_full_copy(action, "job-1")
+
+    def test_archive(self):
+        action = HttpDownloadAction(
+            "disk", self.tmpdir, urlparse("http://example.com/disk.img.tar")
+        )
+        action.job = self.job
+        action.section = "deploy"
+        action.parameters = {
+            "namespace": "common",
+            "images": {
+                "disk": {
+                    "url": "http://example.com/disk.img.tar",
+                    "image_arg": "-drive format=qcow2,file={disk}",
+                    "backing_file": True,
+                    "archive": "tar",
+                }
+            },
+        }
+        with unittest.mock.patch(
+            "lava_dispatcher.actions.deploy.download.requests_session"
+        ), unittest.mock.patch("lava_dispatcher.actions.deploy.download.which"):
+            action.validate()
+        self.assertIn("'backing_file' cannot be used with 'archive'", action.errors)
@@ -19,8 +19,11 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import os
+import re
 import yaml
+import pexpect
 import datetime
+import tempfile
 from lava_dispatcher.action import Action, Pipeline
 from lava_common.timeout import Timeout
 from lava_common.exceptions import InfrastructureError, JobError
@@ -32,7 +35,11 @@ from lava_dispatcher.job import Job
 from lava_dispatcher.protocols.multinode import MultinodeProtocol
 from lava_dispatcher.protocols.vland import VlandProtocol
 from lava_dispatcher.tests.test_basic import Factory, StdoutTestCase
-from lava_dispatcher.actions.test.shell import TestShellRetry, TestShellAction
+from lava_dispatcher.actions.test.shell import (
+    CombinedPatterns,
+    TestShellRetry,
+    TestShellAction,
+)
 
 
 # pylint: disable=duplicate-code,too-few-public-methods
@@ -185,3 +192,79 @@ class TestShellResults(StdoutTestCase):  # pylint: disable=too-many-public-metho
         def run(self, connection, max_end_time):
             self.count += 1
             raise JobError("fake error")
+
+
+class TestCombinedPatterns(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        action = TestShellAction()
+        action._reset_patterns()
+        self.patterns = action.patterns
+        self.patterns["multinode"] = r"<LAVA_MULTI_NODE> <LAVA_(\S+) ([^>]+)>"
+        self.patterns["test_case_result"] = re.compile(
+            r"^(?P<test_case_id>tc\d+): (?P<result>pass|fail)", re.M
+        )
+
+    def events(self, logfile, combined, patterns=None):
+        if patterns is None:
+            patterns = self.patterns
+        matcher = CombinedPatterns(patterns)
+        child = pexpect.spawn("cat", [logfile], encoding="utf-8")
+        events = []
+        while True:
+            if combined:
+                event = matcher.expect(child, 30)
+            else:
+                index = child.expect(list(patterns.values()), timeout=30)
+                event = list(patterns.keys())[index]
+            if event in ["exit", "eof"]:
+                break
+            events.append((event, child.match.groups()))
+        return events
+
+    def test_combined(self):
+        self.assertEqual(
+            CombinedPatterns(self.patterns).events, [None, "eof", "timeout"]
+        )
+        # Numbered back references are not combined
+        patterns = {"test_case_result": r"(\w+) \1", "eof": pexpect.EOF}
+        self.assertEqual(
+            CombinedPatterns(patterns).expect_list, [r"(\w+) \1", pexpect.EOF]
+        )
+
+    def test_order(self):
+        with tempfile.NamedTemporaryFile(mode="w") as logfile:
+            # test_case_result is the last pattern but the first match
+            logfile.write("tc0: fail\n")
+            logfile.write("+ lava-test-case tc0 --result fail\n")
+            logfile.write("<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=tc0 RESULT=fail>\n")
+            logfile.write("<LAVA_MULTI_NODE> <LAVA_SEND foo>\n")
+            logfile.write("tc1: pass\n")
+            logfile.write("<LAVA_TEST_RUNNER EXIT>\n")
+            logfile.flush()
+            expected = self.events(logfile.name, False)
+            events = self.events(logfile.name, True)
+        self.assertEqual(events, expected)
+        self.assertEqual(
+            events,
+            [
+                ("test_case_result", ("tc0", "fail")),
+                ("signal", ("TESTCASE", "TEST_CASE_ID=tc0 RESULT=fail")),
+                ("multinode", ("SEND", "foo")),
+                ("test_case_result", ("tc1", "pass")),
+            ],
+        )
+
+    def test_tie(self):
+        # Both patterns match at the same position: the first one wins and
+        # the groups are the ones of the matching pattern
+        with tempfile.NamedTemporaryFile(mode="w") as logfile:
+            logfile.write("abc\n")
+            logfile.flush()
+            for (patterns, expected) in [
+                ({"first": r"ab(c)", "second": r"(a)bc"}, [("first", ("c",))]),
+                ({"second": r"(a)bc", "first": r"ab(c)"}, [("second", ("a",))]),
+            ]:
+                patterns["eof"] = pexpect.EOF
+                self.assertEqual(self.events(logfile.name, False, patterns), expected)
+                self.assertEqual(self.events(logfile.name, True, patterns), expected)
@@ -19,12 +19,18 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import os
+import re
+import tempfile
 import time
+import unittest.mock
 import pexpect
 from lava_common.constants import KERNEL_FREE_INIT_MSG
 from lava_common.exceptions import JobError
+from lava_common.timeout import Timeout
+from lava_dispatcher.shell import BoundedSearcher, ShellCommand
 from lava_dispatcher.utils.messages import LinuxKernelMessages
 from lava_dispatcher.tests.test_basic import StdoutTestCase
+from lava_dispatcher.tests.utils import DummyLogger
 
 
 class Kernel:  # pylint: disable=too-few-public-methods
@@ -168,3 +174,80 @@ class TestBootMessages(StdoutTestCase):  # pylint: disable=too-many-public-metho
             results = LinuxKernelMessages.parse_failures(
                 connection, max_end_time=self.max_end_time
             )
+
+
+class TestSearchWindow(StdoutTestCase):
+    def matches(self, logfile, patterns, search_window):
+        shell = ShellCommand(
+            "cat %s" % logfile,
+            Timeout("fake", 30),
+            logger=DummyLogger(),
+            search_window=search_window,
+        )
+        matches = []
+        while True:
+            index = shell.expect(patterns + [pexpect.EOF])
+            if index == len(patterns):
+                break
+            matches.append((index, shell.after))
+        return matches
+
+    def test_kernel_captures(self):
+        patterns = LinuxKernelMessages.get_kernel_prompts()
+        for name in [
+            "kernel-1.txt",
+            "kernel-2.txt",
+            "kernel-4.txt",
+            "kernel-panic.txt",
+        ]:
+            logfile = os.path.join(os.path.dirname(__file__), name)
+            expected = self.matches(logfile, patterns, None)
+            self.assertNotEqual(expected, [])
+            self.assertEqual(self.matches(logfile, patterns, "16384"), expected)
+            # Older pexpect versions are using the pexpect search window
+            with unittest.mock.patch("lava_dispatcher.shell.PEXPECT_IO_BUFFERS", False):
+                self.assertEqual(self.matches(logfile, patterns, "16384"), expected)
+
+    def test_no_match(self):
+        # A console printing kernel messages while waiting for a prompt
+        with open(os.path.join(os.path.dirname(__file__), "kernel-2.txt")) as f_in:
+            data = f_in.read()
+        windows = []
+        search = BoundedSearcher.search
+
+        def bounded_search(searcher, buffer, freshlen, searchwindowsize=None):
+            windows.append(len(buffer))
+            return search(searcher, buffer, freshlen, searchwindowsize)
+
+        with tempfile.NamedTemporaryFile(mode="w") as logfile:
+            logfile.write(data * 10)
+            logfile.flush()
+            self.assertEqual(self.matches(logfile.name, ["root@debian:~# "], None), [])
+            with unittest.mock.patch.object(BoundedSearcher, "search", bounded_search):
+                self.assertEqual(
+                    self.matches(logfile.name, ["root@debian:~# "], 1024), []
+                )
+        # Only the new data and the end of the previous data are searched
+        self.assertGreater(len(windows), 1)
+        # 2000 is the default read size (window) of ShellCommand
+        self.assertLessEqual(max(windows), 1024 + 2000)
+
+    def test_signals(self):
+        patterns = [re.compile(r"<LAVA_SIGNAL_(\S+) ([^>]+)>")]
+        with tempfile.NamedTemporaryFile(mode="w") as logfile:
+            # Signals split by the serial console and lines without any match
+            logfile.write("x" * 5000 + "\n")
+            logfile.write("<LAVA_SIGNAL_STARTRUN 0_smoke-tests\n 1234>\n")
+            logfile.write(("y" * 100 + "\n") * 200)
+            logfile.write("<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=pwd RESULT=pass>\n")
+            logfile.write("<LAVA_SIGNAL_ENDRUN 0_smoke-tests 1234>")
+            logfile.flush()
+            matches = self.matches(logfile.name, patterns, 1024)
+        self.assertEqual(
+            [match for (_, match) in matches],
+            [
+                "<LAVA_SIGNAL_STARTRUN 0_smoke-tests\r\n 1234>",
+                "<LAVA_SIGNAL_TESTCASE TEST_CASE_ID=pwd RESULT=pass>",
+                "<LAVA_SIGNAL_ENDRUN 0_smoke-tests 1234>",
+            ],
+        )
@@ -19,7 +19,11 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 
+import gzip
 import os
+import shutil
+import subprocess  # nosec - unit test support.
+import tempfile
 import yaml
 import logging
 import unittest
@@ -846,3 +850,72 @@ class TestOverlayCommands(StdoutTestCase):  # pylint: disable=too-many-public-me
         self.assertIsNotNone(nfs.parameters.get("nfsrootfs"))
         self.assertIsNotNone(overlay.parameters.get("nfsrootfs"))
         self.assertIsNotNone(overlay.parameters.get("ramdisk"))
+
+
+def cpio_names(data):
+    """
+    List the files of the concatenated newc cpio archives like the kernel
+    does, skipping the zero padding between the archives
+    """
+    names = []
+    offset = 0
+    while offset < len(data):
+        if data[offset : offset + 4] == b"\0\0\0\0":
+            offset += 4
+            continue
+        header = data[offset : offset + 110]
+        assert header[:6] == b"070701"  # nosec - unit test support.
+        filesize = int(header[54:62], 16)
+        namesize = int(header[94:102], 16)
+        name = data[offset + 110 : offset + 110 + namesize - 1].decode("utf-8")
+        offset += 110 + namesize
+        offset += -offset % 4
+        offset += filesize
+        offset += -offset % 4
+        if name != "TRAILER!!!":
+            names.append(name)
+    return names
+
+
+class TestAppendOverlay(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    @unittest.skipIf(infrastructure_error("cpio"), "cpio not installed")
+    def test_append_overlay(self):
+        # Original ramdisk
+        original = os.path.join(self.tmpdir, "original")
+        os.makedirs(os.path.join(original, "bin"))
+        with open(os.path.join(original, "init"), "w") as f_out:
+            f_out.write("#!/bin/sh\n")
+        cpio = subprocess.check_output(  # nosec - unit test support.
+            "find . | cpio --create --format=newc --quiet", shell=True, cwd=original
+        )
+        ramdisk_file = os.path.join(self.tmpdir, "ramdisk.cpio.gz")
+        with open(ramdisk_file, "wb") as f_out:
+            f_out.write(gzip.compress(cpio))
+
+        # Files added by LAVA
+        ramdisk_dir = os.path.join(self.tmpdir, "ramdisk")
+        os.makedirs(os.path.join(ramdisk_dir, "lava-overlay"))
+        with open(os.path.join(ramdisk_dir, "lava-overlay", "lava-test"), "w") as f_out:
+            f_out.write("lava\n")
+
+        action = CompressRamdisk()
+        action.logger = DummyLogger()
+        self.assertEqual(
+            action.append_overlay(ramdisk_dir, ramdisk_file, "gz"), ramdisk_file
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "overlay.cpio")))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "overlay.cpio.gz")))
+
+        # Both archives are decompressed and listed
+        with gzip.open(ramdisk_file, "rb") as f_in:
+            names = cpio_names(f_in.read())
+        self.assertEqual(sorted(names[:3]), [".", "./bin", "./init"])
+        self.assertEqual(names[3:], ["./lava-overlay", "./lava-overlay/lava-test"])
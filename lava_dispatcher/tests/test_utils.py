@@ -18,11 +18,17 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import collections
+import glob
 import os
 import shutil
 import subprocess  # nosec - unit test support.
 import tempfile
+import threading
+import time
+import types
 import unittest
+import unittest.mock
 
 from lava_dispatcher.tests.test_uboot import UBootFactory, StdoutTestCase
 from lava_dispatcher.actions.boot.u_boot import UBootAction, UBootRetry
@@ -31,9 +37,14 @@ from lava_dispatcher.tests.utils import infrastructure_error
 from lava_common.exceptions import InfrastructureError, JobError
 from lava_common.utils import debian_filename_version
 from lava_dispatcher.action import Action
+from lava_dispatcher.udev_broker import UdevBroker, udev_match, udev_request
 from lava_dispatcher.utils import vcs, installers
+from lava_dispatcher.utils.cache import GitCache
 from lava_dispatcher.utils.decorator import replace_exception
+from lava_dispatcher.utils.filesystem import GuestfsAppliance
+from lava_dispatcher.utils.network import requests_session
 from lava_dispatcher.utils.shell import which
+from lava_dispatcher.utils.udev import get_udev_devices
 
 
 class TestGit(StdoutTestCase):  # pylint: disable=too-many-public-methods
@@ -183,6 +194,33 @@ class TestGit(StdoutTestCase):  # pylint: disable=too-many-public-methods
             os.path.exists(os.path.join(self.tmpdir, "git.clone1", ".git"))
         )
 
+    def test_cache(self):
+        cache = GitCache(os.path.join(self.tmpdir, "cache"))
+        url = os.path.join(self.tmpdir, "git")
+        git = vcs.GitHelper(url, cache=cache)
+        self.assertEqual(
+            git.clone("git.clone1"), "a7af835862da0e0592eeeac901b90e8de2cf5b67"
+        )
+        self.assertEqual(
+            git.clone("git.clone2", shallow=True, branch="testing"),
+            "f2589a1b7f0cfc30ad6303433ba4d5db1a542c2d",
+        )
+        self.assertEqual(
+            git.clone(
+                "git.clone3", revision="2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed"
+            ),
+            "2f83e6d8189025e356a9563b8d78bdc8e2e9a3ed",
+        )
+        # The clones point to the original repository
+        self.assertEqual(
+            subprocess.check_output(  # nosec - unit test support.
+                ["git", "-C", "git.clone1", "remote", "get-url", "origin"]
+            ),
+            url.encode("utf-8") + b"\n",
+        )
+        self.assertEqual(len(glob.glob(os.path.join(cache.mirrors, "*.git"))), 1)
+        self.assertRaises(InfrastructureError, git.clone, ("git.clone1"))
+
 
 @unittest.skipIf(infrastructure_error("bzr"), "bzr not installed")
 class TestBzr(StdoutTestCase):  # pylint: disable=too-many-public-methods
@@ -454,3 +492,197 @@ class TestVersions(StdoutTestCase):
         # avoid checking the actual version
         binary = which("dpkg-query")
         self.assertIsNotNone(debian_filename_version(binary, label=True))
+
+
+class TestGuestfsAppliance(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.guest = unittest.mock.Mock()
+        self.guest.get_backend.return_value = "libvirt"
+        patcher = unittest.mock.patch("lava_dispatcher.utils.filesystem.guestfs")
+        patcher.start().GuestFS.return_value = self.guest
+        self.addCleanup(patcher.stop)
+        patcher = unittest.mock.patch("lava_dispatcher.utils.filesystem.atexit")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hotplug(self):
+        appliance = GuestfsAppliance()
+        with appliance.drive("image0.qcow2", format="qcow2") as guest:
+            self.assertIs(guest, self.guest)
+        # The drive is removed even if the filesystems cannot be unmounted
+        self.guest.umount_all.side_effect = RuntimeError("umount failed")
+        with appliance.drive("image1.qcow2", format="qcow2") as guest:
+            self.assertIs(guest, self.guest)
+
+        # The appliance is only launched once
+        self.assertEqual(self.guest.launch.call_count, 1)
+        self.assertEqual(
+            self.guest.add_drive_opts.call_args_list,
+            [
+                unittest.mock.call("image0.qcow2", label="lava0", format="qcow2"),
+                unittest.mock.call("image1.qcow2", label="lava1", format="qcow2"),
+            ],
+        )
+        self.assertEqual(
+            self.guest.remove_drive.call_args_list,
+            [unittest.mock.call("lava0"), unittest.mock.call("lava1")],
+        )
+        appliance.close()
+        self.guest.shutdown.assert_called_once_with()
+        self.guest.close.assert_called_once_with()
+
+    def test_no_hotplug(self):
+        self.guest.get_backend.return_value = "direct"
+        appliance = GuestfsAppliance()
+        for image in ["image0.qcow2", "image1.qcow2"]:
+            with appliance.drive(image, format="qcow2") as guest:
+                self.assertIs(guest, self.guest)
+        # A new appliance is launched for each image
+        self.assertEqual(self.guest.launch.call_count, 2)
+        self.assertEqual(self.guest.close.call_count, 2)
+        self.guest.remove_drive.assert_not_called()
+
+
+class TestRequestsSession(StdoutTestCase):
+    def test_per_thread(self):
+        session = requests_session()
+        self.assertIs(requests_session(), session)
+
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(requests_session()))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(sessions), 1)
+        self.assertIsNot(sessions[0], session)
+
+
+class FakeMonitor:
+    def __init__(self):
+        (self.read_fd, self.write_fd) = os.pipe()
+        self.events = collections.deque()
+
+    def fileno(self):
+        return self.read_fd
+
+    def push(self, action, sys_path, properties):
+        self.events.append(
+            types.SimpleNamespace(
+                action=action, sys_path=sys_path, properties=properties
+            )
+        )
+        os.write(self.write_fd, b"x")
+
+    def poll(self, timeout=None):  # pylint: disable=unused-argument
+        if not self.events:
+            return None
+        os.read(self.read_fd, 1)
+        return self.events.popleft()
+
+
+class TestUdevBroker(StdoutTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "udev.sock")
+        self.monitor = FakeMonitor()
+        self.broker = UdevBroker(self.path)
+        self.broker.devices = {
+            "/sys/devices/usb1/1-1": {
+                "SUBSYSTEM": "usb",
+                "DEVTYPE": "usb_device",
+                "DEVNAME": "/dev/bus/usb/001/002",
+                "ID_SERIAL_SHORT": "1234",
+                "ID_VENDOR_ID": "0525",
+            },
+            "/sys/devices/usb1/1-1/1-1:1.0/tty/ttyACM0": {
+                "SUBSYSTEM": "tty",
+                "DEVNAME": "/dev/ttyACM0",
+                "DEVLINKS": "/dev/serial/by-id/usb-1234",
+                "ID_SERIAL_SHORT": "1234",
+            },
+        }
+        self.thread = threading.Thread(target=self.broker.run, args=(self.monitor,))
+        self.thread.start()
+        while not os.path.exists(self.path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        super().tearDown()
+        self.broker.stop()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def test_match(self):
+        properties = self.broker.devices["/sys/devices/usb1/1-1"]
+        self.assertTrue(
+            udev_match("add", properties, {"match": {"ID_SERIAL_SHORT": "1234"}})
+        )
+        self.assertFalse(udev_match("add", properties, {"actions": ["remove"]}))
+        self.assertFalse(udev_match("add", properties, {"subsystem": "tty"}))
+        self.assertTrue(
+            udev_match("add", properties, {"subsystem": "usb", "devtype": "usb_device"})
+        )
+        self.assertTrue(udev_match("add", properties, {"devicepath": "usb/001"}))
+        self.assertFalse(udev_match("add", properties, {"devicepath": "ttyACM0"}))
+
+    def test_list(self):
+        answer = udev_request({"command": "list"}, self.path)
+        self.assertEqual(len(answer["devices"]), 2)
+
+        with unittest.mock.patch(
+            "lava_dispatcher.utils.udev.UDEV_BROKER_SOCKET", self.path
+        ):
+            paths = get_udev_devices(device_info=[{"board_id": "1234"}])
+        self.assertEqual(
+            sorted(paths),
+            ["/dev/bus/usb/001/002", "/dev/serial/by-id/usb-1234", "/dev/ttyACM0"],
+        )
+
+    def test_wait(self):
+        # Already present
+        answer = udev_request(
+            {
+                "command": "wait",
+                "filter": {"actions": ["add"], "subsystem": "tty"},
+                "present": True,
+            },
+            self.path,
+        )
+        self.assertEqual(answer["properties"]["DEVNAME"], "/dev/ttyACM0")
+
+        # Received from the history
+        since = time.time()
+        self.monitor.push(
+            "remove", "/sys/devices/usb1/1-1", {"ID_SERIAL_SHORT": "1234"}
+        )
+        answer = udev_request(
+            {
+                "command": "wait",
+                "filter": {"actions": ["remove"], "match": {"ID_SERIAL_SHORT": "1234"}},
+                "since": since,
+            },
+            self.path,
+        )
+        self.assertEqual(answer["action"], "remove")
+        self.assertNotIn("/sys/devices/usb1/1-1", self.broker.devices)
+
+        # Received later
+        answers = []
+        request = {
+            "command": "wait",
+            "filter": {"actions": ["add"], "match": {"ID_SERIAL_SHORT": "5678"}},
+            "present": True,
+        }
+        client = threading.Thread(
+            target=lambda: answers.append(udev_request(request, self.path))
+        )
+        client.start()
+        while not any(c.udev_filter for c in self.broker.clients):
+            time.sleep(0.01)
+        self.monitor.push("add", "/sys/devices/usb1/1-2", {"ID_SERIAL_SHORT": "0000"})
+        self.monitor.push("add", "/sys/devices/usb1/1-3", {"ID_SERIAL_SHORT": "5678"})
+        client.join()
+        self.assertEqual(
+            answers, [{"action": "add", "properties": {"ID_SERIAL_SHORT": "5678"}}]
+        )
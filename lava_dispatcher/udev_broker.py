@@ -0,0 +1,292 @@
+# Copyright (C) 2020 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+# udev event broker
+#
+# The broker runs inside lava-slave and keeps a single netlink monitor for the
+# whole worker. It maintains a table of the present devices and a short
+# history of the events. The jobs talk to the broker through a Unix socket,
+# sending one json request per connection:
+# * {"command": "list"}: the broker answers with the present devices
+# * {"command": "wait", "filter": {...}, "since": ts, "present": bool}: the
+#   broker answers with the first matching event received after "since" (or
+#   the matching device when "present" is set and the device is already
+#   there). The answer is delayed until such an event is received.
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import selectors
+import socket
+import time
+
+from lava_common.constants import (
+    UDEV_BROKER_SOCKET,
+    UDEV_HISTORY_AGE,
+    UDEV_HISTORY_SIZE,
+)
+
+READ_SIZE = 4096
+
+
+def udev_match(action, properties, udev_filter):
+    """
+    Check an udev event against the filter used by the wait actions:
+    actions, subsystem, devtype, match (properties to compare) and devicepath
+    """
+    if udev_filter.get("actions") and action not in udev_filter["actions"]:
+        return False
+    for key in ["subsystem", "devtype"]:
+        if udev_filter.get(key) and properties.get(key.upper()) != udev_filter[key]:
+            return False
+    for (key, value) in (udev_filter.get("match") or {}).items():
+        if properties.get(key) != value:
+            return False
+    devicepath = udev_filter.get("devicepath")
+    if devicepath:
+        return devicepath in properties.get(
+            "DEVLINKS", ""
+        ) or devicepath in properties.get("DEVNAME", "")
+    return True
+
+
+def udev_request(request, path=UDEV_BROKER_SOCKET):
+    """
+    Send the request to the broker and return the answer.
+    Blocking until the broker answers.
+    """
+    with contextlib.closing(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(READ_SIZE)
+            if not chunk:
+                raise ConnectionError("udev broker closed the connection")
+            data += chunk
+    return json.loads(data.decode("utf-8"))
+
+
+class Client:
+    """
+    Job connected to the broker through the Unix socket
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.request = b""
+        self.udev_filter = None
+        self.pending = bytearray()
+
+
+class UdevBroker:
+    """
+    Share one udev monitor between all the jobs running on the worker
+    """
+
+    def __init__(
+        self,
+        path=UDEV_BROKER_SOCKET,
+        history_size=UDEV_HISTORY_SIZE,
+        history_age=UDEV_HISTORY_AGE,
+    ):
+        self.path = path
+        self.history_age = history_age
+        self.selector = selectors.DefaultSelector()
+        self.logger = logging.getLogger("lava-slave")
+        self.running = False
+        self.monitor = None
+        self.server = None
+        # sys_path => properties
+        self.devices = {}
+        # (timestamp, action, properties)
+        self.history = collections.deque(maxlen=history_size)
+        self.clients = []
+
+    def start(self, monitor=None):
+        """
+        Start monitoring the udev events and listen for the jobs.
+        The monitor should be started before enumerating the devices, so no
+        event is lost in between.
+        """
+        if monitor is None:
+            import pyudev
+
+            context = pyudev.Context()
+            monitor = pyudev.Monitor.from_netlink(context)
+            monitor.start()
+            for device in context.list_devices():
+                self.devices[device.sys_path] = dict(device.properties)
+        self.monitor = monitor
+        self.selector.register(self.monitor, selectors.EVENT_READ, self.receive_events)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(32)
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, self.accept)
+        self.logger.info(
+            "[UDEV] listening on %s (%d devices)", self.path, len(self.devices)
+        )
+
+    def run(self, monitor=None):
+        self.running = True
+        self.start(monitor)
+        try:
+            while self.running:
+                for (key, mask) in self.selector.select(timeout=1):
+                    key.data(mask)
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for client in self.clients[:]:
+            self.drop(client)
+        if self.server is not None:
+            self.selector.unregister(self.server)
+            self.server.close()
+            self.server = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+        if self.monitor is not None:
+            self.selector.unregister(self.monitor)
+            self.monitor = None
+
+    def receive_events(self, mask):  # pylint: disable=unused-argument
+        for device in iter(lambda: self.monitor.poll(timeout=0), None):
+            self.event(device.action, device.sys_path, dict(device.properties))
+
+    def event(self, action, sys_path, properties):
+        now = time.time()
+        if action == "remove":
+            self.devices.pop(sys_path, None)
+        else:
+            if action == "move" and "DEVPATH_OLD" in properties:
+                old_path = sys_path[: -len(properties.get("DEVPATH", ""))]
+                self.devices.pop(old_path + properties["DEVPATH_OLD"], None)
+            self.devices[sys_path] = properties
+        self.history.append((now, action, properties))
+        while self.history and self.history[0][0] < now - self.history_age:
+            self.history.popleft()
+
+        for client in self.clients[:]:
+            if client.udev_filter is not None and udev_match(
+                action, properties, client.udev_filter
+            ):
+                self.answer(client, {"action": action, "properties": properties})
+
+    def accept(self, mask):  # pylint: disable=unused-argument
+        (sock, _) = self.server.accept()
+        sock.setblocking(False)
+        client = Client(sock)
+        self.clients.append(client)
+        self.selector.register(
+            sock, selectors.EVENT_READ, lambda mask: self.ready(client, mask)
+        )
+
+    def ready(self, client, mask):
+        if mask & selectors.EVENT_WRITE:
+            self.flush(client)
+        if mask & selectors.EVENT_READ and client in self.clients:
+            self.receive(client)
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(client)
+            return
+        if client.udev_filter is not None or client.pending:
+            return
+        client.request += data
+        if b"\n" not in client.request:
+            if len(client.request) > 64 * 1024:
+                self.drop(client)
+            return
+        try:
+            request = json.loads(client.request.split(b"\n", 1)[0].decode("utf-8"))
+        except ValueError:
+            self.drop(client)
+            return
+        self.handle(client, request)
+
+    def handle(self, client, request):
+        command = request.get("command")
+        if command == "list":
+            self.answer(
+                client,
+                {
+                    "devices": [
+                        {"sys_path": sys_path, "properties": properties}
+                        for (sys_path, properties) in self.devices.items()
+                    ]
+                },
+            )
+        elif command == "wait":
+            udev_filter = request.get("filter") or {}
+            if request.get("present"):
+                for properties in self.devices.values():
+                    if udev_match("add", properties, udev_filter):
+                        self.answer(client, {"action": "add", "properties": properties})
+                        return
+            since = request.get("since", time.time())
+            for (timestamp, action, properties) in self.history:
+                if timestamp >= since and udev_match(action, properties, udev_filter):
+                    self.answer(client, {"action": action, "properties": properties})
+                    return
+            client.udev_filter = udev_filter
+        else:
+            self.drop(client)
+
+    def answer(self, client, data):
+        client.udev_filter = None
+        client.pending.extend(json.dumps(data).encode("utf-8") + b"\n")
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            sent = client.sock.send(client.pending)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.drop(client)
+            return
+        del client.pending[:sent]
+        events = selectors.EVENT_READ
+        if client.pending:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(client.sock, events, lambda mask: self.ready(client, mask))
+
+    def drop(self, client):
+        if client not in self.clients:
+            return
+        self.clients.remove(client)
+        self.selector.unregister(client.sock)
+        client.sock.close()
@@ -0,0 +1,523 @@
+# Copyright (C) 2019 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import subprocess  # nosec - internal use.
+import tempfile
+import yaml
+
+from lava_common.constants import DOWNLOAD_CACHE_SIZE, GIT_CACHE_SIZE, ROOTFS_CACHE_SIZE
+from lava_common.exceptions import InfrastructureError
+from lava_dispatcher.utils.compression import untar_file
+
+# From linux/fs.h
+FICLONE = 0x40049409
+
+
+@contextlib.contextmanager
+def locked(path, operation=fcntl.LOCK_EX):
+    """
+    Hold a lock on the given file, shared by every job running on this
+    worker.
+    """
+    with open(path, "a") as f_lock:
+        fcntl.flock(f_lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f_lock, fcntl.LOCK_UN)
+
+
+def clone_file(f_src, dst):
+    """
+    Copy the content of the opened file to dst. When the filesystem supports
+    it, the data blocks are shared (reflink) instead of being copied.
+    Return True if the file was reflinked.
+    """
+    with open(dst, "wb") as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+            return True
+        except OSError:
+            f_src.seek(0)
+            shutil.copyfileobj(f_src, f_dst, 1024 * 1024)
+            return False
+
+
+def _tree_size(path):
+    size = 0
+    for (root, _, files) in os.walk(path):
+        for name in files:
+            with contextlib.suppress(OSError):
+                size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+class DownloadCache:
+    """
+    Worker-local cache of the downloaded artifacts.
+
+    The files are stored by the sha256 of the downloaded data (and the
+    compression when decompressed during the download). The index maps each
+    url to the last file downloaded from it, with the http validators.
+    The rendered overlays are stored in sub-directories of "overlays".
+    The least recently used files and overlays are removed when the cache is
+    full.
+    """
+
+    def __init__(self, path, size=DOWNLOAD_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.objects = os.path.join(path, "objects")
+        self.index = os.path.join(path, "index")
+        self.overlays = os.path.join(path, "overlays")
+        self.lock = os.path.join(path, "lock")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.index, exist_ok=True)
+        os.makedirs(self.overlays, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Return the cache configured in the dispatcher configuration or None
+        """
+        cache = config.get("download_cache")
+        if not cache or not cache.get("path"):
+            return None
+        try:
+            return cls(cache["path"], int(cache.get("size", DOWNLOAD_CACHE_SIZE)))
+        except (OSError, ValueError) as exc:
+            raise InfrastructureError("Invalid download cache: %s" % str(exc))
+
+    def _index(self, url, compression):
+        key = "%s\n%s" % (url, compression or "")
+        return os.path.join(
+            self.index, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".yaml"
+        )
+
+    def _object(self, sha256, compression):
+        if compression:
+            return os.path.join(self.objects, "%s-%s" % (sha256, compression))
+        return os.path.join(self.objects, sha256)
+
+    def _load(self, path):
+        with contextlib.suppress(OSError, yaml.YAMLError):
+            with open(path, "r") as f_in:
+                data = yaml.safe_load(f_in)
+            if isinstance(data, dict):
+                return data
+        return None
+
+    def _dump(self, path, data):
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "w") as f_out:
+            yaml.safe_dump(data, f_out)
+        os.rename(tmp, path)
+
+    def lookup(self, url, compression, md5sum=None, sha256sum=None, validators=None):
+        """
+        Return the cache entry matching the url and the expected checksums or
+        http validators, or None.
+        """
+        with locked(self.lock):
+            if sha256sum:
+                name = self._object(sha256sum, compression)
+            else:
+                index = self._load(self._index(url, compression))
+                if index is None:
+                    return None
+                name = os.path.join(self.objects, index["object"])
+                if md5sum is None and (
+                    not validators or validators != index.get("validators")
+                ):
+                    return None
+            if not os.path.exists(name):
+                return None
+            entry = self._load(name + ".yaml")
+            if entry is None:
+                return None
+            if md5sum is not None and entry["md5"] != md5sum:
+                return None
+            entry["path"] = name
+            return entry
+
+    def fetch(self, entry, dst):
+        """
+        Copy the cached file to dst and mark it as recently used.
+        Return True if the file was reflinked or None if the file was evicted
+        since the lookup.
+        """
+        with locked(self.lock):
+            # Once opened, the file can be evicted by other jobs
+            try:
+                f_src = open(entry["path"], "rb")
+            except FileNotFoundError:
+                return None
+            os.utime(entry["path"])
+        with f_src:
+            return clone_file(f_src, dst)
+
+    def pin(self, path):
+        """
+        Keep the cached file until the returned file object is closed.
+        Return None if the file was already evicted.
+        """
+        with locked(self.lock):
+            if not os.path.exists(path):
+                return None
+            f_pin = open(path + ".lock", "a")
+            fcntl.flock(f_pin, fcntl.LOCK_SH)
+            os.utime(path)
+            return f_pin
+
+    def store(self, url, compression, src, md5, sha256, size, validators=None):
+        """
+        Add the downloaded file to the cache and evict the least recently used
+        files if needed.
+        """
+        name = self._object(sha256, compression)
+        if os.path.exists(name):
+            with contextlib.suppress(OSError):
+                os.utime(name)
+        else:
+            (fd, tmp) = tempfile.mkstemp(dir=self.objects, prefix=".tmp-")
+            try:
+                os.close(fd)
+                with open(src, "rb") as f_src:
+                    clone_file(f_src, tmp)
+                self._dump(name + ".yaml", {"md5": md5, "sha256": sha256, "size": size})
+                os.rename(tmp, name)
+            except OSError:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+                raise
+        with locked(self.lock):
+            self._dump(
+                self._index(url, compression),
+                {"object": os.path.basename(name), "validators": validators or {}},
+            )
+            self.evict()
+
+    @contextlib.contextmanager
+    def overlay(self, key, render):
+        """
+        Yield the directory holding the files rendered by render(directory)
+        for the given key. The files are only rendered when missing from the
+        cache.
+        The lock is held until the context exits, so the directory cannot be
+        evicted while the caller copies the files.
+        """
+        path = os.path.join(self.overlays, key)
+        with locked(self.lock):
+            if not os.path.isdir(path):
+                tmp = tempfile.mkdtemp(dir=self.overlays, prefix=".tmp-")
+                try:
+                    render(tmp)
+                    os.rename(tmp, path)
+                except BaseException:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+                self.evict()
+            os.utime(path)
+            yield path
+
+    def evict(self):
+        """
+        Remove the least recently used files and overlays until the cache
+        fits in the configured size. The pinned files are skipped.
+        Should be called with the lock held.
+        """
+        objects = []
+        total = 0
+        with os.scandir(self.objects) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.name.endswith(
+                    (".yaml", ".lock")
+                ):
+                    continue
+                with contextlib.suppress(OSError):
+                    stat = entry.stat(follow_symlinks=False)
+                    objects.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        with os.scandir(self.overlays) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                with contextlib.suppress(OSError):
+                    stat = entry.stat(follow_symlinks=False)
+                    size = _tree_size(entry.path)
+                    objects.append((stat.st_mtime, size, entry.path))
+                    total += size
+
+        for (_, size, path) in sorted(objects):
+            if total <= self.size:
+                break
+            if os.path.dirname(path) == self.overlays:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                continue
+            if os.path.exists(path + ".lock"):
+                with open(path + ".lock", "a") as f_lock:
+                    try:
+                        fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue
+                    os.unlink(path + ".lock")
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+                total -= size
+            with contextlib.suppress(OSError):
+                os.unlink(path + ".yaml")
+
+
+class RootfsCache:
+    """
+    Worker-local cache of the extracted root filesystems.
+
+    The trees are stored by the sha256 of the downloaded archive. Each job
+    gets its own copy of the tree, reflinked when the filesystem supports
+    it, so the lava overlay and the NFS clients never modify the cached
+    tree.
+    The least recently used trees are removed when the cache is full.
+    """
+
+    def __init__(self, path, size=ROOTFS_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.trees = os.path.join(path, "trees")
+        self.lock = os.path.join(path, "lock")
+        os.makedirs(self.trees, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Return the cache configured in the dispatcher configuration or None
+        """
+        cache = config.get("rootfs_cache")
+        if not cache or not cache.get("path"):
+            return None
+        try:
+            return cls(cache["path"], int(cache.get("size", ROOTFS_CACHE_SIZE)))
+        except (OSError, ValueError) as exc:
+            raise InfrastructureError("Invalid rootfs cache: %s" % str(exc))
+
+    def _tree(self, sha256):
+        return os.path.join(self.trees, sha256)
+
+    def clone(self, sha256, dst):
+        """
+        Copy the cached tree into dst and mark it as recently used.
+        Return False if the tree is not in the cache.
+        """
+        tree = self._tree(sha256)
+        with locked(self.lock):
+            if not os.path.exists(tree + ".yaml"):
+                return False
+            os.utime(tree + ".yaml")
+        # The tree is not evicted while being copied
+        with locked(tree + ".lock", fcntl.LOCK_SH):
+            if not os.path.isdir(tree):
+                return False
+            try:
+                subprocess.check_output(  # nosec - internal.
+                    ["cp", "-a", "--reflink=auto", tree + "/.", dst],
+                    stderr=subprocess.STDOUT,
+                )
+            except subprocess.CalledProcessError as exc:
+                raise InfrastructureError(
+                    "Unable to copy the cached rootfs: %s"
+                    % exc.output.decode("utf-8", errors="replace").strip()
+                )
+        return True
+
+    def store(self, sha256, archive):
+        """
+        Extract the archive into the cache and evict the least recently used
+        trees if needed.
+        """
+        tree = self._tree(sha256)
+        tmp = tempfile.mkdtemp(dir=self.trees, prefix=".tmp-")
+        try:
+            untar_file(archive, tmp)
+            size = 0
+            for (root, dirs, files) in os.walk(tmp):
+                for name in dirs + files:
+                    size += os.lstat(os.path.join(root, name)).st_size
+            os.chmod(tmp, 0o755)  # nosec - same as the job directories.
+            with locked(self.lock):
+                if os.path.exists(tree + ".yaml"):
+                    # Extracted by another job in the meantime
+                    return
+                with contextlib.suppress(FileNotFoundError):
+                    shutil.rmtree(tree)
+                os.rename(tmp, tree)
+                with open(tree + ".yaml", "w") as f_out:
+                    yaml.safe_dump({"sha256": sha256, "size": size}, f_out)
+                self.evict()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def evict(self):
+        """
+        Remove the least recently used trees until the cache fits in the
+        configured size. The trees being copied are skipped.
+        Should be called with the lock held.
+        """
+        trees = []
+        total = 0
+        with os.scandir(self.trees) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".yaml"):
+                    continue
+                with contextlib.suppress(OSError, yaml.YAMLError, KeyError):
+                    with open(entry.path, "r") as f_in:
+                        size = int(yaml.safe_load(f_in)["size"])
+                    trees.append((entry.stat().st_mtime, size, entry.path[:-5]))
+                    total += size
+
+        for (_, size, tree) in sorted(trees):
+            if total <= self.size:
+                break
+            with open(tree + ".lock", "a") as f_lock:
+                try:
+                    fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                os.unlink(tree + ".yaml")
+                shutil.rmtree(tree, ignore_errors=True)
+                os.unlink(tree + ".lock")
+                total -= size
+
+
+class GitCache:
+    """
+    Worker-local cache of bare mirrors of the git repositories.
+
+    Each mirror is updated with 'git fetch' before being cloned, so the jobs
+    only download the new objects. The clones are independent from the
+    mirror: the objects are hardlinked (or fetched locally for shallow
+    clones) and the origin is set back to the remote url.
+    The least recently used mirrors are removed when the cache is full.
+    """
+
+    def __init__(self, path, size=GIT_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self.binary = "/usr/bin/git"
+        self.mirrors = os.path.join(path, "mirrors")
+        self.lock = os.path.join(path, "lock")
+        os.makedirs(self.mirrors, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Return the cache configured in the dispatcher configuration or None
+        """
+        cache = config.get("git_cache")
+        if not cache or not cache.get("path"):
+            return None
+        try:
+            return cls(cache["path"], int(cache.get("size", GIT_CACHE_SIZE)))
+        except (OSError, ValueError) as exc:
+            raise InfrastructureError("Invalid git cache: %s" % str(exc))
+
+    def _mirror(self, url):
+        return os.path.join(
+            self.mirrors, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".git"
+        )
+
+    def _run(self, cmd):
+        logger = logging.getLogger("dispatcher")
+        logger.debug("Running '%s'", " ".join(cmd))
+        subprocess.check_output(cmd, stderr=subprocess.STDOUT)  # nosec - internal.
+
+    def clone(self, url, dest_path, shallow=False, branch=None):
+        """
+        Update the mirror of url and clone it into dest_path.
+        Raise subprocess.CalledProcessError on errors, like a direct clone.
+        """
+        mirror = self._mirror(url)
+        with locked(mirror + ".lock"):
+            if os.path.isdir(mirror):
+                self._run([self.binary, "-C", mirror, "fetch", "--prune", "origin"])
+            else:
+                tmp = tempfile.mkdtemp(dir=self.mirrors, prefix=".tmp-")
+                try:
+                    self._run([self.binary, "clone", "--mirror", url, tmp])
+                    os.rename(tmp, mirror)
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+
+            cmd = [self.binary, "clone"]
+            if branch is not None:
+                cmd.extend(["-b", branch])
+            if shallow:
+                # --depth is ignored for local paths
+                cmd.extend(["--depth=1", "file://" + mirror, dest_path])
+            else:
+                cmd.extend([mirror, dest_path])
+            self._run(cmd)
+            self._run(
+                [self.binary, "-C", dest_path, "remote", "set-url", "origin", url]
+            )
+
+            size = 0
+            for (root, _, files) in os.walk(mirror):
+                for name in files:
+                    size += os.lstat(os.path.join(root, name)).st_size
+            with open(mirror + ".yaml", "w") as f_out:
+                yaml.safe_dump({"url": url, "size": size}, f_out)
+
+        with locked(self.lock):
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used mirrors until the cache fits in the
+        configured size. The mirrors being used are skipped.
+        Should be called with the lock held.
+        """
+        mirrors = []
+        total = 0
+        with os.scandir(self.mirrors) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".yaml"):
+                    continue
+                with contextlib.suppress(OSError, yaml.YAMLError, KeyError):
+                    with open(entry.path, "r") as f_in:
+                        size = int(yaml.safe_load(f_in)["size"])
+                    mirrors.append((entry.stat().st_mtime, size, entry.path[:-5]))
+                    total += size
+
+        for (_, size, mirror) in sorted(mirrors):
+            if total <= self.size:
+                break
+            with open(mirror + ".lock", "a") as f_lock:
+                try:
+                    fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                os.unlink(mirror + ".yaml")
+                shutil.rmtree(mirror, ignore_errors=True)
+                os.unlink(mirror + ".lock")
+                total -= size
@@ -24,14 +24,22 @@
 # android images: tar + xz,bz2,gz, or just gz,xz,bzip2
 # vexpress recovery images: any compression though usually zip
 
+import bz2
+import contextlib
+import lzma
 import os
+import queue
 import subprocess  # nosec - internal use.
 import tarfile
+import tempfile
+import threading
+import time
+import zlib
 
 from lava_common.exceptions import InfrastructureError, JobError
 
 from lava_dispatcher.utils.contextmanager import chdir
-from lava_dispatcher.utils.shell import which
+from lava_dispatcher.utils.shell import which, _which_check
 
 
 # https://www.kernel.org/doc/Documentation/xz.txt
@@ -39,14 +47,232 @@ compress_command_map = {
     "xz": ["xz", "--check=crc32"],  # pylint: disable=invalid-name
     "gz": ["gzip"],
     "bz2": ["bzip2"],
+    "zstd": ["zstd", "--rm", "-q"],
 }
 decompress_command_map = {
     "xz": ["unxz"],  # pylint: disable=invalid-name
     "gz": ["gunzip"],
     "bz2": ["bunzip2"],
     "zip": ["unzip"],
+    "zstd": ["unzstd", "--rm", "-q"],
 }
 
+# Multi-threaded tools used to stream the data when installed.
+# The compression tools are only used when the output is compatible with the
+# kernel decompressors.
+compress_stream_tools = {  # pylint: disable=invalid-name
+    "gz": [["pigz", "-c"]],
+    "zstd": [["zstd", "-c", "-q", "-T0"]],
+}
+decompress_stream_tools = {  # pylint: disable=invalid-name
+    "xz": [["xz", "-d", "-c", "-T0"]],
+    "gz": [["pigz", "-d", "-c"]],
+    "bz2": [["lbzip2", "-d", "-c"], ["pbzip2", "-d", "-c"]],
+    "zstd": [["zstd", "-d", "-c", "-q"]],
+}
+
+# Size of the chunks when (de)compressing files
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def _compressor(compression):
+    if compression == "xz":
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC32)
+    if compression == "gz":
+        return zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    if compression == "bz2":
+        return bz2.BZ2Compressor()
+    return None
+
+
+def _decompressor(compression):
+    if compression == "xz":
+        return lzma.LZMADecompressor()
+    if compression == "gz":
+        return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    if compression == "bz2":
+        return bz2.BZ2Decompressor()
+    return None
+
+
+class StreamWriter:
+    """
+    Write the data to a file, compressing or decompressing it on the fly.
+    The data is handled by a multi-threaded tool when installed, or by the
+    python codecs in a background thread, so the caller can keep on
+    downloading and hashing in the meantime.
+    """
+
+    def __init__(self, f_out, compression, decompress=True):
+        self.f_out = f_out
+        self.compression = compression
+        self.decompress = decompress
+        self.error = None
+        self.proc = None
+        self.thread = None
+        self.codec = None
+        self.fed = False
+        # Time spent handling the data
+        self.duration = 0
+
+        tools = decompress_stream_tools if decompress else compress_stream_tools
+        for cmd in tools.get(compression, []):
+            if _which_check(cmd[0], os.path.isfile):
+                self.stderr = tempfile.TemporaryFile()
+                self.proc = subprocess.Popen(  # nosec - internal.
+                    cmd, stdin=subprocess.PIPE, stdout=f_out, stderr=self.stderr
+                )
+                self.tool = cmd[0]
+                return
+
+        if compression:
+            self.codec = (
+                _decompressor(compression) if decompress else _compressor(compression)
+            )
+            if self.codec is None:
+                raise InfrastructureError(
+                    "Cannot find a tool to %s '%s'"
+                    % ("decompress" if decompress else "compress", compression)
+                )
+        self.tool = "python"
+        self.queue = queue.Queue(maxsize=16)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            if self.error is not None:
+                # Drain the queue until close() or abort() is called
+                if data is None:
+                    return
+                continue
+            try:
+                start = time.time()
+                if data is None:
+                    self._finish()
+                    self.duration += time.time() - start
+                    return
+                self._process(data)
+                self.duration += time.time() - start
+            except Exception as exc:  # pylint: disable=broad-except
+                self.error = exc
+                if data is None:
+                    return
+
+    def _process(self, data):
+        if self.codec is None:
+            self.f_out.write(data)
+        elif not self.decompress:
+            self.f_out.write(self.codec.compress(data))
+        else:
+            while data:
+                self.fed = True
+                try:
+                    self.f_out.write(self.codec.decompress(data))
+                except (EOFError, OSError, lzma.LZMAError, zlib.error) as exc:
+                    raise JobError(
+                        "Unable to decompress the data (%s): %s"
+                        % (self.compression, exc)
+                    )
+                if not self.codec.eof:
+                    break
+                # Concatenated streams
+                data = self.codec.unused_data
+                self.codec = _decompressor(self.compression)
+                self.fed = False
+                if not data.strip(b"\0"):
+                    break
+
+    def _finish(self):
+        if self.codec is None:
+            return
+        if not self.decompress:
+            self.f_out.write(self.codec.flush())
+        elif self.fed and not self.codec.eof:
+            raise JobError(
+                "Unable to decompress the data (%s): truncated" % self.compression
+            )
+
+    def write(self, data):
+        if self.proc is not None:
+            start = time.time()
+            try:
+                self.proc.stdin.write(data)
+            except BrokenPipeError as exc:
+                raise JobError(
+                    "%s: make sure the 'compression' is corresponding "
+                    "to the file type." % str(exc)
+                )
+            self.duration += time.time() - start
+        else:
+            if self.error is not None:
+                self._raise()
+            self.queue.put(data)
+
+    def close(self):
+        if self.proc is not None:
+            start = time.time()
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            ret = self.proc.wait()
+            self.duration += time.time() - start
+            with self.stderr:
+                self.stderr.seek(0)
+                msg = self.stderr.read().decode("utf-8", errors="replace").strip()
+            if ret:
+                raise JobError(
+                    "Unable to %s the data (%s): '%s' returned %d: %s"
+                    % (
+                        "decompress" if self.decompress else "compress",
+                        self.compression,
+                        self.tool,
+                        ret,
+                        msg,
+                    )
+                )
+        elif self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            if self.error is not None:
+                self._raise()
+
+    def abort(self):
+        """
+        Stop the background thread or tool without checking the result
+        """
+        if self.proc is not None:
+            with contextlib.suppress(OSError):
+                self.proc.stdin.close()
+            self.proc.kill()
+            self.proc.wait()
+            self.stderr.close()
+        elif self.thread is not None:
+            self.error = self.error or JobError("aborted")
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _raise(self):
+        if isinstance(self.error, OSError):
+            raise InfrastructureError("Unable to write the data: %s" % self.error)
+        raise self.error
+
+
+def _stream_file(infile, outfile, compression, decompress):
+    with open(infile, "rb") as f_in, open(outfile, "wb") as f_out:
+        writer = StreamWriter(f_out, compression, decompress)
+        try:
+            for data in iter(lambda: f_in.read(STREAM_CHUNK_SIZE), b""):
+                writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
 
 def compress_file(infile, compression):
     if not compression:
@@ -54,18 +280,13 @@ def compress_file(infile, compression):
     if compression not in compress_command_map.keys():
         raise JobError("Cannot find shell command to compress: %s" % compression)
 
-    # Check that the command does exists
-    which(compress_command_map[compression][0])
-
-    with chdir(os.path.dirname(infile)):
-        # local copy for idempotency
-        cmd = compress_command_map[compression][:]
-        cmd.append(infile)
-        try:
-            subprocess.check_output(cmd)  # nosec - internal use.
-            return "%s.%s" % (infile, compression)
-        except (OSError, subprocess.CalledProcessError) as exc:
-            raise InfrastructureError("unable to compress file %s: %s" % (infile, exc))
+    outfile = "%s.%s" % (infile, compression)
+    try:
+        _stream_file(infile, outfile, compression, False)
+        os.unlink(infile)
+        return outfile
+    except OSError as exc:
+        raise InfrastructureError("unable to compress file %s: %s" % (infile, exc))
 
 
 def decompress_file(infile, compression):
@@ -74,23 +295,41 @@ def decompress_file(infile, compression):
     if compression not in decompress_command_map.keys():
         raise JobError("Cannot find shell command to decompress: %s" % compression)
 
-    # Check that the command does exists
-    which(decompress_command_map[compression][0])
+    outfile = infile
+    if infile.endswith(compression):
+        outfile = infile[: -(len(compression) + 1)]
 
-    with chdir(os.path.dirname(infile)):
-        # local copy for idempotency
-        cmd = decompress_command_map[compression][:]
-        cmd.append(infile)
-        outfile = infile
-        if infile.endswith(compression):
-            outfile = infile[: -(len(compression) + 1)]
-        try:
-            subprocess.check_output(cmd)  # nosec - internal use.
-            return outfile
-        except (OSError, subprocess.CalledProcessError) as exc:
-            raise InfrastructureError(
-                "unable to decompress file %s: %s" % (infile, exc)
-            )
+    # zip files are archives and are extracted in place
+    if compression == "zip":
+        # Check that the command does exists
+        which(decompress_command_map[compression][0])
+
+        with chdir(os.path.dirname(infile)):
+            # local copy for idempotency
+            cmd = decompress_command_map[compression][:]
+            cmd.append(infile)
+            try:
+                subprocess.check_output(cmd)  # nosec - internal use.
+                return outfile
+            except (OSError, subprocess.CalledProcessError) as exc:
+                raise InfrastructureError(
+                    "unable to decompress file %s: %s" % (infile, exc)
+                )
+
+    tmpfile = outfile + ".tmp"
+    try:
+        _stream_file(infile, tmpfile, compression, True)
+        os.unlink(infile)
+        os.rename(tmpfile, outfile)
+        return outfile
+    except OSError as exc:
+        with contextlib.suppress(OSError):
+            os.unlink(tmpfile)
+        raise InfrastructureError("unable to decompress file %s: %s" % (infile, exc))
+    except JobError:
+        with contextlib.suppress(OSError):
+            os.unlink(tmpfile)
+        raise
 
 
 def untar_file(infile, outdir, member=None, outfile=None):
@@ -19,10 +19,12 @@
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
 import atexit
+import contextlib
 import os
 import shutil
 import tarfile
 import tempfile
+import time
 import guestfs
 import glob
 import logging
@@ -123,6 +125,82 @@ def _launch_guestfs(guest):
         raise InfrastructureError("Unable to start libguestfs")
 
 
+class GuestfsAppliance:
+    """
+    libguestfs appliance shared by the helpers of this process (one job).
+
+    Booting the appliance takes several seconds. With the libvirt backend,
+    the appliance is launched once and each image is hot-added and removed
+    when done. The other backends do not support hotplugging so a new
+    appliance is launched for each image.
+    """
+
+    def __init__(self):
+        self.guest = None
+        self.hotplug = None
+        self.index = 0
+        self.launch_time = 0
+
+    def close(self):
+        if self.guest is not None:
+            with contextlib.suppress(RuntimeError):
+                self.guest.shutdown()
+            self.guest.close()
+            self.guest = None
+
+    def _launch(self, guest):
+        start = time.time()
+        _launch_guestfs(guest)
+        self.launch_time = time.time() - start
+        logger = logging.getLogger("dispatcher")
+        logger.debug("libguestfs appliance launched in %0.2fs", self.launch_time)
+
+    @contextlib.contextmanager
+    def drive(self, image, **kwargs):
+        """
+        Yield a launched guestfs handle where image is the only drive.
+        """
+        if self.hotplug is None:
+            backend = guestfs.GuestFS(python_return_dict=True).get_backend()
+            self.hotplug = backend.startswith("libvirt")
+
+        if not self.hotplug:
+            guest = guestfs.GuestFS(python_return_dict=True)
+            guest.add_drive_opts(image, **kwargs)
+            self._launch(guest)
+            try:
+                yield guest
+            finally:
+                with contextlib.suppress(RuntimeError):
+                    guest.shutdown()
+                guest.close()
+            return
+
+        if self.guest is None:
+            self.guest = guestfs.GuestFS(python_return_dict=True)
+            self._launch(self.guest)
+            atexit.register(self.close)
+        else:
+            logger = logging.getLogger("dispatcher")
+            logger.debug(
+                "Reusing the libguestfs appliance (saved %0.2fs)", self.launch_time
+            )
+        label = "lava%d" % self.index
+        self.index += 1
+        self.guest.add_drive_opts(image, label=label, **kwargs)
+        try:
+            yield self.guest
+        finally:
+            # Remove the drive even if the filesystems cannot be unmounted
+            with contextlib.suppress(RuntimeError):
+                self.guest.umount_all()
+            with contextlib.suppress(RuntimeError):
+                self.guest.remove_drive(label)
+
+
+APPLIANCE = GuestfsAppliance()
+
+
 @replace_exception(RuntimeError, JobError)
 def prepare_guestfs(output, overlay, size):
     """
@@ -136,32 +214,32 @@ def prepare_guestfs(output, overlay, size):
     :param size: size of the filesystem in Mb
     :return blkid of the guest device
     """
-    guest = guestfs.GuestFS(python_return_dict=True)
-    guest.disk_create(output, "qcow2", size * 1024 * 1024)
-    guest.add_drive_opts(output, format="qcow2", readonly=False)
-    _launch_guestfs(guest)
-    devices = guest.list_devices()
-    if len(devices) != 1:
-        raise InfrastructureError("Unable to prepare guestfs")
-    guest_device = devices[0]
-    guest.mke2fs(guest_device, label="LAVA")
-    # extract to a temp location
-    tar_output = mkdtemp()
-    # Now mount the filesystem so that we can add files.
-    guest.mount(guest_device, "/")
-    tarball = tarfile.open(overlay)
-    tarball.extractall(tar_output)
-    guest_dir = mkdtemp()
-    guest_tar = os.path.join(guest_dir, "guest.tar")
-    root_tar = tarfile.open(guest_tar, "w")
-    for topdir in os.listdir(tar_output):
-        for dirname in os.listdir(os.path.join(tar_output, topdir)):
-            root_tar.add(os.path.join(tar_output, topdir, dirname), arcname=dirname)
-    root_tar.close()
-    guest.tar_in(guest_tar, "/")
-    os.unlink(guest_tar)
-    guest.umount(guest_device)
-    return guest.blkid(guest_device)["UUID"]
+    guestfs.GuestFS(python_return_dict=True).disk_create(
+        output, "qcow2", size * 1024 * 1024
+    )
+    with APPLIANCE.drive(output, format="qcow2", readonly=False) as guest:
+        devices = guest.list_devices()
+        if len(devices) != 1:
+            raise InfrastructureError("Unable to prepare guestfs")
+        guest_device = devices[0]
+        guest.mke2fs(guest_device, label="LAVA")
+        # extract to a temp location
+        tar_output = mkdtemp()
+        # Now mount the filesystem so that we can add files.
+        guest.mount(guest_device, "/")
+        tarball = tarfile.open(overlay)
+        tarball.extractall(tar_output)
+        guest_dir = mkdtemp()
+        guest_tar = os.path.join(guest_dir, "guest.tar")
+        root_tar = tarfile.open(guest_tar, "w")
+        for topdir in os.listdir(tar_output):
+            for dirname in os.listdir(os.path.join(tar_output, topdir)):
+                root_tar.add(os.path.join(tar_output, topdir, dirname), arcname=dirname)
+        root_tar.close()
+        guest.tar_in(guest_tar, "/")
+        os.unlink(guest_tar)
+        guest.umount(guest_device)
+        return guest.blkid(guest_device)["UUID"]
 
 
 @replace_exception(RuntimeError, JobError)
@@ -171,14 +249,11 @@ def prepare_install_base(output, size):
     ready for an installer to partition, create filesystem(s)
     and install files.
     """
-    guest = guestfs.GuestFS(python_return_dict=True)
-    guest.disk_create(output, "raw", size)
-    guest.add_drive_opts(output, format="raw", readonly=False)
-    _launch_guestfs(guest)
-    devices = guest.list_devices()
-    if len(devices) != 1:
-        raise InfrastructureError("Unable to prepare guestfs")
-    guest.shutdown()
+    guestfs.GuestFS(python_return_dict=True).disk_create(output, "raw", size)
+    with APPLIANCE.drive(output, format="raw", readonly=False) as guest:
+        devices = guest.list_devices()
+        if len(devices) != 1:
+            raise InfrastructureError("Unable to prepare guestfs")
 
 
 @replace_exception(RuntimeError, JobError)
@@ -192,16 +267,13 @@ def copy_out_files(image, filenames, destination):
     """
     if not isinstance(filenames, list):
         raise LAVABug("filenames must be a list")
-    guest = guestfs.GuestFS(python_return_dict=True)
-    guest.add_drive_ro(image)
-    _launch_guestfs(guest)
-    devices = guest.list_devices()
-    if len(devices) != 1:
-        raise InfrastructureError("Unable to prepare guestfs")
-    guest.mount_ro(devices[0], "/")
-    for filename in filenames:
-        guest.copy_out(filename, destination)
-    guest.shutdown()
+    with APPLIANCE.drive(image, readonly=True) as guest:
+        devices = guest.list_devices()
+        if len(devices) != 1:
+            raise InfrastructureError("Unable to prepare guestfs")
+        guest.mount_ro(devices[0], "/")
+        for filename in filenames:
+            guest.copy_out(filename, destination)
 
 
 @replace_exception(RuntimeError, JobError)
@@ -212,34 +284,31 @@ def copy_in_overlay(image, root_partition, overlay):
     is None the image is handled as a filesystem instead of
     partitioned image.
     """
-    guest = guestfs.GuestFS(python_return_dict=True)
-    guest.add_drive(image)
-    _launch_guestfs(guest)
-
-    if root_partition:
-        partitions = guest.list_partitions()
-        if not partitions:
-            raise InfrastructureError("Unable to prepare guestfs")
-        guest_partition = partitions[root_partition]
-        guest.mount(guest_partition, "/")
-    else:
-        devices = guest.list_devices()
-        if not devices:
-            raise InfrastructureError("Unable to prepare guestfs")
-        guest.mount(devices[0], "/")
-
-    # FIXME: max message length issues when using tar_in
-    # on tar.gz.  Works fine with tar so decompressing
-    # overlay first.
-    if os.path.exists(overlay[:-3]):
-        os.unlink(overlay[:-3])
-    decompressed_overlay = decompress_file(overlay, "gz")
-    guest.tar_in(decompressed_overlay, "/")
-
-    if root_partition:
-        guest.umount(guest_partition)
-    else:
-        guest.umount(devices[0])
+    with APPLIANCE.drive(image) as guest:
+        if root_partition:
+            partitions = guest.list_partitions()
+            if not partitions:
+                raise InfrastructureError("Unable to prepare guestfs")
+            guest_partition = partitions[root_partition]
+            guest.mount(guest_partition, "/")
+        else:
+            devices = guest.list_devices()
+            if not devices:
+                raise InfrastructureError("Unable to prepare guestfs")
+            guest.mount(devices[0], "/")
+
+        # FIXME: max message length issues when using tar_in
+        # on tar.gz.  Works fine with tar so decompressing
+        # overlay first.
+        if os.path.exists(overlay[:-3]):
+            os.unlink(overlay[:-3])
+        decompressed_overlay = decompress_file(overlay, "gz")
+        guest.tar_in(decompressed_overlay, "/")
+
+        if root_partition:
+            guest.umount(guest_partition)
+        else:
+            guest.umount(devices[0])
 
 
 def lxc_path(dispatcher_config):
@@ -353,25 +422,23 @@ def copy_overlay_to_sparse_fs(image, overlay):
     which has already been converted from sparse.
     """
     logger = logging.getLogger("dispatcher")
-    guest = guestfs.GuestFS(python_return_dict=True)
-    guest.add_drive(image)
-    _launch_guestfs(guest)
-    devices = guest.list_devices()
-    if not devices:
-        raise InfrastructureError("Unable to prepare guestfs")
-    guest.mount(devices[0], "/")
-    # FIXME: max message length issues when using tar_in
-    # on tar.gz.  Works fine with tar so decompressing
-    # overlay first.
-    if os.path.exists(overlay[:-3]):
-        os.unlink(overlay[:-3])
-    decompressed_overlay = decompress_file(overlay, "gz")
-    guest.tar_in(decompressed_overlay, "/")
-    # Check if we have space left on the mounted image.
-    output = guest.df()
-    logger.debug(output)
-    _, _, _, available, percent, _ = output.split("\n")[1].split()
-    guest.umount(devices[0])
+    with APPLIANCE.drive(image) as guest:
+        devices = guest.list_devices()
+        if not devices:
+            raise InfrastructureError("Unable to prepare guestfs")
+        guest.mount(devices[0], "/")
+        # FIXME: max message length issues when using tar_in
+        # on tar.gz.  Works fine with tar so decompressing
+        # overlay first.
+        if os.path.exists(overlay[:-3]):
+            os.unlink(overlay[:-3])
+        decompressed_overlay = decompress_file(overlay, "gz")
+        guest.tar_in(decompressed_overlay, "/")
+        # Check if we have space left on the mounted image.
+        output = guest.df()
+        logger.debug(output)
+        _, _, _, available, percent, _ = output.split("\n")[1].split()
+        guest.umount(devices[0])
     if int(available) is 0 or percent == "100%":
         raise JobError("No space in image after applying overlay: %s" % image)
 
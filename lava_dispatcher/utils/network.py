@@ -27,14 +27,32 @@ import contextlib
 import os
 import netifaces
 import random
+import requests
 import socket
 import subprocess  # nosec - internal use.
+import threading
 from lava_common.exceptions import InfrastructureError
 from lava_common.constants import XNBD_PORT_RANGE_MIN, XNBD_PORT_RANGE_MAX
 
 # pylint: disable=no-member
 
 
+REQUESTS_SESSIONS = threading.local()
+
+
+def requests_session():
+    """
+    Return the requests session of the current thread, keeping the http
+    connections alive between the requests.
+    requests.Session is not thread safe, so the background downloads each
+    get their own session.
+    """
+    session = getattr(REQUESTS_SESSIONS, "session", None)
+    if session is None:
+        session = REQUESTS_SESSIONS.session = requests.Session()
+    return session
+
+
 def dispatcher_gateway():
     """
     Retrieves the IP address of the current default gateway.
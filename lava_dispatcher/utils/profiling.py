@@ -0,0 +1,155 @@
+# Copyright (C) 2020 Linaro Limited
+#
+# This file is part of LAVA Dispatcher.
+#
+# LAVA Dispatcher is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# LAVA Dispatcher is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along
+# with this program; if not, see <http://www.gnu.org/licenses>.
+
+import collections
+import contextlib
+import cProfile
+import os
+import resource
+import time
+
+Sample = collections.namedtuple(
+    "Sample", ["wall", "cpu", "subprocess", "read", "written"]
+)
+
+
+def _read_io():
+    """
+    Bytes read and written by lava-run (files, sockets and pipes)
+    """
+    counters = {}
+    with contextlib.suppress(OSError, ValueError):
+        with open("/proc/self/io", "r") as f_in:
+            for line in f_in:
+                (key, value) = line.split(":", 1)
+                counters[key] = int(value)
+    return (counters.get("rchar", 0), counters.get("wchar", 0))
+
+
+def _sample():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    (read, written) = _read_io()
+    return Sample(
+        time.time(),
+        usage.ru_utime + usage.ru_stime,
+        children.ru_utime + children.ru_stime,
+        read,
+        written,
+    )
+
+
+def _peak_rss():
+    """
+    Peak resident set size (in KiB) of lava-run and of its largest subprocess
+    since lava-run started
+    """
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+class Profiler:
+    """
+    Record the resource usage of each action.
+    The subprocess time only accounts for the subprocesses that exited
+    during the action.
+    The kernel only records the peak memory usage since the start of the
+    process, so the lifetime peak is reported along with how much the action
+    raised it.
+    """
+
+    def __init__(self, logger, output_dir=None, cprofile=False):
+        self.logger = logger
+        self.output_dir = output_dir
+        self.cprofile = cprofile
+        self.actions = []
+
+    @contextlib.contextmanager
+    def measure(self, action, top_level=False):
+        profile = None
+        if top_level and self.cprofile and self.output_dir:
+            profile = cProfile.Profile()
+        start = _sample()
+        start_rss = _peak_rss()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            end = _sample()
+            end_rss = _peak_rss()
+            data = {
+                "level": action.level,
+                "name": action.name,
+                "namespace": action.parameters.get("namespace", "common"),
+                "wall": round(end.wall - start.wall, 2),
+                "cpu": round(end.cpu - start.cpu, 2),
+                "subprocess": round(end.subprocess - start.subprocess, 2),
+                "read": end.read - start.read,
+                "written": end.written - start.written,
+                "lifetime_peak_rss": end_rss,
+                "peak_rss_increase": end_rss - start_rss,
+            }
+            self.logger.debug(
+                "profile: %s %s: wall %.02fs, cpu %.02fs, subprocess %.02fs, "
+                "read %d bytes, written %d bytes, "
+                "lifetime peak rss %d KiB (+%d KiB)",
+                data["level"],
+                data["name"],
+                data["wall"],
+                data["cpu"],
+                data["subprocess"],
+                data["read"],
+                data["written"],
+                data["lifetime_peak_rss"],
+                data["peak_rss_increase"],
+            )
+            if top_level:
+                self.actions.append(data)
+            if profile is not None:
+                self.dump(action, profile)
+
+    def dump(self, action, profile):
+        directory = os.path.join(self.output_dir, "profile")
+        filename = os.path.join(directory, "%s-%s.pstats" % (action.level, action.name))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profile.dump_stats(filename)
+        except OSError as exc:
+            self.logger.warning("Unable to dump the profile: %s", str(exc))
+            return
+        self.logger.debug("profile: python profile saved to %s", filename)
+
+    def report(self):
+        """
+        Summary of the top level actions, sent as a lava result
+        """
+        self.logger.results(  # pylint: disable=no-member
+            {
+                "definition": "lava",
+                "case": "profile",
+                # Not an action: the top level actions start at level 1
+                "level": "0",
+                "result": "pass",
+                "extra": {"actions": self.actions},
+            }
+        )
@@ -18,9 +18,12 @@
 # along
 # with this program; if not, see <http://www.gnu.org/licenses>.
 
+import os
 import pyudev
 import time
 from lava_dispatcher.action import Action
+from lava_dispatcher.udev_broker import udev_match, udev_request
+from lava_common.constants import UDEV_BROKER_SOCKET
 from lava_common.exceptions import LAVABug, InfrastructureError
 
 
@@ -31,10 +34,11 @@ class WaitUSBSerialDeviceAction(Action):
     summary = "wait for USB serial device"
     timeout_exception = InfrastructureError
 
-    def __init__(self):
+    def __init__(self, present=False):
         super().__init__()
         self.serial_device = {}
         self.usb_sleep = 0
+        self.present = present
 
     def validate(self):
         super().validate()
@@ -61,7 +65,13 @@ class WaitUSBSerialDeviceAction(Action):
     def run(self, connection, max_end_time):
         connection = super().run(connection, max_end_time)
         self.logger.debug("Waiting for usb serial device: %s", self.serial_device)
-        wait_udev_event(action="add", match_dict=self.serial_device, subsystem="tty")
+        wait_udev_event(
+            action="add",
+            match_dict=self.serial_device,
+            subsystem="tty",
+            present=self.present,
+            since=udev_since(self),
+        )
         if self.usb_sleep:
             self.logger.debug(
                 "Waiting for the board to setup, sleeping %ds", self.usb_sleep
@@ -77,9 +87,10 @@ class WaitDFUDeviceAction(Action):
     summary = "wait for DFU device"
     timeout_exception = InfrastructureError
 
-    def __init__(self):
+    def __init__(self, present=False):
         super().__init__()
         self.dfu_device = {}
+        self.present = present
 
     def validate(self):
         super().validate()
@@ -106,6 +117,8 @@ class WaitDFUDeviceAction(Action):
             match_dict=self.dfu_device,
             subsystem="usb",
             devtype="usb_device",
+            present=self.present,
+            since=udev_since(self),
         )
         return connection
 
@@ -117,9 +130,10 @@ class WaitUSBMassStorageDeviceAction(Action):
     summary = "wait for USB mass storage device"
     timeout_exception = InfrastructureError
 
-    def __init__(self):
+    def __init__(self, present=False):
         super().__init__()
         self.ms_device = {}
+        self.present = present
 
     def validate(self):
         super().validate()
@@ -136,6 +150,8 @@ class WaitUSBMassStorageDeviceAction(Action):
             match_dict=self.ms_device,
             subsystem="block",
             devtype="partition",
+            present=self.present,
+            since=udev_since(self),
         )
         return connection
 
@@ -147,9 +163,10 @@ class WaitDevicePathAction(Action):
     summary = "wait for udev device path"
     timeout_exception = InfrastructureError
 
-    def __init__(self, path=None):
+    def __init__(self, path=None, present=False):
         super().__init__()
         self.devicepath = path
+        self.present = present
 
     def validate(self):
         super().validate()
@@ -159,7 +176,12 @@ class WaitDevicePathAction(Action):
     def run(self, connection, max_end_time):
         connection = super().run(connection, max_end_time)
         self.logger.debug("Waiting for udev device path: %s", self.devicepath)
-        wait_udev_event(action="add", devicepath=self.devicepath)
+        wait_udev_event(
+            action="add",
+            devicepath=self.devicepath,
+            present=self.present,
+            since=udev_since(self),
+        )
         return connection
 
 
@@ -170,9 +192,10 @@ class WaitDeviceBoardID(Action):
     summary = "wait for udev device with board ID"
     timeout_exception = InfrastructureError
 
-    def __init__(self, board_id=None):
+    def __init__(self, board_id=None, present=False):
         super().__init__()
         self.udev_device = None
+        self.present = present
         if not board_id:
             self.board_id = self.job.device.get("board_id")
         else:
@@ -187,20 +210,124 @@ class WaitDeviceBoardID(Action):
     def run(self, connection, max_end_time):
         connection = super().run(connection, max_end_time)
         self.logger.debug("Waiting for udev device with ID: %s", self.board_id)
-        wait_udev_event(action="add", match_dict=self.udev_device)
+        wait_udev_event(
+            action="add",
+            match_dict=self.udev_device,
+            present=self.present,
+            since=udev_since(self),
+        )
         return connection
 
 
-def _dict_compare(d1, d2):  # pylint: disable=invalid-name
-    d1_keys = set(d1.keys())
-    d2_keys = set(d2.keys())
-    intersect_keys = d1_keys.intersection(d2_keys)
-    return set(o for o in intersect_keys if d1[o] == d2[o])
+def udev_since(action):
+    """
+    Time of the last reset or flash of the device, recorded by the action
+    triggering the udev events. The time is only used by the next wait, so
+    that a later wait does not match the events of an earlier reset.
+    """
+    since = action.get_namespace_data(action="shared", label="shared", key="udev-since")
+    action.set_namespace_data(
+        action="shared", label="shared", key="udev-since", value=None
+    )
+    return since
+
+
+def _udev_broker(request):
+    """
+    Send the request to the udev broker started by lava-slave.
+    Return None when the broker is not running on this worker.
+    """
+    if not os.path.exists(UDEV_BROKER_SOCKET):
+        return None
+    try:
+        return udev_request(request, UDEV_BROKER_SOCKET)
+    except (OSError, ValueError):
+        return None
+
+
+def _udev_devices(context):
+    """
+    List the present devices as (sys_path, properties), using the device
+    table of the udev broker when available.
+    """
+    answer = _udev_broker({"command": "list"})
+    if answer is not None:
+        return [(d["sys_path"], d["properties"]) for d in answer["devices"]]
+    return [(d.sys_path, dict(d.properties)) for d in context.list_devices()]
+
+
+def _device_info_match(usb_device):
+    """
+    Properties identifying a device_info entry.
+    Return the key reported as added and the properties to compare.
+    """
+    board_id = str(usb_device.get("board_id", ""))
+    usb_vendor_id = str(usb_device.get("usb_vendor_id", ""))
+    usb_product_id = str(usb_device.get("usb_product_id", ""))
+    usb_fs_label = str(usb_device.get("fs_label", ""))
+    if board_id and usb_vendor_id and usb_product_id:
+        # try with all parameters such as board id, usb_vendor_id and
+        # usb_product_id
+        return (
+            board_id,
+            {
+                "ID_SERIAL_SHORT": board_id,
+                "ID_VENDOR_ID": usb_vendor_id,
+                "ID_MODEL_ID": usb_product_id,
+            },
+        )
+    elif board_id and usb_vendor_id and not usb_product_id:
+        # try with parameters such as board id, usb_vendor_id
+        return (board_id, {"ID_SERIAL_SHORT": board_id, "ID_VENDOR_ID": usb_vendor_id})
+    elif board_id and not usb_vendor_id and not usb_product_id:
+        # try with board id alone
+        return (board_id, {"ID_SERIAL_SHORT": board_id})
+    elif usb_fs_label:
+        # Just restrict by filesystem label.
+        return (usb_fs_label, {"ID_FS_LABEL": usb_fs_label})
+    return (None, None)
+
+
+def _wait_udev_event(udev_filter, present, since):
+    """
+    Wait for an udev event matching the filter.
+    The udev broker answers at once when the event was received after
+    "since" or when "present" is set and the device is already there.
+    Without the broker, listen for the next matching event.
+    """
+    request = {
+        "command": "wait",
+        "filter": udev_filter,
+        "present": present,
+        "since": time.time() if since is None else since,
+    }
+    if _udev_broker(request) is not None:
+        return
+    context = pyudev.Context()
+    monitor = pyudev.Monitor.from_netlink(context)
+    if udev_filter.get("devtype") and udev_filter.get("subsystem"):
+        monitor.filter_by(udev_filter["subsystem"], udev_filter["devtype"])
+    elif udev_filter.get("subsystem"):
+        monitor.filter_by(udev_filter["subsystem"])
+    for device in iter(monitor.poll, None):
+        if udev_match(device.action, dict(device.properties), udev_filter):
+            break
 
 
 def wait_udev_event(
-    action="add", match_dict=None, subsystem=None, devtype=None, devicepath=None
+    action="add",
+    match_dict=None,
+    subsystem=None,
+    devtype=None,
+    devicepath=None,
+    present=False,
+    since=None,
 ):
+    """
+    Wait for the next udev event matching the filter.
+    With "since", the events received since this time are also accepted.
+    With "present", a device already there is accepted.
+    """
     if action not in ["add", "remove", "change"]:
         raise LAVABug(
             "Invalid action for udev to wait for: %s, expected 'add' or 'remove'"
@@ -218,24 +345,14 @@ def wait_udev_event(
             raise LAVABug("Neither match_dict nor devicepath were set")
     if devtype and not subsystem:
         raise LAVABug("Cannot filter udev by devtype without a subsystem")
-    match_dict["ACTION"] = action
-    context = pyudev.Context()
-    monitor = pyudev.Monitor.from_netlink(context)
-    if devtype and subsystem:
-        monitor.filter_by(subsystem, devtype)
-    else:
-        if subsystem:
-            monitor.filter_by(subsystem)
-    for device in iter(monitor.poll, None):
-        same = _dict_compare(dict(device), match_dict)
-        if same == set(match_dict.keys()):
-            if devicepath:
-                if devicepath in dict(device).get("DEVLINKS", "") or devicepath in dict(
-                    device
-                ).get("DEVNAME", ""):
-                    break
-            else:
-                break
+    udev_filter = {
+        "actions": [action],
+        "match": match_dict,
+        "subsystem": subsystem,
+        "devtype": devtype,
+        "devicepath": devicepath,
+    }
+    _wait_udev_event(udev_filter, present, since)
 
 
 def get_udev_devices(job=None, logger=None, device_info=None):
@@ -255,61 +372,23 @@ def get_udev_devices(job=None, logger=None, device_info=None):
         devices = device_info
     if not devices:
         return []
+    udev_devices = _udev_devices(context)
     added = set()
     for usb_device in devices:
-        board_id = str(usb_device.get("board_id", ""))
-        usb_vendor_id = str(usb_device.get("usb_vendor_id", ""))
-        usb_product_id = str(usb_device.get("usb_product_id", ""))
-        usb_fs_label = str(usb_device.get("fs_label", ""))
+        (key, match) = _device_info_match(usb_device)
+        if match is None:
+            continue
         # check if device is already connected
-        # try with all parameters such as board id, usb_vendor_id and
-        # usb_product_id
-        for device in context.list_devices():
-            if board_id and usb_vendor_id and usb_product_id:
-                if (
-                    (device.get("ID_SERIAL_SHORT") == board_id)
-                    and (device.get("ID_VENDOR_ID") == usb_vendor_id)
-                    and (device.get("ID_MODEL_ID") == usb_product_id)
-                ):
-                    device_paths.add(device.device_node)
-                    added.add(board_id)
-                    for child in device.children:
-                        if child.device_node:
-                            device_paths.add(child.device_node)
-                    for link in device.device_links:
-                        device_paths.add(link)
-            elif board_id and usb_vendor_id and not usb_product_id:
-                # try with parameters such as board id, usb_vendor_id
-                if (device.get("ID_SERIAL_SHORT") == board_id) and (
-                    device.get("ID_VENDOR_ID") == usb_vendor_id
-                ):
-                    device_paths.add(device.device_node)
-                    added.add(board_id)
-                    for child in device.children:
-                        if child.device_node:
-                            device_paths.add(child.device_node)
-                    for link in device.device_links:
-                        device_paths.add(link)
-            elif board_id and not usb_vendor_id and not usb_product_id:
-                # try with board id alone
-                if device.get("ID_SERIAL_SHORT") == board_id:
-                    device_paths.add(device.device_node)
-                    added.add(board_id)
-                    for child in device.children:
-                        if child.device_node:
-                            device_paths.add(child.device_node)
-                    for link in device.device_links:
-                        device_paths.add(link)
-            elif usb_fs_label:
-                # Just restrict by filesystem label.
-                if device.get("ID_FS_LABEL") == usb_fs_label:
-                    device_paths.add(device.device_node)
-                    added.add(usb_fs_label)
-                    for child in device.children:
-                        if child.device_node:
-                            device_paths.add(child.device_node)
-                    for link in device.device_links:
-                        device_paths.add(link)
+        for (sys_path, properties) in udev_devices:
+            if not udev_match("add", properties, {"match": match}):
+                continue
+            device_paths.add(properties.get("DEVNAME"))
+            added.add(key)
+            for (child_path, child) in udev_devices:
+                if child_path.startswith(sys_path + "/") and child.get("DEVNAME"):
+                    device_paths.add(child["DEVNAME"])
+            for link in properties.get("DEVLINKS", "").split():
+                device_paths.add(link)
     if device_info:
         for static_device in device_info:
             for _, value in static_device.items():
@@ -323,50 +402,16 @@ def get_udev_devices(job=None, logger=None, device_info=None):
     return list(device_paths)
 
 
-def usb_device_wait(job, device_actions=None):
-    context = pyudev.Context()
+def usb_device_wait(job, device_actions=None, present=False, since=None):
     if device_actions is None:
         device_actions = []
     for usb_device in job.device.get("device_info", []):
-        board_id = str(usb_device.get("board_id", ""))
-        usb_vendor_id = str(usb_device.get("usb_vendor_id", ""))
-        usb_product_id = str(usb_device.get("usb_product_id", ""))
-        usb_fs_label = str(usb_device.get("fs_label", ""))
+        (_, match) = _device_info_match(usb_device)
+        if match is None:
+            continue
         # monitor for device
-        monitor = pyudev.Monitor.from_netlink(context)
-        if board_id and usb_vendor_id and usb_product_id:
-            for device in iter(monitor.poll, None):
-                if (
-                    (device.get("ID_SERIAL_SHORT") == board_id)
-                    and (device.get("ID_VENDOR_ID") == usb_vendor_id)
-                    and (device.get("ID_MODEL_ID") == usb_product_id)
-                    and device.action in device_actions
-                ):
-                    break
-            return
-        elif board_id and usb_vendor_id and not usb_product_id:
-            for device in iter(monitor.poll, None):
-                if (
-                    (device.get("ID_SERIAL_SHORT") == board_id)
-                    and (device.get("ID_VENDOR_ID") == usb_vendor_id)
-                    and device.action in device_actions
-                ):
-                    break
-            return
-        elif board_id and not usb_vendor_id and not usb_product_id:
-            for device in iter(monitor.poll, None):
-                if (
-                    device.get("ID_SERIAL_SHORT") == board_id
-                ) and device.action in device_actions:
-                    break
-            return
-        elif usb_fs_label:
-            for device in iter(monitor.poll, None):
-                if (
-                    device.get("ID_FS_LABEL") == usb_fs_label
-                ) and device.action in device_actions:
-                    break
-            return
+        _wait_udev_event({"actions": device_actions, "match": match}, present, since)
+        return
 
 
 def allow_fs_label(device):
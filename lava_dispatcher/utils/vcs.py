@@ -109,25 +109,30 @@ class GitHelper(VCSHelper):
     This helper will raise a InfrastructureError for any error encountered.
     """
 
-    def __init__(self, url):
+    def __init__(self, url, cache=None):
         super().__init__(url)
         self.binary = "/usr/bin/git"
+        # Optional GitCache
+        self.cache = cache
 
     def clone(self, dest_path, shallow=False, revision=None, branch=None, history=True):
         logger = logging.getLogger("dispatcher")
         try:
-            if branch is not None:
-                cmd_args = [self.binary, "clone", "-b", branch, self.url, dest_path]
+            if self.cache is not None:
+                self.cache.clone(self.url, dest_path, shallow=shallow, branch=branch)
             else:
-                cmd_args = [self.binary, "clone", self.url, dest_path]
+                if branch is not None:
+                    cmd_args = [self.binary, "clone", "-b", branch, self.url, dest_path]
+                else:
+                    cmd_args = [self.binary, "clone", self.url, dest_path]
 
-            if shallow:
-                cmd_args.append("--depth=1")
+                if shallow:
+                    cmd_args.append("--depth=1")
 
-            logger.debug("Running '%s'", " ".join(cmd_args))
-            subprocess.check_output(  # nosec - internal use.
-                cmd_args, stderr=subprocess.STDOUT
-            )
+                logger.debug("Running '%s'", " ".join(cmd_args))
+                subprocess.check_output(  # nosec - internal use.
+                    cmd_args, stderr=subprocess.STDOUT
+                )
 
             if revision is not None:
                 logger.debug("Running '%s checkout %s", self.binary, str(revision))
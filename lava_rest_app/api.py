@@ -23,7 +23,7 @@ import tap
 
 from lava_scheduler_app.models import Device, DeviceType, TestJob, Worker
 from lava_results_app.models import TestSuite, TestCase
-from lava_scheduler_app.views import filter_device_types
+from lava_scheduler_app.views import filter_device_types, logs_response
 from lava_scheduler_app.logutils import read_logs
 from linaro_django_xmlrpc.models import AuthToken
 
@@ -259,16 +259,15 @@ class TestJobViewSet(viewsets.ReadOnlyModelViewSet):
         start = safe_str2int(request.query_params.get("start", 0))
         end = safe_str2int(request.query_params.get("end", None))
         try:
-            data = read_logs(self.get_object().output_dir, start, end)
-            if not data:
-                raise NotFound()
-            response = HttpResponse(data, content_type="application/yaml")
-            response["Content-Disposition"] = (
-                "attachment; filename=job_%d.yaml" % self.get_object().id
-            )
-            return response
+            response = logs_response(request, self.get_object(), start, end)
         except FileNotFoundError:
             raise NotFound()
+        if response is None:
+            raise NotFound()
+        response["Content-Disposition"] = (
+            "attachment; filename=job_%d.yaml" % self.get_object().id
+        )
+        return response
 
     @detail_route(methods=["get"], suffix="suites")
     def suites(self, request, **kwargs):
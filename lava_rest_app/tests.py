@@ -18,6 +18,7 @@
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
 import json
+import lzma
 import pytest
 import tap
 import yaml
@@ -170,6 +171,8 @@ class TestRestApi:
     def hit(self, client, url):
         response = client.get(url)
         assert response.status_code == 200  # nosec - unit test support
+        if response.streaming:
+            return b"".join(response.streaming_content).decode("utf-8")
         if hasattr(response, "content"):
             text = response.content.decode("utf-8")
             if response["Content-Type"] == "application/json":
@@ -275,6 +278,57 @@ class TestRestApi:
         )
         assert response.status_code == 404  # nosec - unit test support
 
+    def test_testjob_logs_range(self, monkeypatch, tmpdir):
+        (tmpdir / "output.yaml").write_text(LOG_FILE, encoding="utf-8")
+        monkeypatch.setattr(TestJob, "output_dir", str(tmpdir))
+        url = (
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/logs/" % self.public_testjob1.id
+        )
+
+        response = self.userclient.get(url, HTTP_RANGE="bytes=10-19")
+        assert response.status_code == 206  # nosec - unit test support
+        assert response["Content-Range"] == "bytes 10-19/%d" % len(
+            LOG_FILE
+        )  # nosec - unit test support
+        data = b"".join(response.streaming_content).decode("utf-8")
+        assert data == LOG_FILE[10:20]  # nosec - unit test support
+
+        response = self.userclient.get(url, HTTP_RANGE="bytes=-5")
+        assert response.status_code == 206  # nosec - unit test support
+        data = b"".join(response.streaming_content).decode("utf-8")
+        assert data == LOG_FILE[-5:]  # nosec - unit test support
+
+        response = self.userclient.get(
+            url, HTTP_RANGE="bytes=%d-" % (len(LOG_FILE) + 1)
+        )
+        assert response.status_code == 416  # nosec - unit test support
+
+        # Conditional requests
+        etag = self.userclient.get(url)["ETag"]
+        response = self.userclient.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304  # nosec - unit test support
+
+    def test_testjob_logs_compressed(self, monkeypatch, tmpdir):
+        with lzma.open(str(tmpdir / "output.yaml.xz"), "wb") as f_logs:
+            f_logs.write(LOG_FILE.encode("utf-8"))
+        monkeypatch.setattr(TestJob, "output_dir", str(tmpdir))
+        url = (
+            reverse("api-root", args=[self.version])
+            + "jobs/%s/logs/" % self.public_testjob1.id
+        )
+
+        # Uncompressed by the server
+        data = self.hit(self.userclient, url)
+        assert data == LOG_FILE  # nosec - unit test support
+
+        # Sent as-is when accepted by the client
+        response = self.userclient.get(url, HTTP_ACCEPT_ENCODING="gzip, xz")
+        assert response.status_code == 200  # nosec - unit test support
+        assert response["Content-Encoding"] == "xz"  # nosec - unit test support
+        data = b"".join(response.streaming_content)
+        assert lzma.decompress(data).decode("utf-8") == LOG_FILE  # nosec
+
     def test_testjob_nologs(self):
         response = self.userclient.get(
             reverse("api-root", args=[self.version])
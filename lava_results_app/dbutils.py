@@ -30,6 +30,7 @@ from urllib.parse import quote
 from collections import OrderedDict  # pylint: disable=unused-import
 
 from lava_common.utils import debian_package_version
+from lava_scheduler_app.logutils import read_cases
 from lava_results_app.models import (
     TestSuite,
     TestSet,
@@ -216,6 +217,53 @@ def map_scanned_results(
     return test_case
 
 
+def map_case_ids(job, lines, start=0, query=True):
+    """
+    Add the TestCase id to every results line of the given log lines.
+    The ids stored by lava-logs are used when available, otherwise a single
+    query is used for all the remaining lines.
+    :param job: the test job
+    :param lines: list of parsed log lines
+    :param start: line number of the first line in the logs
+    :param query: query the database for the ids not stored by lava-logs
+    """
+    try:
+        stored = read_cases(job.output_dir)
+    except OSError:
+        stored = {}
+
+    missing = []
+    for (index, line) in enumerate(lines, start=start):
+        if line["lvl"] == "results" and isinstance(line["msg"], dict):
+            if index in stored:
+                line["msg"]["case_id"] = stored[index]
+            else:
+                missing.append(line)
+    if not missing or not query:
+        return
+
+    keys = {
+        (line["msg"].get("definition"), line["msg"].get("case")) for line in missing
+    }
+    ids = (
+        TestCase.objects.filter(
+            suite__job=job,
+            suite__name__in={key[0] for key in keys},
+            name__in={key[1] for key in keys},
+        )
+        .order_by("id")
+        .values_list("suite__name", "name", "id")
+    )
+    case_ids = {}
+    for (suite, name, case_id) in ids:
+        case_ids.setdefault((suite, name), case_id)
+
+    for line in missing:
+        key = (line["msg"].get("definition"), line["msg"].get("case"))
+        if key in case_ids:
+            line["msg"]["case_id"] = case_ids[key]
+
+
 def _add_parameter_metadata(prefix, definition, dictionary, label):
     if "parameters" in definition and isinstance(definition["parameters"], dict):
         for paramkey, paramvalue in definition["parameters"].items():
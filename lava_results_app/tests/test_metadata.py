@@ -24,6 +24,7 @@ from lava_results_app.utils import export_testcase, testcase_export_fields
 from lava_dispatcher.parser import JobParser
 from lava_dispatcher.device import PipelineDevice
 from lava_dispatcher.tests.test_defs import allow_missing_path
+from lava_dispatcher.utils.profiling import Profiler
 
 # pylint: disable=invalid-name,too-few-public-methods,too-many-public-methods,no-member,too-many-ancestors
 
@@ -219,6 +220,36 @@ class TestMetaTypes(TestCaseWithFactory):
         os.unlink(meta_filename)
         shutil.rmtree(job.output_dir)
 
+    def test_profile_results(self):
+        class Results:
+            def __init__(self):
+                self.data = []
+
+            def results(self, data):
+                self.data.append(data)
+
+        logger = Results()
+        profiler = Profiler(logger)
+        profiler.actions = [{"level": "1", "name": "deployimages", "wall": 1.2}]
+        profiler.report()
+        results = logger.data[0]
+        job = TestJob.from_yaml_and_user(self.factory.make_job_yaml(), self.user)
+        meta_filename = os.path.join(job.output_dir, "metadata", "lava-profile-0.yaml")
+        if os.path.exists(meta_filename):
+            # isolate from other unit tests
+            os.unlink(meta_filename)
+        self.assertEqual(meta_filename, create_metadata_store(results, job))
+        ret = map_scanned_results(results, job, {}, meta_filename)
+        self.assertIsNotNone(ret)
+        ret.save()
+        test_data = yaml.load(  # nosec - unit test
+            TestCase.objects.get(name="profile").metadata, Loader=yaml.CLoader
+        )
+        self.assertEqual(test_data["extra"], meta_filename)
+        with open(meta_filename, "r") as f_in:
+            self.assertEqual(yaml.safe_load(f_in), {"actions": profiler.actions})
+        shutil.rmtree(job.output_dir)
+
     def test_repositories(self):  # pylint: disable=too-many-locals
         job = TestJob.from_yaml_and_user(self.factory.make_job_yaml(), self.user)
         job_def = yaml.safe_load(job.definition)
@@ -20,7 +20,6 @@
 
 from functools import wraps
 from simplejson import JSONDecodeError
-import os
 import sys
 import xmlrpc.client
 import yaml
@@ -37,6 +36,7 @@ from lava_scheduler_app.models import (
     DevicesUnavailableException,
     TestJob,
 )
+from lava_scheduler_app.logutils import open_logs
 from lava_scheduler_app.views import get_restricted_job
 from lava_scheduler_app.dbutils import (
     device_type_summary,
@@ -284,6 +284,7 @@ class SchedulerAPI(ExposedAPI):
         ------------
         This function returns an XML-RPC binary data of output file, provided
         the user is authenticated with an username and token.
+        Compressed logs are returned uncompressed.
         """
         self._authenticate()
         if not job_id:
@@ -297,13 +298,11 @@ class SchedulerAPI(ExposedAPI):
         except TestJob.DoesNotExist:
             raise xmlrpc.client.Fault(404, "Specified job not found.")
 
-        # Open the logs
-        output_path = os.path.join(job.output_dir, "output.yaml")
+        # Open the logs, compressed or not
         try:
-            with open(output_path, encoding="utf-8", errors="replace") as f_logs:
-                if f_logs:
-                    f_logs.seek(offset)
-                return xmlrpc.client.Binary(f_logs.read().encode("UTF-8"))
+            with open_logs(job.output_dir) as f_logs:
+                f_logs.seek(offset)
+                return xmlrpc.client.Binary(f_logs.read())
         except OSError:
             raise xmlrpc.client.Fault(404, "Job output not found.")
 
@@ -29,7 +29,7 @@ from linaro_django_xmlrpc.models import ExposedV2API
 
 import lava_common.schemas as schemas
 from lava_scheduler_app.api import SchedulerAPI
-from lava_scheduler_app.logutils import read_logs
+from lava_scheduler_app.logutils import read_logs, read_timing, timing_summary
 from lava_scheduler_app.models import TestJob
 from lava_results_app.models import TestCase
 
@@ -461,6 +461,54 @@ class SchedulerJobsAPI(ExposedV2API):
         cls = SchedulerAPI(self._context)
         return cls.submit_job(definition)
 
+    def timing(self, job_id):
+        """
+        Name
+        ----
+        `scheduler.jobs.timing` (`job_id`)
+
+        Description
+        -----------
+        Return the timing of each action of the given job
+
+        Arguments
+        ---------
+        `job_id`: string
+          Job id
+
+        Return value
+        ------------
+        This function returns a dictionary with keys:
+            "pipeline", "total_duration", "max_duration"
+        "pipeline" is an array of dictionaries with keys:
+            "level", "name", "duration", "timeout"
+        sorted by action level. Durations and timeouts are in seconds.
+        """
+        try:
+            job = TestJob.get_by_job_number(job_id)
+        except TestJob.DoesNotExist:
+            raise xmlrpc.client.Fault(404, "Job '%s' was not found." % job_id)
+
+        if not job.can_view(self.user):
+            raise xmlrpc.client.Fault(
+                403, "Job '%s' not available to user '%s'." % (job_id, self.user)
+            )
+
+        try:
+            records = read_timing(job.output_dir)
+        except OSError:
+            raise xmlrpc.client.Fault(404, "Job '%s' does not have logs" % job_id)
+
+        (pipeline, _, total_duration, max_duration) = timing_summary(records)
+        return {
+            "pipeline": [
+                {"level": lvl, "name": name, "duration": duration, "timeout": timeout}
+                for (lvl, name, duration, timeout, _) in pipeline
+            ],
+            "total_duration": total_duration,
+            "max_duration": max_duration,
+        }
+
     def validate(self, definition, strict=False):
         """
         Name
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import logging
+import os
+import select
+import simplejson
+import threading
+import time
+import yaml
+
+from django.db import connection
+
+from lava_results_app.dbutils import map_case_ids
+from lava_scheduler_app.logutils import PACK_SIZE, tail_logs
+from lava_scheduler_app.models import TestJob
+from lava_scheduler_app.templatetags.utils import udecode
+from lava_server.cmdutils import watch_directory
+
+# Number of encoded lines kept in memory by each tailer
+BUFFER_SIZE = 10000
+# Check the job state every STATE_INTERVAL seconds
+STATE_INTERVAL = 5
+# Send a keep-alive comment every KEEPALIVE seconds
+KEEPALIVE = 15
+
+
+def _is_valid(line):
+    return isinstance(line, dict) and "lvl" in line and "msg" in line
+
+
+def _load_line(raw):
+    """
+    Parse a single log line, keeping the raw text when it's not valid
+    """
+    with contextlib.suppress(yaml.YAMLError, IndexError, TypeError):
+        line = yaml.load(raw, Loader=yaml.CLoader)[0]
+        if _is_valid(line):
+            return line
+    return {"dt": "", "lvl": "debug", "msg": raw}
+
+
+def encode_logs(job, data, start):
+    """
+    Parse the given log lines and return the list of JSON encoded lines with
+    the test case ids resolved.
+    Exactly one line is returned for each line of data.
+    """
+    count = data.count("\n")
+    if not count:
+        return []
+    try:
+        lines = yaml.load(data, Loader=yaml.CLoader)
+    except yaml.YAMLError:
+        lines = None
+    # Invalid or partial yaml: parse the lines one by one
+    if (
+        not isinstance(lines, list)
+        or len(lines) != count
+        or not all(_is_valid(line) for line in lines)
+    ):
+        lines = [_load_line(raw) for raw in data.splitlines()]
+    for line in lines:
+        line["msg"] = udecode(line["msg"])
+    map_case_ids(job, lines, start)
+    return [simplejson.dumps(line) for line in lines]
+
+
+class LogTailer:
+    """
+    Follow the logs of a running job and keep the last lines, already
+    encoded in JSON, in memory.
+    A single tailer is shared by all the viewers of the same job in the
+    current process.
+    """
+
+    tailers = {}
+    lock = threading.Lock()
+
+    def __init__(self, job):
+        self.logger = logging.getLogger("lava_scheduler_app")
+        self.job = job
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        self.finished = False
+        # Encoded lines, starting at line self.first
+        self.lines = []
+        self.first = 0
+        with contextlib.suppress(OSError):
+            index = os.path.join(job.output_dir, "output.idx")
+            self.first = os.stat(index).st_size // PACK_SIZE
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @classmethod
+    def subscribe(cls, job):
+        with cls.lock:
+            tailer = cls.tailers.get(job.id)
+            if tailer is None:
+                tailer = cls.tailers[job.id] = LogTailer(job)
+                tailer.subscribers += 1
+                tailer.thread.start()
+            else:
+                tailer.subscribers += 1
+            return tailer
+
+    def unsubscribe(self):
+        with self.lock:
+            self.subscribers -= 1
+
+    @property
+    def last(self):
+        return self.first + len(self.lines)
+
+    def read(self, line, timeout):
+        """
+        Return (next_line, lines, finished) with the encoded lines starting
+        at the given line. Wait at most timeout seconds for new lines.
+        """
+        with self.condition:
+            if line >= self.last and not self.finished:
+                self.condition.wait(timeout)
+            if line >= self.first:
+                lines = self.lines[line - self.first :]
+                return (line + len(lines), lines, self.finished)
+            finished = self.finished
+
+        # The viewer is behind: read from the file system
+        try:
+            (data, count) = tail_logs(self.job.output_dir, line)
+        except OSError:
+            return (line, [], True)
+        lines = encode_logs(self.job, data, line)
+        return (line + count, lines, finished and not count)
+
+    def run(self):
+        inotify_fd = watch_directory(self.job.output_dir)
+        last_check = 0
+        try:
+            while True:
+                with self.lock:
+                    if self.subscribers <= 0:
+                        del self.tailers[self.job.id]
+                        return
+
+                # Wait for the logs to be updated
+                if inotify_fd is None:
+                    time.sleep(1)
+                else:
+                    (readable, _, _) = select.select([inotify_fd], [], [], 1)
+                    if readable:
+                        os.read(inotify_fd, 4096)
+
+                # Is the job finished?
+                finished = False
+                now = time.time()
+                if now - last_check > STATE_INTERVAL:
+                    last_check = now
+                    state = (
+                        TestJob.objects.filter(pk=self.job.pk)
+                        .values_list("state", flat=True)
+                        .first()
+                    )
+                    finished = state in [None, TestJob.STATE_FINISHED]
+
+                self.update()
+
+                if finished:
+                    # Read the lines written in the meantime
+                    self.update()
+                    with self.lock:
+                        del self.tailers[self.job.id]
+                    with self.condition:
+                        self.finished = True
+                        self.condition.notify_all()
+                    return
+        except Exception as exc:
+            self.logger.exception(exc)
+            with self.lock:
+                self.tailers.pop(self.job.id, None)
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+        finally:
+            if inotify_fd is not None:
+                os.close(inotify_fd)
+            connection.close()
+
+    def update(self):
+        try:
+            (data, count) = tail_logs(self.job.output_dir, self.last)
+        except OSError:
+            return
+        if not count:
+            return
+        lines = encode_logs(self.job, data, self.last)
+        with self.condition:
+            self.lines.extend(lines)
+            if len(self.lines) > BUFFER_SIZE:
+                self.first += len(self.lines) - BUFFER_SIZE
+                self.lines = self.lines[-BUFFER_SIZE:]
+            self.condition.notify_all()
+
+
+def stream_logs(job, line, duration):
+    """
+    Generate server-sent events with the job logs starting at the given line.
+    The stream is closed after the given duration: browsers will reconnect
+    with the last event id.
+    """
+    tailer = LogTailer.subscribe(job)
+    try:
+        end = time.time() + duration
+        # Ask browsers to reconnect quickly
+        yield "retry: 1000\n\n"
+        while time.time() < end:
+            (line, lines, finished) = tailer.read(line, KEEPALIVE)
+            if lines:
+                yield "id: %d\ndata: [%s]\n\n" % (line, ", ".join(lines))
+            elif finished:
+                yield "event: finished\ndata: %d\n\n" % line
+                return
+            else:
+                yield ": keep-alive\n\n"
+    finally:
+        tailer.unsubscribe()
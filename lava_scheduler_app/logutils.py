@@ -20,10 +20,22 @@
 import contextlib
 import lzma
 import pathlib
+import re
 import struct
+import yaml
 
 PACK_FORMAT = "=Q"
 PACK_SIZE = struct.calcsize(PACK_FORMAT)
+# (line, test case id)
+CASES_FORMAT = "=QQ"
+
+# start and end patterns
+TIMING_START = re.compile(
+    "^start: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) \\(timeout (?P<timeout>\\d+:\\d+:\\d+)\\)"
+)
+TIMING_END = re.compile(
+    "^end: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) \\(duration (?P<duration>\\d+:\\d+:\\d+)\\)"
+)
 
 
 def _build_index(directory):
@@ -36,6 +48,24 @@ def _build_index(directory):
                 line = f_log.readline()
 
 
+def _build_timing(directory):
+    with _open_logs(directory) as f_log:
+        with open(str(directory / "output.timing"), "wb") as f_timing:
+            for line in f_log:
+                # Only parse lines that might contain a start or end marker
+                if b"start: " not in line and b"end: " not in line:
+                    continue
+                try:
+                    data = yaml.load(line, Loader=yaml.CLoader)[0]
+                except (IndexError, KeyError, TypeError, yaml.YAMLError):
+                    continue
+                if data.get("lvl") not in ["debug", "info"]:
+                    continue
+                record = timing_record(data.get("msg"))
+                if record is not None:
+                    write_timing(f_timing, record)
+
+
 def _get_line_offset(f_idx, line):
     f_idx.seek(PACK_SIZE * line, 0)
     data = f_idx.read(PACK_SIZE)
@@ -55,15 +85,58 @@ def _open_logs(directory):
     return lzma.open(str(directory / "output.yaml.xz"), "rb")
 
 
-def chunked_logs(dir_name, chunk_size=4096):
-    with _open_logs(pathlib.Path(dir_name)) as f_log:
-        while True:
-            data = f_log.read(chunk_size).decode("utf-8")
+def open_logs(dir_name, compressed=False):
+    """
+    Open the logs, returning the uncompressed content unless 'compressed'
+    is set. In this case, the xz compressed file is returned as-is and
+    FileNotFoundError is raised if the logs are not compressed.
+    """
+    directory = pathlib.Path(dir_name)
+    if compressed:
+        return open(str(directory / "output.yaml.xz"), "rb")
+    return _open_logs(directory)
+
+
+def iter_logs(f_log, offset=0, length=None, chunk_size=256 * 1024):
+    """
+    Yield at most 'length' bytes from the given offset, in chunks. The file
+    is closed when done.
+    """
+    with f_log:
+        f_log.seek(offset)
+        while length is None or length > 0:
+            size = chunk_size if length is None else min(chunk_size, length)
+            data = f_log.read(size)
             if not data:
                 break
+            if length is not None:
+                length -= len(data)
             yield data
 
 
+def offset_logs(dir_name, start=0, end=None):
+    """
+    Return the offsets, in the uncompressed logs, of the given lines using
+    the index. The end offset is None when reading up to the end of the logs.
+    """
+    if start == 0 and end is None:
+        return (0, None)
+
+    directory = pathlib.Path(dir_name)
+    if not (directory / "output.idx").exists():
+        _build_index(directory)
+    with open(str(directory / "output.idx"), "rb") as f_idx:
+        start_offset = _get_line_offset(f_idx, start)
+        if start_offset is None:
+            return (0, 0)
+        if end is None:
+            return (start_offset, None)
+        end_offset = _get_line_offset(f_idx, end)
+        if end_offset is None:
+            return (start_offset, None)
+        return (start_offset, max(start_offset, end_offset))
+
+
 def read_logs(dir_name, start=0, end=None):
     directory = pathlib.Path(dir_name)
 
@@ -92,6 +165,45 @@ def read_logs(dir_name, start=0, end=None):
             return f_log.read(end_offset - start_offset).decode("utf-8")
 
 
+def tail_logs(dir_name, start, limit=4 * 1024 * 1024):
+    """
+    Return the complete lines written after the given line along with the
+    number of lines. The line currently written by lava-logs (if any) is kept
+    for the next call. At most 'limit' bytes are read, unless the first line
+    is longer than that.
+    """
+    directory = pathlib.Path(dir_name)
+    with open(str(directory / "output.idx"), "rb") as f_idx:
+        start_offset = _get_line_offset(f_idx, start)
+    if start_offset is None:
+        return ("", 0)
+    with _open_logs(directory) as f_log:
+        f_log.seek(start_offset)
+        data = f_log.read(limit)
+        # The first line is longer than the limit: return it anyway
+        if b"\n" not in data and len(data) == limit:
+            for chunk in iter(lambda: f_log.read(limit), b""):
+                data += chunk
+                if b"\n" in chunk:
+                    break
+    data = data[: data.rfind(b"\n") + 1]
+    return (data.decode("utf-8"), data.count(b"\n"))
+
+
+def read_cases(dir_name):
+    """
+    Return the test case ids stored by lava-logs, indexed by the line of the
+    corresponding results in the logs.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        with open(str(pathlib.Path(dir_name) / "output.cases"), "rb") as f_cases:
+            data = f_cases.read()
+        # Skip any partially written entry
+        data = data[: len(data) - len(data) % struct.calcsize(CASES_FORMAT)]
+        return dict(struct.iter_unpack(CASES_FORMAT, data))
+    return {}
+
+
 def size_logs(dir_name):
     directory = pathlib.Path(dir_name)
     with contextlib.suppress(FileNotFoundError):
@@ -101,6 +213,103 @@ def size_logs(dir_name):
     return None
 
 
+def _to_seconds(value):
+    parts = value.split(":")
+    return float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
+
+
+def timing_record(msg):
+    """
+    Return the timing record corresponding to the given log message or None
+    if the message is not a pipeline start or end marker.
+    """
+    if not isinstance(msg, str):
+        return None
+
+    match = TIMING_START.match(msg)
+    if match is not None:
+        d = match.groupdict()
+        return {
+            "level": d["level"],
+            "action": d["action"],
+            "timeout": _to_seconds(d["timeout"]),
+        }
+
+    match = TIMING_END.match(msg)
+    if match is not None:
+        d = match.groupdict()
+        # TODO: validate does not have a proper start line
+        if d["action"] == "validate":
+            return None
+        return {
+            "level": d["level"],
+            "action": d["action"],
+            "duration": _to_seconds(d["duration"]),
+        }
+    return None
+
+
+def read_timing(dir_name):
+    directory = pathlib.Path(dir_name)
+    # Build the sidecar for jobs recorded by an older lava-logs
+    if not (directory / "output.timing").exists():
+        _build_timing(directory)
+    with open(str(directory / "output.timing"), "rb") as f_timing:
+        return yaml.load(f_timing, Loader=yaml.CLoader) or []
+
+
+def timing_summary(records):
+    timings = {}
+    total_duration = 0
+    max_duration = 0
+    summary = []
+    for record in records:
+        level = record["level"]
+        if "timeout" in record:
+            timings[level] = {"name": record["action"], "timeout": record["timeout"]}
+            continue
+
+        duration = record["duration"]
+        # We create the entry because with some timeout, the start line
+        # might be missing.
+        timings.setdefault(level, {})["duration"] = duration
+
+        max_duration = max(max_duration, duration)
+        if "." not in level:
+            total_duration += duration
+            summary.append([record["action"], duration, 0])
+
+    # Construct the report
+    pipeline = []
+    for lvl in sorted(timings.keys()):
+        duration = timings[lvl].get("duration", 0.0)
+        timeout = timings[lvl].get("timeout", 0.0)
+        name = timings[lvl].get("name", "???")
+        pipeline.append(
+            (lvl, name, duration, timeout, bool(duration >= (timeout * 0.85)))
+        )
+
+    # Compute the percentage
+    for index, action in enumerate(summary):
+        summary[index][2] = action[1] / total_duration * 100
+
+    return (pipeline, summary, total_duration, max_duration)
+
+
+def write_timing(f_timing, record):
+    f_timing.write(
+        yaml.dump([record], default_flow_style=None, Dumper=yaml.CDumper).encode(
+            "utf-8"
+        )
+    )
+    f_timing.flush()
+
+
+def write_cases(f_cases, cases):
+    f_cases.write(b"".join(struct.pack(CASES_FORMAT, *case) for case in cases))
+    f_cases.flush()
+
+
 def write_logs(f_log, f_idx, line):
     f_idx.write(struct.pack(PACK_FORMAT, f_log.tell()))
     f_idx.flush()
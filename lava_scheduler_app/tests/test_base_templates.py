@@ -270,6 +270,10 @@ class TestBaseTemplates(BaseTemplate.BaseTemplateCases):
         self.assertIn("spawn_maxread", template_dict["constants"])
         self.assertIsInstance(template_dict["constants"]["spawn_maxread"], str)
         self.assertEqual(int(template_dict["constants"]["spawn_maxread"]), 4092)
+        self.assertIsInstance(template_dict["constants"]["spawn_searchwindowsize"], str)
+        self.assertEqual(
+            int(template_dict["constants"]["spawn_searchwindowsize"]), 16384
+        )
 
     def test_test_shell_constants(self):
         job_ctx = {}
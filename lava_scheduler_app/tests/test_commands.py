@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2020 Linaro Limited
+#
+# This file is part of LAVA.
+#
+# LAVA is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License version 3
+# as published by the Free Software Foundation
+#
+# LAVA is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import transaction
+
+from lava_results_app.models import (
+    ActionData,
+    BugLink,
+    MetaType,
+    NamedTestAttribute,
+    TestCase,
+    TestData,
+    TestSet,
+    TestSuite,
+)
+from lava_scheduler_app.models import (
+    Device,
+    DeviceType,
+    Notification,
+    NotificationCallback,
+    NotificationRecipient,
+    TestJob,
+    TestJobUser,
+)
+
+
+MODELS = [
+    ActionData,
+    BugLink,
+    NamedTestAttribute,
+    TestCase,
+    TestData,
+    TestSet,
+    TestSuite,
+    Notification,
+    NotificationCallback,
+    NotificationRecipient,
+    TestJob,
+    TestJobUser,
+]
+
+
+@pytest.fixture
+def setup(db, settings, tmpdir):
+    settings.MEDIA_ROOT = str(tmpdir)
+    user = User.objects.create_user(username="tester", password="tester")
+    dt = DeviceType.objects.create(name="qemu")
+    device = Device.objects.create(hostname="qemu-01", device_type=dt)
+    job = TestJob.objects.create(
+        description="test job",
+        is_public=True,
+        submitter=user,
+        requested_device_type=dt,
+        actual_device=device,
+        state=TestJob.STATE_FINISHED,
+        health=TestJob.HEALTH_COMPLETE,
+    )
+    device.last_health_report_job = job
+    device.save()
+
+    # Results
+    suite = TestSuite.objects.create(job=job, name="lava")
+    test_set = TestSet.objects.create(suite=suite, name="set")
+    case = TestCase.objects.create(
+        name="case", suite=suite, test_set=test_set, result=TestCase.RESULT_PASS
+    )
+    data = TestData.objects.create(testjob=job)
+    meta_type = MetaType.objects.create(name="deploy", metatype=MetaType.DEPLOY_TYPE)
+    ActionData.objects.create(
+        action_name="deploy",
+        action_level="1",
+        action_summary="deploy",
+        action_description="deploy",
+        meta_type=meta_type,
+        testdata=data,
+        testcase=case,
+    )
+    BugLink.objects.create(
+        url="https://bugs.example.com/1",
+        content_type=ContentType.objects.get_for_model(TestCase),
+        object_id=case.id,
+    )
+    NamedTestAttribute.objects.create(
+        name="key",
+        value="value",
+        content_type=ContentType.objects.get_for_model(TestData),
+        object_id=data.id,
+    )
+
+    # Notifications and users
+    notification = Notification.objects.create(test_job=job)
+    NotificationRecipient.objects.create(user=user, notification=notification)
+    NotificationCallback.objects.create(
+        notification=notification, url="https://callback.example.com"
+    )
+    TestJobUser.objects.create(user=user, test_job=job, is_favorite=True)
+    return job
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_rm(setup):
+    call_command("jobs", "rm", "--state", "FINISHED")
+    for model in MODELS:
+        assert not model.objects.exists(), model.__name__
+    assert Device.objects.get(hostname="qemu-01").last_health_report_job is None
+    assert MetaType.objects.count() == 1
+    assert User.objects.filter(username="tester").exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_rm_dry_run(setup):
+    counts = {model: model.objects.count() for model in MODELS}
+    try:
+        call_command("jobs", "rm", "--state", "FINISHED", "--dry-run")
+    finally:
+        transaction.set_autocommit(True)
+    for model in MODELS:
+        assert model.objects.count() == counts[model], model.__name__
+        assert counts[model] == 1, model.__name__
+    assert Device.objects.get(hostname="qemu-01").last_health_report_job == setup
@@ -19,7 +19,21 @@
 
 import lzma
 
-from lava_scheduler_app.logutils import read_logs, size_logs, write_logs
+from lava_scheduler_app.logutils import (
+    iter_logs,
+    offset_logs,
+    open_logs,
+    read_cases,
+    read_logs,
+    read_timing,
+    size_logs,
+    tail_logs,
+    timing_record,
+    timing_summary,
+    write_cases,
+    write_logs,
+    write_timing,
+)
 
 
 def test_read_logs_uncompressed(tmpdir):
@@ -80,3 +94,113 @@ def test_write_logs(tmpdir):
     with open(str(tmpdir / "output.idx"), "rb") as f_idx:
         assert f_idx.read(8) == b"\x00\x00\x00\x00\x00\x00\x00\x00"  # nosec
         assert f_idx.read(8) == b"\x0c\x00\x00\x00\x00\x00\x00\x00"  # nosec
+
+
+def test_tail_logs(tmpdir):
+    with open(str(tmpdir / "output.yaml"), "wb") as f_logs:
+        with open(str(tmpdir / "output.idx"), "wb") as f_idx:
+            write_logs(f_logs, f_idx, "hello world\n".encode("utf-8"))
+            write_logs(f_logs, f_idx, "how are you?\n".encode("utf-8"))
+            # Line currently written by lava-logs
+            write_logs(f_logs, f_idx, "fine".encode("utf-8"))
+
+    assert tail_logs(str(tmpdir), 0) == ("hello world\nhow are you?\n", 2)  # nosec
+    assert tail_logs(str(tmpdir), 1) == ("how are you?\n", 1)  # nosec
+    assert tail_logs(str(tmpdir), 2) == ("", 0)  # nosec
+    assert tail_logs(str(tmpdir), 3) == ("", 0)  # nosec
+    assert tail_logs(str(tmpdir), 0, limit=15) == ("hello world\n", 1)  # nosec
+    # A line longer than the limit is returned anyway
+    assert tail_logs(str(tmpdir), 0, limit=5) == ("hello world\n", 1)  # nosec
+    assert tail_logs(str(tmpdir), 2, limit=2) == ("", 0)  # nosec
+
+
+def test_timing_record():
+    assert timing_record("start: 1.2 http-download (timeout 00:01:30) [common]") == {
+        "level": "1.2",
+        "action": "http-download",
+        "timeout": 90.0,
+    }  # nosec
+    assert timing_record("end: 1.2 http-download (duration 01:00:02) [common]") == {
+        "level": "1.2",
+        "action": "http-download",
+        "duration": 3602.0,
+    }  # nosec
+    assert (
+        timing_record("end: 1 validate (duration 00:00:01) [common]") is None
+    )  # nosec
+    assert timing_record("hello world") is None  # nosec
+    assert timing_record({"case": "job"}) is None  # nosec
+
+
+def test_read_timing(tmpdir):
+    with lzma.open(str(tmpdir / "output.yaml.xz"), "wb") as f_logs:
+        f_logs.write(
+            b"""- {"dt": "2019-06-03T08:04:31", "lvl": "info", "msg": "start: 1 tftp-deploy (timeout 00:10:00) [common]"}
+- {"dt": "2019-06-03T08:04:31", "lvl": "debug", "msg": "start: 1.1 download-retry (timeout 00:05:00) [common]"}
+- {"dt": "2019-06-03T08:04:32", "lvl": "target", "msg": "end: 1.1 something (duration 00:00:02) [common]"}
+- {"dt": "2019-06-03T08:04:35", "lvl": "debug", "msg": "end: 1.1 download-retry (duration 00:04:30) [common]"}
+- {"dt": "2019-06-03T08:04:35", "lvl": "info", "msg": "end: 1 tftp-deploy (duration 00:05:00) [common]"}
+- {"dt": "2019-06-03T08:04:36", "lvl": "info", "msg": "start: 2 auto-login (timeout 00:01:00) [common]"}
+"""
+        )
+
+    # The sidecar is created from the logs when missing
+    assert not (tmpdir / "output.timing").exists()  # nosec
+    records = read_timing(str(tmpdir))
+    assert (tmpdir / "output.timing").exists()  # nosec
+    assert len(records) == 5  # nosec
+    assert read_timing(str(tmpdir)) == records  # nosec
+
+    # Records appended by lava-logs are used as-is
+    with open(str(tmpdir / "output.timing"), "ab") as f_timing:
+        write_timing(f_timing, {"level": "2", "action": "auto-login", "duration": 5.0})
+    records = read_timing(str(tmpdir))
+    assert len(records) == 6  # nosec
+
+    (pipeline, summary, total, maximum) = timing_summary(records)
+    assert pipeline == [
+        ("1", "tftp-deploy", 300.0, 600.0, False),
+        ("1.1", "download-retry", 270.0, 300.0, True),
+        ("2", "auto-login", 5.0, 60.0, False),
+    ]  # nosec
+    assert summary == [
+        ["tftp-deploy", 300.0, 300.0 / 305.0 * 100],
+        ["auto-login", 5.0, 5.0 / 305.0 * 100],
+    ]  # nosec
+    assert total == 305.0  # nosec
+    assert maximum == 300.0  # nosec
+
+
+def test_read_cases(tmpdir):
+    assert read_cases(str(tmpdir)) == {}  # nosec
+    with open(str(tmpdir / "output.cases"), "wb") as f_cases:
+        write_cases(f_cases, [(12, 1), (15, 2)])
+        write_cases(f_cases, [(20, 3)])
+        # Partially written entry
+        f_cases.write(b"\x00\x01")
+    assert read_cases(str(tmpdir)) == {12: 1, 15: 2, 20: 3}  # nosec
+
+
+def test_offset_logs(tmpdir):
+    (tmpdir / "output.yaml").write_text("hello\nworld\nhow\nare\nyou", encoding="utf-8")
+    assert offset_logs(str(tmpdir)) == (0, None)  # nosec
+    assert not (tmpdir / "output.idx").exists()  # nosec
+    assert offset_logs(str(tmpdir), 1) == (6, None)  # nosec
+    assert (tmpdir / "output.idx").exists()  # nosec
+    assert offset_logs(str(tmpdir), 1, 3) == (6, 16)  # nosec
+    assert offset_logs(str(tmpdir), 3, 1) == (16, 16)  # nosec
+    assert offset_logs(str(tmpdir), 4, 50) == (20, None)  # nosec
+    assert offset_logs(str(tmpdir), 50) == (0, 0)  # nosec
+
+
+def test_iter_logs(tmpdir):
+    with lzma.open(str(tmpdir / "output.yaml.xz"), "wb") as f_logs:
+        f_logs.write("hello\nworld\n".encode("utf-8"))
+    data = b"".join(iter_logs(open_logs(str(tmpdir))))
+    assert data == b"hello\nworld\n"  # nosec
+    chunks = list(iter_logs(open_logs(str(tmpdir)), 2, 7, chunk_size=3))
+    assert chunks == [b"llo", b"\nwo", b"r"]  # nosec
+
+    # The compressed file is sent as-is
+    data = b"".join(iter_logs(open_logs(str(tmpdir), compressed=True)))
+    assert lzma.decompress(data) == b"hello\nworld\n"  # nosec
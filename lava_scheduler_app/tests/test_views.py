@@ -18,10 +18,13 @@
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
 import pytest
+import struct
 
 from django.contrib.auth.models import Permission, User
 from django.urls import reverse
 
+from lava_scheduler_app import logtail
+from lava_scheduler_app.logutils import PACK_FORMAT, write_logs
 from lava_scheduler_app.models import (
     Alias,
     Device,
@@ -393,6 +396,92 @@ def test_job_description(client, monkeypatch, setup, tmpdir):
     assert ret.content == b"Job description"
 
 
+@pytest.mark.django_db
+def test_job_log_incremental(client, monkeypatch, setup, tmpdir):
+    (tmpdir / "job-01").mkdir()
+    (tmpdir / "job-01" / "output.yaml").write_text(
+        '- {"dt": "2019-06-03T08:04:31", "lvl": "info", "msg": "hello"}\n'
+        '- {"dt": "2019-06-03T08:04:32", "lvl": "results", "msg": {"definition": "lava", "case": "job", "result": "pass"}}\n',
+        encoding="utf-8",
+    )
+    # Test case ids stored by lava-logs
+    (tmpdir / "job-01" / "output.cases").write_binary(
+        b"\x01\x00\x00\x00\x00\x00\x00\x00\x2a\x00\x00\x00\x00\x00\x00\x00"
+    )
+    monkeypatch.setattr(TestJob, "output_dir", str(tmpdir / "job-01"))
+
+    job = TestJob.objects.get(description="test job 01")
+    ret = client.get(
+        reverse("lava.scheduler.job.log_incremental", args=[job.pk]) + "?line=1"
+    )
+    assert ret.status_code == 200
+    assert ret["X-Is-Finished"] == "1"
+    assert ret.json() == [
+        {
+            "dt": "2019-06-03T08:04:32",
+            "lvl": "results",
+            "msg": {
+                "definition": "lava",
+                "case": "job",
+                "result": "pass",
+                "case_id": 42,
+            },
+        }
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_job_log_stream(client, monkeypatch, settings, setup, tmpdir):
+    job = TestJob.objects.get(description="test job 01")
+    settings.LOG_STREAMING = False
+    ret = client.get(reverse("lava.scheduler.job.log_stream", args=[job.pk]))
+    assert ret.status_code == 404
+
+    job.state = TestJob.STATE_RUNNING
+    job.save()
+    (tmpdir / "job-01").mkdir()
+    f_logs = open(str(tmpdir / "job-01" / "output.yaml"), "wb")
+    f_idx = open(str(tmpdir / "job-01" / "output.idx"), "wb")
+    write_logs(
+        f_logs,
+        f_idx,
+        b'- {"dt": "2019-06-03T08:04:31", "lvl": "info", "msg": "hello"}\n',
+    )
+    monkeypatch.setattr(TestJob, "output_dir", str(tmpdir / "job-01"))
+    monkeypatch.setattr(logtail, "STATE_INTERVAL", 0)
+    settings.LOG_STREAMING = True
+    ret = client.get(reverse("lava.scheduler.job.log_stream", args=[job.pk]))
+    assert ret.status_code == 200
+    assert ret["Content-Type"] == "text/event-stream"
+    events = iter(ret.streaming_content)
+    assert next(events) == b"retry: 1000\n\n"
+    assert next(events) == (
+        b'id: 1\ndata: [{"dt": "2019-06-03T08:04:31", "lvl": "info", "msg": "hello"}]\n\n'
+    )
+
+    # The job is still running: the new lines are streamed, including the
+    # invalid ones. Write both lines at once, like lava-logs.
+    lines = [
+        b'- {"dt": "2019-06-03T08:04:32", "lvl": "info", "msg": "world"}\n',
+        b"- {invalid\n",
+    ]
+    f_idx.write(struct.pack(PACK_FORMAT, f_logs.tell()))
+    f_idx.write(struct.pack(PACK_FORMAT, f_logs.tell() + len(lines[0])))
+    f_idx.flush()
+    f_logs.write(b"".join(lines))
+    f_logs.flush()
+    f_logs.close()
+    f_idx.close()
+    assert next(events) == (
+        b'id: 3\ndata: [{"dt": "2019-06-03T08:04:32", "lvl": "info", "msg": "world"}, '
+        b'{"dt": "", "lvl": "debug", "msg": "- {invalid"}]\n\n'
+    )
+
+    # The job is finished
+    TestJob.objects.filter(pk=job.pk).update(state=TestJob.STATE_FINISHED)
+    assert b"".join(events) == b"event: finished\ndata: 3\n\n"
+
+
 @pytest.mark.django_db
 def test_job_submit(client, setup):
     # Anonymous user GET
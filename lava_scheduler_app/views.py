@@ -46,6 +46,7 @@ from django.http import (
     HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
+    HttpResponseNotModified,
     HttpResponseRedirect,
     JsonResponse,
 )
@@ -53,6 +54,7 @@ from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.timesince import timeuntil
 from django.views.decorators.http import require_POST
 from django_tables2 import RequestConfig
@@ -79,10 +81,20 @@ from lava_scheduler_app.dbutils import (
     testjob_submission,
     validate_job,
 )
-from lava_scheduler_app.logutils import size_logs, read_logs, chunked_logs
+from lava_scheduler_app.logtail import stream_logs
+from lava_scheduler_app.logutils import (
+    iter_logs,
+    offset_logs,
+    open_logs,
+    read_logs,
+    read_timing,
+    size_logs,
+    timing_summary,
+)
 from lava_scheduler_app.templatetags.utils import udecode
 
 from lava.utils.lavatable import LavaView
+from lava_results_app.dbutils import map_case_ids
 from lava_results_app.utils import (
     check_request_auth,
     description_data,
@@ -1311,6 +1323,7 @@ def job_detail(request, pk):
         "test_list": test_list,
         "job_tags": job.tags.all(),
         "size_limit": job.size_limit,
+        "log_streaming": settings.LOG_STREAMING,
     }
 
     try:
@@ -1327,17 +1340,12 @@ def job_detail(request, pk):
         log_data = None
 
     if log_data:
+        # The ids stored by lava-logs are always used. Only query the database
+        # for the other ids when the job does not have too many test cases.
         test_case_count = TestCase.objects.filter(suite__job=job).count()
-        if test_case_count <= settings.TESTCASE_COUNT_LIMIT:
-            results = {
-                (t.suite.name, t.name): t.id
-                for t in TestCase.objects.filter(suite__job=job).select_related("suite")
-            }
-            # list all related results
-            for line in [line for line in log_data if line["lvl"] == "results"]:
-                key = (line["msg"].get("definition"), line["msg"].get("case"))
-                if key in results:
-                    line["msg"]["case_id"] = results[key]
+        map_case_ids(
+            job, log_data, query=test_case_count <= settings.TESTCASE_COUNT_LIMIT
+        )
 
     # Get lava.job result if available
     lava_job_result = None
@@ -1563,75 +1571,11 @@ def job_status(request, pk):
 def job_timing(request, pk):
     job = get_restricted_job(request.user, pk, request=request)
     try:
-        data = read_logs(job.output_dir)
-        logs = yaml.load(data, Loader=yaml.CLoader)
+        records = read_timing(job.output_dir)
     except OSError:
         raise Http404
 
-    # start and end patterns
-    pattern_start = re.compile(
-        "^start: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) \\(timeout (?P<timeout>\\d+:\\d+:\\d+)\\)"
-    )
-    pattern_end = re.compile(
-        "^end: (?P<level>[\\d.]+) (?P<action>[\\w_-]+) \\(duration (?P<duration>\\d+:\\d+:\\d+)\\)"
-    )
-
-    timings = {}
-    total_duration = 0
-    max_duration = 0
-    summary = []
-    for line in logs:
-        # Only parse debug and info levels
-        if line["lvl"] not in ["debug", "info"]:
-            continue
-
-        # Will raise if the log message is a python object
-        try:
-            match = pattern_start.match(line["msg"])
-        except TypeError:
-            continue
-
-        if match is not None:
-            d = match.groupdict()
-            parts = d["timeout"].split(":")
-            timeout = float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
-            timings[d["level"]] = {"name": d["action"], "timeout": float(timeout)}
-            continue
-
-        # No need to catch TypeError here as we know it's a string
-        match = pattern_end.match(line["msg"])
-        if match is not None:
-            d = match.groupdict()
-            # TODO: validate does not have a proper start line
-            if d["action"] == "validate":
-                continue
-            level = d["level"]
-            parts = d["duration"].split(":")
-            duration = float(parts[0]) * 3600 + float(parts[1]) * 60 + float(parts[2])
-            # We create the entry because with some timeout, the start line
-            # might be missing.
-            timings.setdefault(level, {})["duration"] = duration
-
-            max_duration = max(max_duration, duration)
-            if "." not in level:
-                total_duration += duration
-                summary.append([d["action"], duration, 0])
-
-    levels = sorted(timings.keys())
-
-    # Construct the report
-    pipeline = []
-    for lvl in levels:
-        duration = timings[lvl].get("duration", 0.0)
-        timeout = timings[lvl].get("timeout", 0.0)
-        name = timings[lvl].get("name", "???")
-        pipeline.append(
-            (lvl, name, duration, timeout, bool(duration >= (timeout * 0.85)))
-        )
-
-    # Compute the percentage
-    for index, action in enumerate(summary):
-        summary[index][2] = action[1] / total_duration * 100
+    (pipeline, summary, total_duration, max_duration) = timing_summary(records)
 
     if not pipeline:
         response_dict = {"timing": "", "graph": []}
@@ -1681,15 +1625,113 @@ def job_configuration(request, pk):
     return response
 
 
+RANGE_PATTERN = re.compile(r"^bytes=(?P<first>\d*)-(?P<last>\d*)$")
+
+
+def logs_response(request, job, start=0, end=None):
+    """
+    Stream the logs between the given lines. The HTTP Range, If-Range and
+    If-None-Match headers are honoured. When the client accepts it, the xz
+    compressed logs are sent as-is.
+    Return None if the requested logs are empty and raise FileNotFoundError
+    if the logs are missing.
+    """
+    encodings = [
+        e.split(";")[0].strip()
+        for e in request.META.get("HTTP_ACCEPT_ENCODING", "").split(",")
+    ]
+    encoded = start == 0 and end is None and "xz" in encodings
+    try:
+        f_log = open_logs(job.output_dir, compressed=encoded)
+    except FileNotFoundError:
+        if not encoded:
+            raise
+        encoded = False
+        f_log = open_logs(job.output_dir)
+
+    stat = os.fstat(f_log.fileno())
+    etag = '"%x-%x-%s-%s%s"' % (
+        stat.st_mtime_ns,
+        stat.st_size,
+        start,
+        end,
+        "-xz" if encoded else "",
+    )
+    etags = [e.strip() for e in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")]
+    if etag in etags:
+        f_log.close()
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    if encoded:
+        (offset, size) = (0, stat.st_size)
+    else:
+        (offset, last) = offset_logs(job.output_dir, start, end)
+        if last is None:
+            total = size_logs(job.output_dir)
+            size = None if total is None else max(0, total - offset)
+        else:
+            size = last - offset
+    if size == 0:
+        f_log.close()
+        return None
+
+    # Only a single range is supported. Otherwise, send the full content
+    status = 200
+    length = size
+    content_range = None
+    match = RANGE_PATTERN.match(request.META.get("HTTP_RANGE", "").strip())
+    if_range = request.META.get("HTTP_IF_RANGE", etag)
+    if (
+        match is not None
+        and size is not None
+        and if_range == etag
+        and (match.group("first") or match.group("last"))
+    ):
+        if not match.group("first"):
+            first = max(0, size - int(match.group("last")))
+            last = size - 1
+        else:
+            first = int(match.group("first"))
+            last = size - 1
+            if match.group("last"):
+                last = min(int(match.group("last")), size - 1)
+        if first >= size or first > last:
+            f_log.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+        status = 206
+        offset += first
+        length = last - first + 1
+        content_range = "bytes %d-%d/%d" % (first, last, size)
+
+    response = StreamingHttpResponse(
+        iter_logs(f_log, offset, length), status=status, content_type="application/yaml"
+    )
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if length is not None:
+        response["Content-Length"] = str(length)
+    if content_range is not None:
+        response["Content-Range"] = content_range
+    if encoded:
+        response["Content-Encoding"] = "xz"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
 def job_log_file_plain(request, pk):
     job = get_restricted_job(request.user, pk, request=request)
     try:
-        data = chunked_logs(job.output_dir)
-        response = StreamingHttpResponse(data, content_type="application/yaml")
-        response["Content-Disposition"] = "attachment; filename=job_%d.log" % job.id
-        return response
+        response = logs_response(request, job)
     except OSError:
         raise Http404
+    if response is None:
+        response = HttpResponse("", content_type="application/yaml")
+    response["Content-Disposition"] = "attachment; filename=job_%d.log" % job.id
+    return response
 
 
 def job_log_incremental(request, pk):
@@ -1715,14 +1757,7 @@ def job_log_incremental(request, pk):
         else:
             for line in data:
                 line["msg"] = udecode(line["msg"])
-                if line["lvl"] == "results":
-                    case_id = TestCase.objects.filter(
-                        suite__job=job,
-                        suite__name=line["msg"]["definition"],
-                        name=line["msg"]["case"],
-                    ).values_list("id", flat=True)
-                    if case_id:
-                        line["msg"]["case_id"] = case_id[0]
+            map_case_ids(job, data, first_line)
 
     except (OSError, StopIteration, yaml.YAMLError):
         data = []
@@ -1735,6 +1770,35 @@ def job_log_incremental(request, pk):
     return response
 
 
+def job_log_stream(request, pk):
+    if not settings.LOG_STREAMING:
+        raise Http404
+    job = get_restricted_job(request.user, pk, request=request)
+    # Start from this line
+    try:
+        first_line = int(
+            request.META.get("HTTP_LAST_EVENT_ID", request.GET.get("line", 0))
+        )
+    except ValueError:
+        first_line = 0
+
+    job_file_size = size_logs(job.output_dir)
+    if job_file_size is not None and job_file_size >= job.size_limit:
+        response = HttpResponse(
+            "event: size-warning\ndata: %d\n\n" % first_line,
+            content_type="text/event-stream",
+        )
+    else:
+        response = StreamingHttpResponse(
+            stream_logs(job, first_line, settings.LOG_STREAMING_TIMEOUT),
+            content_type="text/event-stream",
+        )
+        # Do not buffer the events in the reverse proxy
+        response["X-Accel-Buffering"] = "no"
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 def job_cancel(request, pk):
     with transaction.atomic():
         job = get_restricted_job(request.user, pk, request=request, for_update=True)
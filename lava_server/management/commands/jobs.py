@@ -17,25 +17,43 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with LAVA.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import datetime
 import lzma
+import os
 import pathlib
 import re
 from shutil import chown, rmtree
 import time
-import yaml
-import voluptuous
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.core.mail import mail_admins
 from django.core.management.base import BaseCommand, CommandError, CommandParser
 from django.db import transaction
+from django.template.defaultfilters import filesizeformat
 from django.utils import timezone
 
-from lava_scheduler_app.models import TestJob
-from lava_common.schemas import validate
+from lava_results_app.models import (
+    ActionData,
+    BugLink,
+    NamedTestAttribute,
+    TestCase,
+    TestData,
+    TestSet,
+    TestSuite,
+)
+from lava_scheduler_app.models import (
+    Device,
+    Notification,
+    NotificationCallback,
+    NotificationRecipient,
+    TestJob,
+    TestJobUser,
+)
+from lava_common.schemas import validate_many
 
 
 def _create_output_size(base, size):
@@ -43,6 +61,81 @@ def _create_output_size(base, size):
     chown(str(base / "output.yaml.size"), "lavaserver", "lavaserver")
 
 
+def _directory_size(path):
+    size = 0
+    for (root, dirs, files) in os.walk(path):
+        for name in dirs + files:
+            with contextlib.suppress(OSError):
+                size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+def _remove_directory(path, simulate):
+    """
+    Remove the directory and return (size, error)
+    """
+    size = _directory_size(path)
+    try:
+        if not simulate:
+            rmtree(path)
+    except OSError as exc:
+        return (size, exc)
+    return (size, None)
+
+
+def _purge_jobs(ids):
+    """
+    Remove the given finished jobs and every dependent row, table by table.
+    The leaves are removed first so that Django can use fast deletes for
+    most of the tables instead of collecting the objects one by one.
+    Return the number of rows removed.
+    """
+    count = 0
+
+    def delete(queryset):
+        nonlocal count
+        count += queryset.delete()[0]
+
+    cases = TestCase.objects.filter(suite__job_id__in=ids)
+    data = TestData.objects.filter(testjob_id__in=ids)
+    notifications = Notification.objects.filter(test_job_id__in=ids)
+
+    # Results
+    delete(ActionData.objects.filter(testdata__in=data))
+    delete(ActionData.objects.filter(testcase__in=cases))
+    delete(
+        BugLink.objects.filter(
+            content_type=ContentType.objects.get_for_model(TestCase),
+            object_id__in=cases.values("id"),
+        )
+    )
+    delete(
+        NamedTestAttribute.objects.filter(
+            content_type=ContentType.objects.get_for_model(TestData),
+            object_id__in=data.values("id"),
+        )
+    )
+    delete(cases)
+    delete(TestSet.objects.filter(suite__job_id__in=ids))
+    delete(TestSuite.objects.filter(job_id__in=ids))
+    delete(data)
+
+    # Notifications and users
+    delete(NotificationCallback.objects.filter(notification__in=notifications))
+    delete(NotificationRecipient.objects.filter(notification__in=notifications))
+    delete(notifications)
+    delete(TestJobUser.objects.filter(test_job_id__in=ids))
+    Device.objects.filter(last_health_report_job_id__in=ids).update(
+        last_health_report_job=None
+    )
+
+    # Many to many relations and the jobs themselves
+    for field in ["failure_tags", "tags", "viewing_groups"]:
+        delete(getattr(TestJob, field).through.objects.filter(testjob_id__in=ids))
+    delete(TestJob.objects.filter(id__in=ids))
+    return count
+
+
 class Command(BaseCommand):
     help = "Manage jobs"
 
@@ -123,6 +216,18 @@ class Command(BaseCommand):
             action="store_true",
             help="Be nice with the system by sleeping regularly",
         )
+        rm.add_argument(
+            "--batch-size",
+            default=1000,
+            type=int,
+            help="Number of jobs removed in each transaction",
+        )
+        rm.add_argument(
+            "--threads",
+            default=4,
+            type=int,
+            help="Number of threads removing the job output directories",
+        )
 
         valid = sub.add_parser(
             "validate",
@@ -152,6 +257,12 @@ class Command(BaseCommand):
             help="If set to True, the validator will reject any extra keys "
             "that are present in the job definition but not defined in the schema",
         )
+        valid.add_argument(
+            "--processes",
+            default=None,
+            type=int,
+            help="Number of processes validating the jobs (one per cpu by default)",
+        )
 
         comp = sub.add_parser("compress", help="Compress the corresponding job logs")
         comp.add_argument(
@@ -195,6 +306,9 @@ class Command(BaseCommand):
                 options["state"],
                 options["dry_run"],
                 options["slow"],
+                options["batch_size"],
+                options["threads"],
+                options["verbosity"],
             )
         elif options["sub_command"] == "fail":
             self.handle_fail(options["job_id"])
@@ -204,6 +318,7 @@ class Command(BaseCommand):
                 options["submitter"],
                 options["strict"],
                 options["mail_admins"],
+                options["processes"],
             )
         elif options["sub_command"] == "compress":
             self.handle_compress(
@@ -223,7 +338,17 @@ class Command(BaseCommand):
         except TestJob.DoesNotExist:
             raise CommandError("TestJob '%d' does not exists" % job_id)
 
-    def handle_rm(self, older_than, submitter, state, simulate, slow):
+    def handle_rm(
+        self,
+        older_than,
+        submitter,
+        state,
+        simulate,
+        slow,
+        batch_size,
+        threads,
+        verbosity,
+    ):
         if not older_than and not submitter and not state:
             raise CommandError("You should specify at least one filtering option")
 
@@ -253,34 +378,103 @@ class Command(BaseCommand):
         if state is not None:
             jobs = jobs.filter(state=self.job_state[state])
 
+        if batch_size <= 0:
+            raise CommandError("The batch size should be a positive integer")
+        if threads <= 0:
+            raise CommandError("The number of threads should be a positive integer")
+
         self.stdout.write("Removing %d jobs:" % jobs.count())
 
-        while True:
-            count = 0
-            for job in jobs[0:100]:
-                count += 1
-                self.stdout.write(
-                    "* %d (%s): %s" % (job.id, job.end_time, job.output_dir)
+        total = {"jobs": 0, "rows": 0, "bytes": 0}
+        begin = time.time()
+        last_id = 0
+        pending = []
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            while True:
+                batch_begin = time.time()
+                batch = list(
+                    jobs.filter(id__gt=last_id).only(
+                        "id", "state", "submit_time", "end_time"
+                    )[:batch_size]
                 )
-                try:
-                    if not simulate:
-                        rmtree(job.output_dir)
-                except OSError as exc:
-                    self.stderr.write(
-                        "  -> Unable to remove the directory: %s" % str(exc)
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                # Compute the paths before the objects are deleted
+                directories = [job.output_dir for job in batch]
+
+                # Running jobs should be canceled by the pre_delete signal
+                finished = []
+                rows = 0
+                for (job, directory) in zip(batch, directories):
+                    if verbosity > 1:
+                        self.stdout.write(
+                            "* %d (%s): %s" % (job.id, job.end_time, directory)
+                        )
+                    if job.state == TestJob.STATE_FINISHED:
+                        finished.append(job.id)
+                    else:
+                        rows += job.delete()[0]
+                with transaction.atomic():
+                    rows += _purge_jobs(finished)
+
+                # Only wait for the previous batch to keep the memory bounded
+                size = self._wait_removals(pending)
+                pending = [
+                    executor.submit(_remove_directory, directory, simulate)
+                    for directory in directories
+                ]
+
+                total["jobs"] += len(batch)
+                total["rows"] += rows
+                total["bytes"] += size
+                duration = max(time.time() - batch_begin, 0.001)
+                self.stdout.write(
+                    "-> %d jobs, %d rows (%.1f rows/s), %s (%s/s)"
+                    % (
+                        len(batch),
+                        rows,
+                        rows / duration,
+                        filesizeformat(size),
+                        filesizeformat(size / duration),
                     )
-                job.delete()
+                )
 
-            if count == 0:
-                break
-            if slow:
-                self.stdout.write("sleeping 2s...")
-                time.sleep(2)
+                if slow:
+                    self.stdout.write("sleeping 2s...")
+                    time.sleep(2)
+
+            total["bytes"] += self._wait_removals(pending)
 
         if simulate:
             transaction.rollback()
 
-    def handle_validate(self, newer_than, submitter, strict, should_mail_admins):
+        duration = max(time.time() - begin, 0.001)
+        self.stdout.write(
+            "Removed %d jobs, %d rows (%.1f rows/s), %s (%s/s) in %.1fs"
+            % (
+                total["jobs"],
+                total["rows"],
+                total["rows"] / duration,
+                filesizeformat(total["bytes"]),
+                filesizeformat(total["bytes"] / duration),
+                duration,
+            )
+        )
+
+    def _wait_removals(self, futures):
+        size = 0
+        for future in futures:
+            (removed, exc) = future.result()
+            size += removed
+            if exc is not None:
+                self.stderr.write("  -> Unable to remove the directory: %s" % str(exc))
+        return size
+
+    def handle_validate(
+        self, newer_than, submitter, strict, should_mail_admins, processes
+    ):
         jobs = TestJob.objects.all().order_by("id")
         if newer_than is not None:
             pattern = re.compile(r"^(?P<time>\d+)(?P<unit>(h|d))$")
@@ -301,28 +495,35 @@ class Command(BaseCommand):
                 raise CommandError("Unable to find submitter '%s'" % submitter)
             jobs = jobs.filter(submitter=user)
 
+        # Load the definitions before forking the validation processes
+        definitions = [
+            (job_id, multinode if target_group else original)
+            for (job_id, target_group, original, multinode) in jobs.values_list(
+                "id", "target_group", "original_definition", "multinode_definition"
+            )
+        ]
+
         invalid = {}
-        for job in jobs:
-            if job.is_multinode:
-                definition = job.multinode_definition
-            else:
-                definition = job.original_definition
-            data = yaml.safe_load(definition)
-            try:
-                validate(data, strict, settings.EXTRA_CONTEXT_VARIABLES)
-                print("* %s" % job.id)
-            except voluptuous.Invalid as exc:
-                invalid[job.id] = {
-                    "submitter": job.submitter,
-                    "dt": job.requested_device_type,
-                    "key": exc.path,
-                    "msg": exc.msg,
-                }
-                print("* %s Invalid job definition" % job.id)
-                print("    submitter: %s" % job.submitter)
-                print("    device-type: %s" % job.requested_device_type)
-                print("    key: %s" % exc.path)
-                print("    msg: %s" % exc.msg)
+        for (job_id, exc) in validate_many(
+            definitions, strict, settings.EXTRA_CONTEXT_VARIABLES, processes
+        ):
+            if exc is None:
+                print("* %s" % job_id)
+                continue
+            job = TestJob.objects.select_related(
+                "submitter", "requested_device_type"
+            ).get(pk=job_id)
+            invalid[job.id] = {
+                "submitter": job.submitter,
+                "dt": job.requested_device_type,
+                "key": exc.path,
+                "msg": exc.msg,
+            }
+            print("* %s Invalid job definition" % job.id)
+            print("    submitter: %s" % job.submitter)
+            print("    device-type: %s" % job.requested_device_type)
+            print("    key: %s" % exc.path)
+            print("    msg: %s" % exc.msg)
         if invalid:
             if should_mail_admins:
                 body = "Hello,\n\nthe following jobs schema are invalid:\n"
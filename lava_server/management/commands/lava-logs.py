@@ -37,7 +37,14 @@ from lava_server.cmdutils import LAVADaemonCommand, watch_directory
 from lava_scheduler_app.models import TestJob
 from lava_scheduler_app.signals import send_event
 from lava_scheduler_app.utils import mkdir
-from lava_scheduler_app.logutils import line_count, write_logs
+from lava_scheduler_app.logutils import (
+    line_count,
+    read_timing,
+    timing_record,
+    write_cases,
+    write_logs,
+    write_timing,
+)
 from lava_results_app.dbutils import map_scanned_results, create_metadata_store
 
 
@@ -53,16 +60,27 @@ class JobHandler:  # pylint: disable=too-few-public-methods
         self.output_dir = job.output_dir
         self.output = open(os.path.join(self.output_dir, "output.yaml"), "ab")
         self.index = open(os.path.join(self.output_dir, "output.idx"), "ab")
+        timing = os.path.join(self.output_dir, "output.timing")
+        # Logs written by an older lava-logs do not have the timing sidecar
+        if self.output.tell() and not os.path.exists(timing):
+            read_timing(self.output_dir)
+        self.timing = open(timing, "ab")
         self.last_usage = time.time()
         self.markers = {}
 
     def write(self, message):
         write_logs(self.output, self.index, (message + "\n").encode("utf-8"))
 
+    def write_timing(self, message):
+        record = timing_record(message)
+        if record is not None:
+            write_timing(self.timing, record)
+
     def line_count(self):
         return line_count(self.index)
 
     def close(self):
+        self.timing.close()
         self.index.close()
         self.output.close()
 
@@ -245,10 +263,10 @@ class Command(LAVADaemonCommand):
             return
 
         # Try to save into the database
+        test_cases = [tc for (tc, _, _) in self.test_cases]
         try:
-            TestCase.objects.bulk_create(self.test_cases)
-            self.logger.info("Saving %d test cases", len(self.test_cases))
-            self.test_cases = []
+            TestCase.objects.bulk_create(test_cases)
+            self.logger.info("Saving %d test cases", len(test_cases))
         except DatabaseError as exc:
             self.logger.error("Unable to flush the test cases")
             self.logger.exception(exc)
@@ -256,14 +274,30 @@ class Command(LAVADaemonCommand):
                 "Saving test cases one by one and dropping the faulty ones"
             )
             saved = 0
-            for tc in self.test_cases:
+            for tc in test_cases:
                 with contextlib.suppress(DatabaseError):
                     tc.save()
                     saved += 1
             self.logger.info(
-                "%d test cases saved, %d dropped", saved, len(self.test_cases) - saved
+                "%d test cases saved, %d dropped", saved, len(test_cases) - saved
             )
-            self.test_cases = []
+        self.save_case_ids()
+        self.test_cases = []
+
+    def save_case_ids(self):
+        # Store the test case ids along with the results line, allowing the
+        # log views to link to the test cases without querying the database.
+        # The primary keys are only set by bulk_create on some databases.
+        cases = {}
+        for (tc, output_dir, line) in self.test_cases:
+            if tc.pk is not None:
+                cases.setdefault(output_dir, []).append((line, tc.pk))
+        for (output_dir, ids) in cases.items():
+            try:
+                with open(os.path.join(output_dir, "output.cases"), "ab") as f_cases:
+                    write_cases(f_cases, ids)
+            except OSError as exc:
+                self.logger.error("Unable to save the test case ids: %s", exc)
 
     def main_loop(self):
         last_gc = time.time()
@@ -421,6 +455,10 @@ class Command(LAVADaemonCommand):
         # The format is a list of dictionaries
         self.jobs[job_id].write("- %s" % message)
 
+        # Keep track of the pipeline start and end lines
+        if message_lvl in ["debug", "info"]:
+            self.jobs[job_id].write_timing(message_msg)
+
         if message_lvl == "results":
             try:
                 job = TestJob.objects.get(pk=job_id)
@@ -440,7 +478,13 @@ class Command(LAVADaemonCommand):
                     "[%s] unable to map scanned results: %s", job_id, message
                 )
             else:
-                self.test_cases.append(new_test_case)
+                self.test_cases.append(
+                    (
+                        new_test_case,
+                        self.jobs[job_id].output_dir,
+                        self.jobs[job_id].line_count() - 1,
+                    )
+                )
 
             # Look for lava.job result
             if (
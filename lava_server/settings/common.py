@@ -135,6 +135,13 @@ LOG_SIZE_LIMIT = 5
 # resolved.
 TESTCASE_COUNT_LIMIT = 10000
 
+# Stream the job logs to the browsers using server-sent events instead of
+# polling. Each viewer keeps a connection to the server for at most
+# LOG_STREAMING_TIMEOUT seconds before reconnecting, so only enable it when
+# gunicorn is running threaded or asynchronous workers.
+LOG_STREAMING = False
+LOG_STREAMING_TIMEOUT = 60
+
 # Default URL after login
 LOGIN_REDIRECT_URL = "/"
 
@@ -251,6 +251,13 @@ man_pages = [
         [u"Linaro Validation Team"],
         8,
     ),
+    (
+        "lava-console",
+        "lava-console",
+        u"keep the device consoles connected",
+        [u"Linaro Validation Team"],
+        8,
+    ),
     (
         "lava-lxc-mocker",
         "lava-lxc-mocker",
@@ -114,13 +114,21 @@ setup(
             "lava_test_shell/distro/oe/*",
         ]
     },
-    scripts=["lava/dispatcher/lava-run", "lava/dispatcher/lava-slave"],
+    scripts=[
+        "lava/dispatcher/lava-console",
+        "lava/dispatcher/lava-run",
+        "lava/dispatcher/lava-slave",
+    ],
     data_files=[
         ("/usr/share/lava-dispatcher/", ["etc/tftpd-hpa", "etc/dispatcher.yaml"]),
         ("/etc/exports.d", ["etc/lava-dispatcher-nfs.exports"]),
         ("/etc/modprobe.d/", ["etc/lava-modules.conf"]),
         ("/etc/logrotate.d/", ["etc/logrotate.d/lava-slave-log"]),
         ("/usr/share/lava-dispatcher/", ["etc/lava-slave.service"]),
+        (
+            "/usr/share/lava-dispatcher/",
+            ["etc/lava-console.service", "etc/lava-console.yaml"],
+        ),
         ("/etc/lava-server", ["etc/settings.conf", "etc/env.yaml"]),
         ("/etc/apache2/sites-available", ["etc/lava-server.conf"]),
         (